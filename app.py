@@ -14,10 +14,20 @@ from hypercorn.config import Config as HypercornConfig
 
 import global_vars as gbl
 import lighting_routines as Routine
-from periodic_tasks import periodic_light_check
+from periodic_tasks import (
+    LIGHT_CHECK_JOB_ID,
+    PROBE_JOB_ID,
+    adaptive_light_check,
+    periodic_light_check,
+    probe_devices,
+    subscribe_to_light_config,
+)
 from utils.get_logger import get_logger
 from utils.misc import config_to_bool_function, format_time, mutable_globals
 from wrappers.all import AllObjects
+from wrappers.base import WrapperBase
+from wrappers.group import DeviceGroup, UnknownGroupError
+from wrappers.pool import pool
 from zigbee_example import (
     ZigbeeNetworkListener,
     attach_zigbee_listeners,
@@ -98,15 +108,27 @@ async def set_lights() -> tuple[str, int]:
         logger.warning("No valid light control options provided in request\n%s", request_data)
         return "No valid light control options provided", HTTPStatus.BAD_REQUEST.value
 
+    if "group" in request_data:
+        if not isinstance(request_data["group"], str):
+            logger.warning("Invalid group in set_lights request: %r", request_data["group"])
+            return "Invalid group: expected the name of a room or group", HTTPStatus.BAD_REQUEST.value
+        try:
+            lights: WrapperBase = DeviceGroup(request_data["group"])
+        except UnknownGroupError as e:
+            logger.warning("Invalid group in set_lights request: %s", e)
+            return f"Invalid group: {e}", HTTPStatus.BAD_REQUEST.value
+    else:
+        lights = AllObjects()
+
     if "on" in request_data:
         if request_data["on"]:
-            await AllObjects().turn_on()
+            await lights.turn_on()
         else:
-            await AllObjects().turn_off()
+            await lights.turn_off()
         return http_ok
     
     try:
-        await AllObjects().turn_on(
+        await lights.turn_on(
             brightness=request_data.get("brightness"),
             rgb=request_data.get("rgb"),
             colortemp=request_data.get("colortemp"),
@@ -129,52 +151,64 @@ async def config() -> tuple[str, int]:
         logger.warning("No valid config options provided in request\n%s", request_data)
         return "No valid config options provided", HTTPStatus.BAD_REQUEST.value
     
-    for key, value in request_data.items():
-        assert isinstance(key, str)
-        if key in mutable_globals:
-
-            if key == "last_sleep":
+    # written to the file together, once all the options are updated
+    with mutable_globals.transaction():
+        for key, value in request_data.items():
+            assert isinstance(key, str)
+            if key in mutable_globals:
+
+                if key == "last_sleep":
+                    try:
+                        from_iso = datetime.fromisoformat(value)
+                        mutable_globals.last_sleep = from_iso
+                        logger.info("Updating last_sleep to %s", format_time(from_iso))
+                    except ValueError:
+                        logger.warning("Invalid datetime format for last_sleep: %s", value)
+                        return ("Invalid datetime format for last_sleep, expected ISO format", 
+                                HTTPStatus.BAD_REQUEST.value)
+                    except Exception as e: # noqa: BLE001
+                        logger.warning("Error updating last_sleep: %s", e)
+                        return (f"Error updating last_sleep: {e}", 
+                            HTTPStatus.INTERNAL_SERVER_ERROR.value)
+                    continue
+
+                mut_key = key.replace("_", " ")
                 try:
-                    from_iso = datetime.fromisoformat(value)
-                    mutable_globals.last_sleep = from_iso
-                    logger.info("Updating last_sleep to %s", format_time(from_iso))
-                except ValueError:
-                    logger.warning("Invalid datetime format for last_sleep: %s", value)
-                    return ("Invalid datetime format for last_sleep, expected ISO format", 
-                            HTTPStatus.BAD_REQUEST.value)
-                except Exception as e: # noqa: BLE001
-                    logger.warning("Error updating last_sleep: %s", e)
-                    return (f"Error updating last_sleep: {e}", 
-                        HTTPStatus.INTERNAL_SERVER_ERROR.value)
-                continue
-
-            mut_key = key.replace("_", " ")
-            try:
-                func = config_to_bool_function(value)
-                old_value = mutable_globals[key]
-                new_value = func(old_value, key)
-                mutable_globals[key] = new_value
-
-                if len(valid_requests) == 1:
-                    return f"{mut_key} was {old_value}, now {new_value}", HTTPStatus.OK.value
-            except ValueError as e:
-                logger.warning("Invalid value for %s: %s", key, value)
-                return str(e), HTTPStatus.BAD_REQUEST.value
-        else:
-            logger.warning("Unknown config option: %s", key)        
-    
+                    func = config_to_bool_function(value)
+                    old_value = mutable_globals[key]
+                    new_value = func(old_value, key)
+                    mutable_globals[key] = new_value
+
+                    if len(valid_requests) == 1:
+                        return f"{mut_key} was {old_value}, now {new_value}", HTTPStatus.OK.value
+                except ValueError as e:
+                    logger.warning("Invalid value for %s: %s", key, value)
+                    return str(e), HTTPStatus.BAD_REQUEST.value
+            else:
+                logger.warning("Unknown config option: %s", key)
 
     return f"Updated {len(valid_requests)} config options", HTTPStatus.OK.value
 
 
 async def start():
+    # every device's commands are sent from the main loop, whichever request they came from
+    pool.pin(asyncio.get_running_loop())
+
     logger.info("starting scheduler")
     scheduler = AsyncIOScheduler(timezone="Europe/London")
-    trigger = IntervalTrigger(seconds=30)
-    scheduler.add_job(periodic_light_check, trigger)
+    if gbl.ADAPTIVE_LIGHT_CHECK:
+        # runs immediately, then reschedules itself
+        scheduler.add_job(adaptive_light_check, args=[scheduler], id=LIGHT_CHECK_JOB_ID)
+    else:
+        trigger = IntervalTrigger(seconds=gbl.LIGHT_CHECK_INTERVAL.total_seconds())
+        scheduler.add_job(periodic_light_check, trigger, id=LIGHT_CHECK_JOB_ID)
+    scheduler.add_job(probe_devices, IntervalTrigger(seconds=gbl.BREAKER_BASE_DELAY), id=PROBE_JOB_ID)
     scheduler.start()
     logger.debug("scheduler started")
 
+    subscribe_to_light_config(scheduler)
+    watch_task = asyncio.create_task(mutable_globals.watch())
+
     if gbl.USE_ZIGBEE:
         coordinator = await get_coordinator()
         coordinator.add_listener(ZigbeeNetworkListener())
@@ -195,6 +229,9 @@ async def start():
     finally:
         logger.info("Shutting down scheduler")
         scheduler.shutdown()
+        watch_task.cancel()
+        mutable_globals.flush()
+        await pool.close()
 
 
 def get_args() -> argparse.Namespace:
@@ -0,0 +1,62 @@
+"""Microbenchmark for the colourtemp lookup tables in `utils.conversions`.
+
+Run from the repo root (e.g. on the Pi) with:
+
+    python -m benchmarks.bench_conversions
+"""
+import itertools
+import random
+import sys
+import time
+import timeit
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(str(Path(__file__).parents[1]))
+import global_vars as gbl
+from utils import conversions
+
+REPEATS = 5
+NUMBER = 10_000
+
+
+def best_of(stmt, number=NUMBER) -> float:
+    """Best time per call, in microseconds."""
+    return min(timeit.repeat(stmt, number=number, repeat=REPEATS)) / number * 1e6
+
+
+def main():
+    temps = [random.randint(1_000, 10_000) for _ in range(NUMBER)]
+    temp_iter = itertools.cycle(temps)
+
+    start = time.perf_counter()
+    conversions._rgb_table()
+    conversions._rgbww_table(gbl.MIN_COLORTEMP, gbl.MAX_COLORTEMP)
+    print(f"building tables: {(time.perf_counter() - start) * 1e3:.1f} ms (once per process)")
+
+    results = {
+        "temp_to_rgb (calculated)": best_of(lambda: conversions._calculate_rgb(next(temp_iter))),
+        "temp_to_rgb (table)": best_of(lambda: conversions.temp_to_rgb(next(temp_iter))),
+    }
+    # without the tables, warm colourtemps also recalculate the rgb values
+    with mock.patch.object(conversions, "temp_to_rgb", conversions._calculate_rgb):
+        results["temp_to_rgbww (calculated)"] = best_of(lambda: conversions._calculate_rgbww(
+            next(temp_iter), gbl.MIN_COLORTEMP, gbl.MAX_COLORTEMP))
+    results["temp_to_rgbww (table)"] = best_of(lambda: conversions.temp_to_rgbww(next(temp_iter)))
+
+    results["temp_to_rgb (loop of 1000)"] = best_of(
+        lambda: [conversions.temp_to_rgb(temp) for temp in temps[:1000]], number=100)
+    results["temp_to_rgb_many (1000)"] = best_of(lambda: conversions.temp_to_rgb_many(temps[:1000]), number=100)
+
+    for name, micros in results.items():
+        print(f"{name:<28} {micros:8.2f} us/call")
+
+    for func in ("temp_to_rgb", "temp_to_rgbww"):
+        speedup = results[f"{func} (calculated)"] / results[f"{func} (table)"]
+        print(f"{func} speedup: {speedup:.1f}x")
+    speedup = results["temp_to_rgb (loop of 1000)"] / results["temp_to_rgb_many (1000)"]
+    print(f"temp_to_rgb_many speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark for reading `MutableGlobalsWrapper` properties with and without the in-memory cache.
+
+Run from the repo root (e.g. on the Pi) with:
+
+    python -m benchmarks.bench_json_wrapper
+"""
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parents[1]))
+from utils.json_wrapper import MutableGlobalsWrapper
+
+REPEATS = 5
+NUMBER = 1_000
+
+
+def best_of(stmt) -> float:
+    """Best time per call, in microseconds."""
+    return min(timeit.repeat(stmt, number=NUMBER, repeat=REPEATS)) / NUMBER * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file = Path(tmp_dir) / "mutable_globals.json"
+        uncached = MutableGlobalsWrapper(file)
+        cached = MutableGlobalsWrapper(file, cached=True)
+        uncached.write_default()
+
+        results = {
+            "uncached": best_of(lambda: uncached.use_bulb),
+            "cached": best_of(lambda: cached.use_bulb),
+        }
+
+    for name, micros in results.items():
+        print(f"{name:<10} {micros:8.2f} us/property access")
+    print(f"speedup: {results['uncached'] / results['cached']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark for how long heavy logging stalls the event loop,
+writing to the log file directly versus through the shared queue pipeline in `utils.get_logger`.
+
+Run from the repo root (e.g. on the Pi) with:
+
+    python -m benchmarks.bench_logging
+"""
+import asyncio
+import logging
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parents[1]))
+from utils.get_logger import file_handler
+
+BURSTS = 200
+RECORDS_PER_BURST = 50
+TICK = 0.001 # seconds
+
+
+async def measure_stalls(logger: logging.Logger) -> list[float]:
+    """Log in bursts while a ticker measures how late each of its wake-ups is"""
+    stalls = []
+    done = False
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done:
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            stalls.append(loop.time() - expected)
+
+    async def spam():
+        nonlocal done
+        for burst in range(BURSTS):
+            for i in range(RECORDS_PER_BURST):
+                logger.debug("burst %d record %d: %s", burst, i, "x" * 80)
+            await asyncio.sleep(0)
+        done = True
+
+    await asyncio.gather(ticker(), spam())
+    return stalls
+
+
+def run(name: str, handler: logging.Handler) -> list[float]:
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    start = time.perf_counter()
+    stalls = asyncio.run(measure_stalls(logger))
+    elapsed = time.perf_counter() - start
+    logger.removeHandler(handler)
+    print(f"{name:<8} total {elapsed * 1e3:7.1f} ms, "
+          f"mean stall {sum(stalls) / len(stalls) * 1e3:6.2f} ms, max stall {max(stalls) * 1e3:6.2f} ms")
+    return stalls
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        direct = file_handler(Path(tmp_dir) / "direct.txt")
+        run("direct", direct)
+        direct.close()
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        queued_file = file_handler(Path(tmp_dir) / "queued.txt")
+        listener = QueueListener(log_queue, queued_file)
+        listener.start()
+        run("queued", QueueHandler(log_queue))
+        listener.stop()
+        queued_file.close()
+
+
+if __name__ == "__main__":
+    main()
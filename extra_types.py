@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Any, Literal, Optional, Protocol, TypedDict, TypeVar
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class WayPointProtocol(Protocol):
@@ -16,6 +16,20 @@ class WayPointProtocol(Protocol):
 WayPointType = TypeVar("WayPointType", bound=WayPointProtocol)
 
 
+class DeviceInfo(BaseModel):
+    """One entry in `objects.yaml`"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    name: str = Field(description="The key of the entry")
+    ip: str
+    mac: str
+    port: int = Field(default=38899, description="Only used by WiZ bulbs")
+    device_type: str | None = Field(default=None, alias="type", description="e.g. bulb or led_strip")
+    device_class: str | None = Field(default=None, alias="class", description="e.g. wizlight or WLED")
+    room: str | None = Field(default=None, description="The room the device is in, which also acts as a group")
+    groups: list[str] = Field(default_factory=list, description="Any other groups the device belongs to")
+
+
 class MutableGlobals(BaseModel):
     visitor_present: bool = Field(default=False, description="Whether a visitor is currently present")
     use_bulb: bool = Field(default=True, description="Whether to connect to the lightbulb")
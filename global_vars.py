@@ -24,6 +24,41 @@ MAX_COLORTEMP = 6500
 
 USE_ZIGBEE = False
 
+MUTABLE_GLOBALS_WRITE_DELAY = 0.5 # seconds to hold config changes in memory before writing them together
+
+# Rather than checking the colourtemp at a fixed interval,
+# schedule each check for when the curve will next have moved by COLOURTEMP_TOLERANCE
+ADAPTIVE_LIGHT_CHECK = True
+COLOURTEMP_TOLERANCE = 50 # Kelvin
+LIGHT_CHECK_INTERVAL = timedelta(seconds=30) # the fixed interval, and the shortest adaptive one
+MAX_LIGHT_CHECK_INTERVAL = timedelta(minutes=15)
+
+BULB_STATE_MAX_AGE = 30.0 # seconds without a push update before a bulb's state is polled again
+TRANSITION_INTERVAL = 0.25 # seconds between the frames of a transition
+BULB_FADE_INTERVAL = 1.0 # WiZ bulbs have no fade command, but smooth out each change, so fades can use fewer frames
+TRANSITION_MAX_INTERVAL = 2.0 # the furthest apart a transition's frames get when a device is slow to respond
+TRANSITION_BRIGHTNESS_TOLERANCE = 5 # how far a device's reported brightness can be from what a transition set
+# turn_on isn't sent if it's within these of the last one sent, so repeated checks don't flood the devices
+COMMAND_BRIGHTNESS_TOLERANCE = 2
+COMMAND_COLOURTEMP_TOLERANCE = 25 # Kelvin
+# seconds; the command is sent anyway after this long, in case a change went unnoticed.
+# A little longer than the longest gap between light checks, so repeated checks can be skipped
+COMMAND_CACHE_MAX_AGE = MAX_LIGHT_CHECK_INTERVAL.total_seconds() + 60.0
+# a device that fails this many commands in a row is left alone, apart from checks
+# that start BREAKER_BASE_DELAY apart and back off to BREAKER_MAX_DELAY
+BREAKER_FAILURE_THRESHOLD = 2
+BREAKER_BASE_DELAY = 10.0 # seconds
+BREAKER_MAX_DELAY = 300.0 # seconds
+ACTOR_MAILBOX_SIZE = 8 # commands that can wait for a device before callers have to wait too
+DEVICE_TIMEOUT = 3.0 # seconds each device in a group gets to respond to a command
+WLED_TIMEOUT = 3.0 # seconds to wait for a strip to respond
+WLED_STATE_TTL = 5.0 # seconds a strip's cached state is trusted before it's fetched again
+# a failed background check of a strip's cached capabilities is retried after this, doubling up to the max
+WLED_REVALIDATE_BASE_DELAY = 10.0 # seconds
+WLED_REVALIDATE_MAX_DELAY = 300.0 # seconds
+WLED_REVALIDATE_INTERVAL = 6 * 60 * 60.0 # seconds between checks that a strip's cached capabilities still hold
+WLED_REALTIME_TIMEOUT = 2 # seconds after the last realtime frame before a strip goes back to normal
+
 ZENITH_WAYPOINTS = {
     0.0: 6500,    # Solar noon (Cool Daylight)
     60.0: 5500,   # Afternoon 
@@ -1,3 +1,4 @@
+import concurrent.futures
 from datetime import datetime
 
 import global_vars as gbl
@@ -6,12 +7,15 @@ from utils.misc import format_time as fmt
 from utils.misc import mutable_globals
 from wrappers.all import AllObjects
 from wrappers.bulb_wrapper import Bulb
+from wrappers.pool import pool
 from wrappers.WLED_wrapper import WLED
 
 RED = (255, 0, 0)
 
 logger = get_logger(__name__)
 
+_wake_up_fade: concurrent.futures.Future | None = None # the fade started by the last wake_up
+
 async def tracking_start():
     """turn off the light"""
     logger.info("Turning off light")
@@ -27,19 +31,30 @@ async def snooze():
     """snooze alarm"""
     if not mutable_globals.visitor_present:
         logger.info("snoozing")
-        await Bulb().turn_on(brightness=50, colortemp=gbl.SUNRISE_COLOURTEMP)
+        await pool.get(Bulb).actor.turn_on(brightness=50, colortemp=gbl.SUNRISE_COLOURTEMP)
     
 async def bedtime():
     """set the light to a dim, warm colour"""
     logger.info("bedtime")
-    await Bulb().turn_on(brightness=30, colortemp=gbl.BEDTIME_COLORTEMP)
+    await pool.get(Bulb).actor.turn_on(brightness=30, colortemp=gbl.BEDTIME_COLORTEMP)
 
 async def wake_up(total_time=300):
-    """gradually brighten the light over total_time seconds"""
+    """gradually brighten the light over total_time seconds.
+
+    The fade runs in the background, so this returns straight away, and a fade
+    started by an earlier wake_up is stopped first."""
+    global _wake_up_fade
     if not mutable_globals.visitor_present:
         logger.info("waking up")
-        await Bulb().turn_on(brightness=100, colortemp=gbl.MAX_COLORTEMP)
-    # await Bulb().lerp(10, BEDTIME_COLORTEMP, 100, MAX_COLORTEMP, total_time)
+        if _wake_up_fade is not None:
+            _wake_up_fade.cancel()
+        _wake_up_fade = pool.spawn(_fade_up(total_time))
+
+async def _fade_up(total_time: int):
+    light = pool.get(Bulb)
+    # carry on from wherever the light is, e.g. if it's already partway through waking up
+    start = await light.current_levels() or (10, gbl.BEDTIME_COLORTEMP)
+    await light.fade(brightness=100, colortemp=gbl.MAX_COLORTEMP, duration=total_time, start=start)
 
 async def nightlight():
     """set the light to a very dim, warm colour"""
@@ -50,9 +65,9 @@ async def reading_light():
     """set the light to a fairly dim, warm colour"""
     logger.info("turning on reading light")
     if mutable_globals.use_bulb:
-        await Bulb().turn_on(brightness=10, rgb=RED)
+        await pool.get(Bulb).actor.turn_on(brightness=10, rgb=RED)
     if mutable_globals.use_wled:
-        await WLED().turn_on(brightness=23, rgb=RED)
+        await pool.get(WLED).actor.turn_on(brightness=23, rgb=RED)
 
 async def tracking_stopped():
     current_time = datetime.now().time()
@@ -90,24 +105,17 @@ async def tracking_stopped():
             await wake_up()
 
 async def sync_colour_temp(desired_temp: int):
-    light = Bulb()
-    state = await light.updateState()
-    if state is None:
-        logger.error("couldn't get state")
-        return
-    if not state.get_state():
+    light = pool.get(Bulb)
+    levels = await light.current_levels()
+    if levels is None:
+        logger.debug("bulb is off or not showing a colour temp, not syncing it")
         return
-    brightness = state.get_brightness()
-    temp = state.get_colortemp()
-    if temp is None or brightness is None:
-        logger.error("couldn't get colour temp or brightness")
-        return
-    
-    await light.lerp(brightness, temp, brightness, desired_temp, 10)
+
+    await light.fade(colortemp=desired_temp, duration=10, start=levels)
 
 async def set_temp_on_switch():
     try:
-        bulb = Bulb() # noqa: F841
+        bulb = pool.get(Bulb) # noqa: F841
     except Exception: # noqa: BLE001
         return
 
@@ -1,9 +1,33 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import astral
+from apscheduler.schedulers.asyncio import (
+    AsyncIOScheduler,  # type: ignore[import-untyped]
+)
+from apscheduler.triggers.date import DateTrigger
+
+import global_vars as gbl
+from utils.curves import time_curve, time_to_seconds
 from utils.get_logger import get_logger
-from utils.misc import colourtemp_from_time, colourtemp_from_zenith, mutable_globals
+from utils.misc import (
+    clamp,
+    colourtemp_from_time,
+    colourtemp_from_zenith,
+    format_time,
+    mutable_globals,
+)
+from utils.solar import DEFAULT_LOCATION, daily_schedule
 from wrappers.all import AllObjects
+from wrappers.pool import pool
 
 logger = get_logger(__name__)
 
+LIGHT_CHECK_JOB_ID = "light_check"
+PROBE_JOB_ID = "probe_devices"
+# settings that should trigger a light check as soon as they change
+LIGHT_CONFIG_KEYS = ("auto_colourtemp", "zenith_not_time", "use_bulb", "use_wled")
+
 async def periodic_light_check():
     if not mutable_globals.auto_colourtemp:
         logger.debug("auto_colourtemp is disabled, skipping periodic light check")
@@ -15,4 +39,61 @@ async def periodic_light_check():
     else:
         temp = colourtemp_from_time()
         logger.debug("Setting colourtemp to %d based on time", temp)
-    await AllObjects().turn_on(colortemp=temp)
\ No newline at end of file
+    await AllObjects().turn_on(colortemp=temp)
+
+
+async def probe_devices():
+    """Check on any devices that have stopped responding. Each device's circuit breaker
+    decides whether a check is due, so this can run as often as the shortest backoff"""
+    await asyncio.gather(*(device.probe() for device in pool))
+
+
+def next_light_check_delay() -> timedelta:
+    """How long until the colourtemp curve has moved `gbl.COLOURTEMP_TOLERANCE` away from its current value,
+    clamped between `gbl.LIGHT_CHECK_INTERVAL` and `gbl.MAX_LIGHT_CHECK_INTERVAL`."""
+    if not mutable_globals.auto_colourtemp:
+        return gbl.MAX_LIGHT_CHECK_INTERVAL
+
+    if mutable_globals.zenith_not_time:
+        now = astral.now(DEFAULT_LOCATION.tzinfo)
+        next_change = daily_schedule(now).next_change(now, gbl.COLOURTEMP_TOLERANCE)
+        delay = gbl.MAX_LIGHT_CHECK_INTERVAL if next_change is None else next_change - now
+    else:
+        now = datetime.now()
+        seconds_now = time_to_seconds(now.time())
+        next_seconds = time_curve().next_change(seconds_now, gbl.COLOURTEMP_TOLERANCE)
+        if next_seconds is None:
+            # the curve is flat until the end of the day, but may jump at midnight
+            next_seconds = 24 * 60 * 60
+        delay = timedelta(seconds=next_seconds - seconds_now)
+
+    return clamp(delay, gbl.LIGHT_CHECK_INTERVAL, gbl.MAX_LIGHT_CHECK_INTERVAL)
+
+
+async def adaptive_light_check(scheduler: AsyncIOScheduler):
+    """Run `periodic_light_check()`, then schedule the next run for when the colourtemp will next have changed."""
+    try:
+        await periodic_light_check()
+    finally:
+        delay = next_light_check_delay()
+        logger.debug("next light check in %s", format_time(delay))
+        scheduler.add_job(
+            adaptive_light_check,
+            DateTrigger(run_date=datetime.now() + delay),
+            args=[scheduler],
+            id=LIGHT_CHECK_JOB_ID,
+            replace_existing=True,
+        )
+
+
+def subscribe_to_light_config(scheduler: AsyncIOScheduler):
+    """Check the lights as soon as one of `LIGHT_CONFIG_KEYS` changes, rather than at the next scheduled check."""
+    async def on_light_config_change(key: str, value):
+        logger.info("%s changed to %s, checking lights", key, value)
+        if gbl.ADAPTIVE_LIGHT_CHECK:
+            await adaptive_light_check(scheduler)
+        else:
+            await periodic_light_check()
+
+    for key in LIGHT_CONFIG_KEYS:
+        mutable_globals.subscribe(key, on_light_config_change)
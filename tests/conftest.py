@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import ClassVar
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils import get_logger
+
+# before anything below is imported, as the first logger opens the log file
+_log_dir = tempfile.TemporaryDirectory(prefix="smart_home_test_logs_")
+get_logger.LOG_FILE = Path(_log_dir.name) / "log.txt"
+
+from utils.conversions import temp_to_rgb
+from utils.misc import mutable_globals
+from wrappers.base import FailedConnectionError, ObservedState, WrapperBase
+
+
+class FakeDevice(WrapperBase):
+    """A device that only exists in memory.
+
+    Each call to turn_on, turn_off and toggle is recorded in `calls` once it's finished,
+    and what got past the command cache and the breaker to the device is recorded in `sent`.
+    Sending takes `delay` seconds, fails while `reachable` is unset, and updates the state it reports.
+    """
+    OBJECT_TYPE = "fake" # type: ignore[assignment]
+    instances = 0
+    # the default delay by IP, so a fake the pool makes to replace a slow one is just as slow
+    delays: ClassVar[dict[str, float]] = {}
+
+    def __init__(
+        self, ip: str | None = None, mac: str | None = None, port: int | None = None, delay: float | None = None
+        ):
+        FakeDevice.instances += 1
+        self.ip = ip
+        self.delay = self.delays.get(ip or "", 0.0) if delay is None else delay
+        self.reachable = True
+        self.closed = False
+        self.attempts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls: list = []
+        self.sent: list = []
+        self.started: list[float] = [] # when each call was made
+        self.times: list[float] = [] # when each call finished
+        self.state: ObservedState | None = None
+
+    @property
+    def frames(self) -> list[tuple[int | None, int | None]]:
+        """The (brightness, colortemp) of each turn_on call"""
+        return [(call[1].get("brightness"), call[1].get("colortemp")) for call in self.calls if isinstance(call, tuple)]
+
+    @contextlib.asynccontextmanager
+    async def _call(self, call):
+        self.started.append(time.perf_counter())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+            self.calls.append(call)
+            self.times.append(time.perf_counter())
+        finally:
+            self.in_flight -= 1
+
+    async def _send(self, command, state: ObservedState):
+        self.attempts += 1
+        await asyncio.sleep(self.delay)
+        if not self.reachable:
+            raise FailedConnectionError
+        self.sent.append(command)
+        self.state = state
+
+    async def turn_on(self, force: bool = False, **kwargs):
+        async with self._call(("on", {key: value for key, value in kwargs.items() if value is not None})):
+            await super().turn_on(force=force, **kwargs)
+
+    async def _turn_on(self, brightness, rgb):
+        level = self.state.brightness if brightness is None and self.state is not None else brightness
+        await self._send((brightness, rgb), ObservedState(True, level, time.monotonic()))
+
+    async def turn_off(self):
+        async with self._call("off"):
+            await super().turn_off()
+
+    async def _turn_off(self):
+        await self._send("off", ObservedState(False, 0, time.monotonic()))
+
+    async def toggle(self):
+        async with self._call("toggle"):
+            if self.state is None:
+                state = ObservedState(True, None, time.monotonic())
+            else:
+                state = ObservedState(not self.state.on, self.state.brightness, time.monotonic())
+            await self._send("toggle", state)
+
+    def observed_state(self) -> ObservedState | None:
+        return self.state
+
+    @property
+    async def is_on(self) -> bool:
+        await asyncio.sleep(self.delay)
+        return self.state is not None and self.state.on
+
+    @property
+    async def is_connected(self) -> bool:
+        await asyncio.sleep(self.delay)
+        return self.reachable
+
+    async def close(self):
+        self.closed = True
+
+
+def pytest_unconfigure(config: pytest.Config):
+    get_logger.stop_logging()
+    _log_dir.cleanup()
+
+
+@pytest.fixture(autouse=True, scope="session")
+def colourtemp_table():
+    """Build the colourtemp table up front, rather than in whichever timed test converts one first"""
+    temp_to_rgb(2700)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_mutable_globals(tmp_path_factory: pytest.TempPathFactory):
+    """Keep the tests' settings out of the app's `mutable_globals.json`"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(mutable_globals, "file", tmp_path_factory.mktemp("globals") / "mutable_globals.json")
+        mutable_globals.invalidate()
+        yield
+        mutable_globals.flush()
+    mutable_globals.invalidate()
@@ -0,0 +1,558 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+import responses
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from pytest_mock import MockerFixture
+
+import global_vars as gbl
+from wrappers.base import FailedConnectionError
+from wrappers.WLED_capabilities import Capabilities, CapabilityCache
+from wrappers.WLED_client import WLEDClient
+from wrappers.WLED_realtime import DNRGB, DRGB, WLEDRealtime
+from wrappers.WLED_wrapper import WLED
+
+
+class FakeStrip:
+    """Just enough of WLED's JSON API to test the wrapper against"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.state = {"on": False, "bri": 128, "seg": [{"col": [[255, 255, 255]], "fx": 0}]}
+        self.info = {"mac": "aabbccddeeff", "vid": 2405180, "ver": "0.15.0", "leds": {"count": 5}}
+        self.palettes = ["Default", "Random Cycle"]
+        self.config = {"hw": {"led": {"total": 5, "fps": 50}}}
+        self.effects = ["Solid", "Blink"]
+        self.gets: list[str] = []
+        self.posts: list[dict] = []
+        self.post_parts: list[str] = []
+        self.peers: set = set()
+        app = web.Application()
+        app.router.add_get("/json/{part:.*}", self.get)
+        app.router.add_post("/json/{part:(state|si)?}", self.post)
+        self.server = TestServer(app)
+
+    async def get(self, request: web.Request) -> web.Response:
+        self.peers.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(self.delay)
+        part = request.match_info["part"]
+        self.gets.append(part)
+        if part == "cfg":
+            return web.json_response(self.config)
+        full = {"state": self.state, "info": self.info, "effects": self.effects, "palettes": self.palettes}
+        if part == "si":
+            return web.json_response({"state": self.state, "info": self.info})
+        return web.json_response(full if part == "" else full[{"eff": "effects", "pal": "palettes"}.get(part, part)])
+
+    async def post(self, request: web.Request) -> web.Response:
+        self.peers.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(self.delay)
+        body = await request.json()
+        verbose = body.pop("v", False)
+        self.posts.append(dict(body))
+        self.post_parts.append(request.match_info["part"])
+        if body.get("on") == "t":
+            body["on"] = not self.state["on"]
+        for segment in body.pop("seg", []):
+            self.state["seg"][0].update(segment)
+        body.pop("tt", None)
+        self.state.update(body)
+        if not verbose:
+            return web.json_response({"success": True})
+        if request.match_info["part"] == "si":
+            return web.json_response({"state": self.state, "info": self.info})
+        return web.json_response(self.state)
+
+    @property
+    def ip(self) -> str:
+        return f"{self.server.host}:{self.server.port}"
+
+
+@pytest_asyncio.fixture
+async def strip():
+    fake = FakeStrip()
+    await fake.server.start_server()
+    yield fake
+    await fake.server.close()
+
+
+@pytest.fixture(autouse=True)
+def use_wled(mocker: MockerFixture):
+    mock_globals = mocker.patch("wrappers.WLED_wrapper.mutable_globals")
+    mock_globals.use_wled = True
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path: Path, mocker: MockerFixture) -> CapabilityCache:
+    cache = CapabilityCache(tmp_path / "WLED_capabilities.json")
+    mocker.patch("wrappers.WLED_wrapper.capability_cache", cache)
+    return cache
+
+
+class TestWLED:
+    @pytest.mark.asyncio
+    async def test_turn_on(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip, mac="aa:bb:cc:dd:ee:ff")
+        await wled.turn_on(brightness=50, rgb=(255, 0, 0))
+        assert strip.posts == [{"on": True, "bri": 50, "seg": [{"col": [[255, 0, 0]]}]}]
+        assert strip.state["on"] is True
+        assert strip.state["bri"] == 50
+        assert await wled.is_on
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_fade_uses_strip_transition(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip, mac="aa:bb:cc:dd:ee:ff")
+        warm, cool = (list(wled.temp_to_rgb(temp)[:3]) for temp in (2000, 6500))
+        assert await wled.fade(brightness=200, colortemp=6500, duration=30, start=(10, 2000))
+        assert strip.posts == [
+            {"on": True, "bri": 10, "seg": [{"col": [warm]}], "tt": 0},
+            {"on": True, "bri": 200, "seg": [{"col": [cool]}], "tt": 300},
+        ]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_fade_unreachable(self):
+        wled = WLED(ip="127.0.0.1:1", mac="aa:bb:cc:dd:ee:ff")
+        assert not await wled.fade(brightness=200, duration=30)
+        assert not wled.healthy
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_repeated_turn_on_skipped(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip, mac="aa:bb:cc:dd:ee:ff")
+        await wled.turn_on(colortemp=3000)
+        await wled.turn_on(colortemp=3000)
+        assert len(strip.posts) == 1
+        # anything else sent to the strip means the next turn_on goes through
+        await wled.compose().effect(1).commit()
+        await wled.turn_on(colortemp=3000)
+        assert len(strip.posts) == 3
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_turn_off_and_toggle(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        await wled.turn_off()
+        assert not await wled.is_on
+        await wled.toggle()
+        assert await wled.is_on
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_connection_is_reused(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        for _ in range(5):
+            await wled.turn_on(brightness=100)
+        assert len(strip.peers) == 1
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_effects_fetched_once(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        assert await wled.get_effects() == ["Solid", "Blink"]
+        assert await wled.get_effects() == ["Solid", "Blink"]
+        assert sorted(strip.gets) == ["eff", "info", "pal"]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_unreachable(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        await strip.server.close()
+        assert not await wled.is_connected
+        await wled.turn_on(brightness=100)
+        assert not wled.healthy
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_strips_are_concurrent(self):
+        strips = [FakeStrip(delay=0.2) for _ in range(3)]
+        for fake in strips:
+            await fake.server.start_server()
+        wleds = [WLED(ip=fake.ip) for fake in strips]
+
+        start = time.perf_counter()
+        await asyncio.gather(*(wled.set_state(on=True) for wled in wleds))
+        assert time.perf_counter() - start < 0.4
+        assert all(fake.state["on"] for fake in strips)
+
+        for wled, fake in zip(wleds, strips, strict=True):
+            await wled.close()
+            await fake.server.close()
+
+
+class TestStateCache:
+    @pytest.mark.asyncio
+    async def test_reads_served_from_cache(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        assert not await wled.is_on
+        for _ in range(5):
+            await wled.is_on
+        assert strip.gets == ["state"]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_updated_from_post_response(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        await wled.turn_on(brightness=60, rgb=(0, 255, 0))
+        state = await wled.get_state()
+        assert state["on"]
+        assert state["bri"] == 60
+        assert state["seg"][0]["col"] == [[0, 255, 0]]
+        await wled.toggle()
+        assert not await wled.is_on
+        assert strip.gets == []
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_ttl(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        wled.state_ttl = 0
+        await wled.get_state()
+        await wled.get_state()
+        assert strip.gets == ["state", "state"]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_refresh(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        assert not await wled.is_on
+        strip.state["on"] = True # changed by something else
+        assert not await wled.is_on
+        assert (await wled.refresh())["on"]
+        assert await wled.is_on
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_invalidate(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        await wled.get_state()
+        wled.invalidate()
+        await wled.get_state()
+        assert strip.gets == ["state", "state"]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_mac_checked_from_info(self, strip: FakeStrip, mocker: MockerFixture):
+        wled = WLED(ip=strip.ip, mac="11:22:33:44:55:66")
+        mock_warning = mocker.patch.object(wled.logger, "warning")
+        info = await wled.get_info()
+        await wled.get_info()
+        assert info["mac"] == "aabbccddeeff"
+        mock_warning.assert_called_once()
+        assert strip.gets == ["info", "info"]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_mac_checked_from_first_state_reply(self, strip: FakeStrip, mocker: MockerFixture):
+        wled = WLED(ip=strip.ip, mac="11:22:33:44:55:66")
+        mock_warning = mocker.patch.object(wled.logger, "warning")
+        await wled.turn_on(brightness=60)
+        await wled.turn_on(brightness=120)
+        mock_warning.assert_called_once()
+        assert strip.post_parts == ["si", "state"]
+        assert (await wled.get_state())["bri"] == 120
+        assert strip.gets == []
+        await wled.close()
+
+
+class TestCapabilities:
+    @pytest.mark.asyncio
+    async def test_saved_to_disk(self, strip: FakeStrip, cache: CapabilityCache):
+        wled = WLED(ip=strip.ip)
+        await wled.get_capabilities()
+        await wled.close()
+
+        reloaded = CapabilityCache(cache.file).get("AA:BB:CC:DD:EE:FF")
+        assert reloaded is not None
+        assert (reloaded.vid, reloaded.ver, reloaded.effects) == (2405180, "0.15.0", ["Solid", "Blink"])
+        assert reloaded.effect_index["Blink"] == 1
+        assert reloaded.palette_index == {"Default": 0, "Random Cycle": 1}
+
+    @pytest.mark.asyncio
+    async def test_cached_strip_needs_no_round_trip(self, strip: FakeStrip, cache: CapabilityCache):
+        first = WLED(ip=strip.ip)
+        await first.get_capabilities()
+        await first.close()
+        strip.gets.clear()
+
+        wled = WLED(ip=strip.ip, mac="aa:bb:cc:dd:ee:ff")
+        assert wled._capabilities is not None
+        await wled.compose().effect("Blink").commit()
+        assert strip.posts[-1] == {"seg": [{"fx": 1}]}
+        await asyncio.sleep(0.05) # background revalidation
+        assert strip.gets == ["info"]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_revalidation_retried(self, strip: FakeStrip, cache: CapabilityCache, mocker: MockerFixture):
+        first = WLED(ip=strip.ip)
+        await first.get_capabilities()
+        await first.close()
+
+        wled = WLED(ip=strip.ip, mac="aabbccddeeff")
+        capabilities = wled._capabilities
+        revalidate = mocker.patch.object(wled, "revalidate", side_effect=[FailedConnectionError("down"), capabilities])
+        await wled.get_capabilities()
+        await asyncio.sleep(0.01) # background revalidation fails
+        await wled.get_capabilities()
+        assert revalidate.call_count == 1 # too soon to try again
+
+        wled._revalidate_after = time.monotonic()
+        assert await wled.get_capabilities() is capabilities
+        await asyncio.sleep(0.01)
+        assert revalidate.call_count == 2
+        assert wled._revalidate_delay == gbl.WLED_REVALIDATE_BASE_DELAY
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_revalidated_again_later(self, strip: FakeStrip, cache: CapabilityCache, mocker: MockerFixture):
+        first = WLED(ip=strip.ip)
+        await first.get_capabilities()
+        await first.close()
+
+        wled = WLED(ip=strip.ip, mac="aabbccddeeff")
+        revalidate = mocker.spy(wled, "revalidate")
+        await wled.get_capabilities()
+        await asyncio.sleep(0.05)
+        assert wled._revalidation is None
+        assert wled._revalidate_after > time.monotonic() + gbl.WLED_REVALIDATE_INTERVAL - 60
+        await wled.get_capabilities()
+        assert revalidate.call_count == 1 # not due yet
+
+        wled._revalidate_after = time.monotonic()
+        await wled.get_capabilities()
+        await asyncio.sleep(0.05)
+        assert revalidate.call_count == 2
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_new_firmware_revalidates_early(self, strip: FakeStrip, cache: CapabilityCache):
+        first = WLED(ip=strip.ip)
+        await first.get_capabilities()
+        await first.close()
+
+        wled = WLED(ip=strip.ip, mac="aabbccddeeff")
+        await wled.get_capabilities()
+        await asyncio.sleep(0.05)
+        strip.info["ver"] = "0.15.1"
+        strip.effects = ["Solid", "Blink", "Rainbow"]
+        await wled.get_info() # e.g. a realtime session starting
+        assert wled._revalidate_after == -math.inf
+        await wled.get_capabilities()
+        await asyncio.sleep(0.05)
+        assert await wled.get_effects() == ["Solid", "Blink", "Rainbow"]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_refetched_when_firmware_changes(self, strip: FakeStrip, cache: CapabilityCache):
+        first = WLED(ip=strip.ip)
+        await first.get_capabilities()
+        await first.close()
+
+        strip.info["vid"] += 1
+        strip.effects = ["Solid", "Blink", "Rainbow"]
+        wled = WLED(ip=strip.ip, mac="aabbccddeeff")
+        assert await wled.get_effects() == ["Solid", "Blink"] # served from the cache straight away
+        await asyncio.sleep(0.05)
+        assert await wled.get_effects() == ["Solid", "Blink", "Rainbow"]
+        assert cache.get("aabbccddeeff").vid == strip.info["vid"]
+        await wled.close()
+
+    def test_duplicate_names_resolve_to_first(self):
+        capabilities = Capabilities("aa", 1, "0.15.0", ["Solid", "RSVD", "RSVD"], [], {})
+        assert capabilities.effect_index["RSVD"] == 1
+
+    def test_unreadable_cache_is_ignored(self, tmp_path: Path):
+        file = tmp_path / "WLED_capabilities.json"
+        file.write_text("{")
+        assert CapabilityCache(file).get("aa") is None
+
+
+class TestWLEDStateBuilder:
+    def test_merged_document(self):
+        wled = WLED(ip="127.0.0.1")
+        state = wled.compose().on().brightness(300).colour((1, 2, 3)).effect(2).transition(0.7)
+        assert state.to_json() == {"on": True, "bri": 255, "tt": 7, "seg": [{"col": [(1, 2, 3)], "fx": 2}]}
+
+    def test_empty(self):
+        state = WLED(ip="127.0.0.1").compose()
+        assert not state
+        assert state.to_json() == {}
+        assert state.off()
+
+    def test_effect_and_palette_by_name(self):
+        capabilities = Capabilities("aa", 1, "0.15.0", ["Solid", "Blink"], ["Default", "Party"], {})
+        state = WLED(ip="127.0.0.1").compose().effect("Blink")
+        assert state.needs_capabilities
+        assert state.to_json(capabilities) == {"seg": [{"fx": 1}]}
+        assert state.palette("Party").to_json(capabilities) == {"seg": [{"fx": 1, "pal": 1}]}
+        with pytest.raises(ValueError, match="capabilities are needed"):
+            state.to_json()
+        with pytest.raises(ValueError, match="Palette 'Ocean' not found"):
+            state.palette("Ocean").to_json(capabilities)
+
+    @pytest.mark.asyncio
+    async def test_commit_sends_one_request(self, strip: FakeStrip):
+        wled = WLED(ip=strip.ip)
+        await wled.compose().on().effect("Blink").colour([[0, 0, 255], [0, 0, 0]]).commit()
+        assert strip.posts == [{"on": True, "seg": [{"col": [[0, 0, 255], [0, 0, 0]], "fx": 1}]}]
+        await wled.close()
+
+    @responses.activate
+    def test_set_solid_sends_one_request(self):
+        responses.get("http://127.0.0.1/json/", json={
+            "state": {"on": True, "seg": []},
+            "info": {"mac": "aa", "vid": 1, "ver": "0.15.0"},
+            "effects": ["Blink", "Solid"],
+            "palettes": ["Default"],
+        })
+        post = responses.post("http://127.0.0.1/json/state", json={"success": True})
+        WLED(ip="127.0.0.1").set_solid((255, 0, 0))
+        assert post.call_count == 1
+        assert json.loads(post.calls[0].request.body) == {"seg": [{"col": [[255, 0, 0]], "fx": 1}], "v": True}
+
+
+class TestWLEDClient:
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        fake = FakeStrip(delay=1)
+        await fake.server.start_server()
+        client = WLEDClient(f"http://{fake.ip}/json/", timeout=0.1)
+        with pytest.raises(FailedConnectionError):
+            await client.get()
+        await client.close()
+        await fake.server.close()
+
+    @pytest.mark.asyncio
+    async def test_http_error(self, strip: FakeStrip):
+        client = WLEDClient(f"http://{strip.ip}/json/")
+        with pytest.raises(FailedConnectionError, match="500"):
+            await client.get("nonexistent")
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_pinned_session_shared(self, strip: FakeStrip):
+        loop = asyncio.get_running_loop()
+        client = WLEDClient(f"http://{strip.ip}/json/")
+        client.pin(loop)
+        await client.get("state")
+        session = client._session
+
+        def request():
+            # like a request handled on its own thread and event loop
+            return asyncio.run(client.get("state"))
+
+        for _ in range(3):
+            assert "on" in await loop.run_in_executor(None, request)
+        assert client._session is session
+        assert not session.closed
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_replaced_session_closed(self, strip: FakeStrip):
+        other = asyncio.new_event_loop()
+        thread = threading.Thread(target=other.run_forever, daemon=True)
+        thread.start()
+        client = WLEDClient(f"http://{strip.ip}/json/")
+        try:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.get("state"), other))
+            old_session = client._session
+            assert old_session is not None
+
+            await client.get("state")
+            await asyncio.sleep(0.05)
+            assert client._session is not old_session
+            assert old_session.closed
+            await client.close()
+        finally:
+            other.call_soon_threadsafe(other.stop)
+            thread.join()
+            other.close()
+
+    @pytest.mark.asyncio
+    async def test_unsupported_method(self):
+        client = WLEDClient("http://127.0.0.1/json/")
+        with pytest.raises(ValueError, match="Unsupported"):
+            await client.request("delete")
+
+
+class PacketCollector(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.packets: list[bytes] = []
+
+    def datagram_received(self, data: bytes, addr):
+        self.packets.append(data)
+
+
+@pytest_asyncio.fixture
+async def receiver():
+    loop = asyncio.get_running_loop()
+    transport, collector = await loop.create_datagram_endpoint(PacketCollector, local_addr=("127.0.0.1", 0))
+    collector.port = transport.get_extra_info("sockname")[1]
+    yield collector
+    transport.close()
+
+
+class TestRealtime:
+    @pytest.mark.asyncio
+    async def test_drgb_frame(self, strip: FakeStrip, receiver: PacketCollector):
+        wled = WLED(ip=strip.ip)
+        async with WLEDRealtime(wled, port=receiver.port, timeout=3) as stream:
+            assert (stream.led_count, stream.fps) == (5, 50)
+            stream.fill((1, 2, 3))
+            stream.set_pixel(4, (9, 8, 7))
+            stream.send()
+            await asyncio.sleep(0.05)
+        assert receiver.packets == [bytes((DRGB, 3, 1, 2, 3, 1, 2, 3, 1, 2, 3, 1, 2, 3, 9, 8, 7))]
+        assert strip.posts == [{"live": False}]
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_dnrgb_frames(self, strip: FakeStrip, receiver: PacketCollector):
+        wled = WLED(ip=strip.ip)
+        async with WLEDRealtime(wled, led_count=1000, fps=40, port=receiver.port) as stream:
+            for i in range(1000):
+                stream.set_pixel(i, (i % 256, 0, 0))
+            stream.send()
+            await asyncio.sleep(0.05)
+
+        assert [packet[:4] for packet in receiver.packets] == [
+            bytes((DNRGB, 2, 0, 0)), bytes((DNRGB, 2, 489 >> 8, 489 & 0xFF)), bytes((DNRGB, 2, 978 >> 8, 978 & 0xFF))
+        ]
+        pixels = b"".join(packet[4:] for packet in receiver.packets)
+        assert len(pixels) == 3000
+        assert pixels[3 * 700] == 700 % 256
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_run_at_fps(self, strip: FakeStrip, receiver: PacketCollector):
+        wled = WLED(ip=strip.ip)
+        frames = []
+
+        def render(pixels: memoryview, frame: int):
+            frames.append(frame)
+            pixels[0] = frame
+
+        async with WLEDRealtime(wled, fps=50, port=receiver.port) as stream:
+            buffer = stream.pixels
+            await stream.run(render, duration=0.2)
+            assert stream.pixels is buffer
+        await asyncio.sleep(0.05)
+
+        assert 8 <= len(frames) <= 11
+        assert frames == list(range(len(frames)))
+        assert [packet[2] for packet in receiver.packets] == frames
+        await wled.close()
+
+    @pytest.mark.asyncio
+    async def test_send_before_start(self, strip: FakeStrip):
+        with pytest.raises(RuntimeError):
+            WLEDRealtime(WLED(ip=strip.ip), led_count=5).send()
@@ -0,0 +1,192 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import FakeDevice
+
+from wrappers.actor import DeviceActor
+
+
+@pytest.fixture
+def device() -> FakeDevice:
+    return FakeDevice(delay=0.02)
+
+
+class TestOrdering:
+    @pytest.mark.asyncio
+    async def test_one_command_at_a_time(self, device: FakeDevice):
+        await asyncio.gather(*(device.actor.run(device.toggle) for _ in range(5)))
+        assert device.calls == ["toggle"] * 5
+        assert device.max_in_flight == 1
+
+    @pytest.mark.asyncio
+    async def test_order_kept(self, device: FakeDevice):
+        actor = device.actor
+        await actor.turn_on(brightness=1, wait=False)
+        await actor.run(device.toggle, wait=False)
+        await actor.turn_off(wait=False)
+        await actor.run(device.toggle, wait=False)
+        await actor.turn_on(brightness=2)
+        assert device.calls == [("on", {"brightness": 1}), "toggle", "off", "toggle", ("on", {"brightness": 2})]
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_caller(self, device: FakeDevice):
+        async def broken():
+            raise RuntimeError("unplugged")
+
+        with pytest.raises(RuntimeError, match="unplugged"):
+            await device.actor.run(broken)
+        await device.actor.turn_on(brightness=1)
+        assert device.calls == [("on", {"brightness": 1})]
+
+
+class TestCoalescing:
+    @pytest.mark.asyncio
+    async def test_latest_wins(self, device: FakeDevice):
+        actor = device.actor
+        first = asyncio.create_task(actor.turn_on(brightness=0))
+        await asyncio.sleep(0) # let the first command start
+        waiters = [asyncio.create_task(actor.turn_on(brightness=i)) for i in range(1, 11)]
+        await asyncio.gather(first, *waiters)
+
+        assert device.calls == [("on", {"brightness": 0}), ("on", {"brightness": 10})]
+        assert actor.coalesced == 9
+        assert actor.sent == 2
+
+    @pytest.mark.asyncio
+    async def test_changes_merged(self, device: FakeDevice):
+        actor = device.actor
+        await actor.run(device.toggle, wait=False)
+        await actor.turn_on(brightness=50, colortemp=2000, wait=False)
+        await actor.turn_on(colortemp=2700, wait=False)
+        await actor.turn_on(rgb=(255, 0, 0))
+        assert device.calls[1:] == [("on", {"brightness": 50, "rgb": (255, 0, 0)})]
+
+    @pytest.mark.asyncio
+    async def test_turn_off_supersedes(self, device: FakeDevice):
+        actor = device.actor
+        await actor.run(device.toggle, wait=False)
+        await actor.turn_on(brightness=50, wait=False)
+        await actor.turn_off(wait=False)
+        await actor.turn_on(brightness=20, wait=False)
+        await actor.turn_off()
+        assert device.calls == ["toggle", "off"]
+
+    @pytest.mark.asyncio
+    async def test_calls_not_coalesced(self, device: FakeDevice):
+        actor = device.actor
+        await actor.turn_on(brightness=1, wait=False)
+        await actor.turn_on(brightness=2, wait=False)
+        await actor.run(device.toggle, wait=False)
+        await actor.run(device.toggle, wait=False)
+        await actor.turn_on(brightness=3)
+        # the first two are merged, but nothing is merged across a call
+        assert device.calls == [("on", {"brightness": 2}), "toggle", "toggle", ("on", {"brightness": 3})]
+
+
+class TestBackpressure:
+    @pytest.mark.asyncio
+    async def test_fire_and_forget_returns_straight_away(self, device: FakeDevice):
+        start = time.perf_counter()
+        await device.actor.turn_on(brightness=1, wait=False)
+        assert time.perf_counter() - start < device.delay
+        assert device.calls == []
+        await device.actor.turn_on(brightness=2)
+        assert device.calls[-1] == ("on", {"brightness": 2})
+
+    @pytest.mark.asyncio
+    async def test_full_mailbox_makes_callers_wait(self, device: FakeDevice):
+        actor = DeviceActor(device, maxsize=2)
+        start = time.perf_counter()
+        for _ in range(5):
+            await actor.run(device.toggle, wait=False)
+        # one being sent and two waiting, so the caller had to wait for two to finish
+        assert time.perf_counter() - start >= 2 * device.delay
+        assert len(actor) <= 2
+        await actor.run(device.toggle)
+        assert device.calls == ["toggle"] * 6
+        await actor.close()
+
+    @pytest.mark.asyncio
+    async def test_slider_throughput(self, device: FakeDevice):
+        """A slider sending a new brightness every millisecond, to a device that takes 20ms"""
+        actor = device.actor
+        start = time.perf_counter()
+        for brightness in range(200):
+            await actor.turn_on(brightness=brightness, wait=False)
+            await asyncio.sleep(0.001)
+        await actor.turn_on(brightness=200)
+        elapsed = time.perf_counter() - start
+
+        # it keeps up, sending only as often as the device can take it, and ends on the latest value
+        assert device.calls[-1] == ("on", {"brightness": 200})
+        assert len(device.calls) <= elapsed / device.delay + 2
+        assert actor.sent + actor.coalesced == 201
+        assert device.max_in_flight == 1
+
+    def test_bad_size(self, device: FakeDevice):
+        with pytest.raises(ValueError, match="at least one"):
+            DeviceActor(device, maxsize=0)
+
+
+class TestLoops:
+    @pytest.mark.asyncio
+    async def test_commands_from_another_thread(self, device: FakeDevice):
+        await device.actor.turn_on(brightness=0)
+
+        def request(brightness: int):
+            # like a request handled on its own thread and event loop
+            asyncio.run(device.actor.turn_on(brightness=brightness))
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, request, i) for i in range(1, 4)))
+        assert device.max_in_flight == 1
+        assert len(device.calls) >= 2
+        assert {command[1]["brightness"] for command in device.calls} <= {0, 1, 2, 3}
+
+    @pytest.mark.asyncio
+    async def test_pinned_loop(self, device: FakeDevice):
+        home = asyncio.new_event_loop()
+        thread = threading.Thread(target=home.run_forever, daemon=True)
+        thread.start()
+        device.actor.pin(home)
+        ran_on = []
+
+        async def note():
+            ran_on.append(threading.get_ident())
+
+        def request(brightness: int):
+            asyncio.run(device.actor.turn_on(brightness=brightness))
+
+        try:
+            # none of the callers is on the actor's loop, and they all arrive before it's started
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(device.actor.run(note), *(loop.run_in_executor(None, request, i) for i in range(1, 4)))
+            await device.actor.run(note)
+            assert ran_on == [thread.ident, thread.ident]
+            assert device.max_in_flight == 1
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(device.actor.close(), home))
+        finally:
+            home.call_soon_threadsafe(home.stop)
+            thread.join()
+            home.close()
+
+    @pytest.mark.asyncio
+    async def test_close_cancels_waiting_commands(self, device: FakeDevice):
+        actor = device.actor
+        await actor.run(device.toggle, wait=False)
+        waiting = asyncio.create_task(actor.run(device.toggle))
+        await asyncio.sleep(0)
+        await actor.close()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        # and starts again when it's next used
+        await actor.turn_on(brightness=1)
+        assert device.calls[-1] == ("on", {"brightness": 1})
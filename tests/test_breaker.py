@@ -0,0 +1,152 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import FakeDevice
+
+from wrappers.breaker import CircuitBreaker
+from wrappers.pool import DevicePool
+
+
+@pytest.fixture
+def device() -> FakeDevice:
+    device = FakeDevice()
+    device._breaker = CircuitBreaker("flaky", threshold=2, base_delay=10, max_delay=40)
+    return device
+
+
+def make_probe_due(breaker: CircuitBreaker):
+    breaker.next_probe = time.monotonic() - 1
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker("test", threshold=2, base_delay=10, max_delay=40)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.is_open
+        assert not breaker.allow()
+
+    def test_one_probe_at_a_time(self):
+        breaker = CircuitBreaker("test", threshold=1, base_delay=10, max_delay=40)
+        breaker.record_failure()
+        make_probe_due(breaker)
+        assert breaker.allow()
+        assert breaker.probing
+        assert not breaker.allow()
+
+    def test_backoff(self):
+        breaker = CircuitBreaker("test", threshold=1, base_delay=10, max_delay=40)
+        breaker.record_failure()
+        delays = []
+        for _ in range(4):
+            make_probe_due(breaker)
+            assert breaker.allow()
+            breaker.record_failure()
+            delays.append(breaker.delay)
+        assert delays == [20, 40, 40, 40]
+        assert breaker.next_probe - time.monotonic() == pytest.approx(40, abs=1)
+
+    def test_recovery(self, mocker: MockerFixture):
+        breaker = CircuitBreaker("test", threshold=1, base_delay=10, max_delay=40)
+        callback = mocker.Mock()
+        breaker.on_recover(callback)
+        assert not breaker.record_success()
+        breaker.record_failure()
+        make_probe_due(breaker)
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.record_success()
+        callback.assert_called_once()
+        assert breaker.delay == 10
+        assert breaker.allow()
+
+
+class TestDeviceBreaker:
+    @pytest.mark.asyncio
+    async def test_fails_fast_when_down(self, device: FakeDevice):
+        device.reachable = False
+        device.delay = 0.05
+        for _ in range(2):
+            await device.turn_on(brightness=50)
+        assert device.breaker.is_open
+
+        start = time.perf_counter()
+        await device.turn_on(brightness=60)
+        await device.turn_off()
+        assert time.perf_counter() - start < 0.01
+        assert device.attempts == 2
+
+    @pytest.mark.asyncio
+    async def test_desired_state_applied_on_reconnect(self, device: FakeDevice):
+        device.reachable = False
+        await device.turn_on(brightness=50)
+        await device.turn_on(colortemp=3000)
+        # asked for while it was down
+        await device.turn_on(brightness=80)
+
+        device.reachable = True
+        make_probe_due(device.breaker)
+        await device.turn_on(brightness=70)
+        assert device.sent == [(70, device.temp_to_rgb(3000))]
+        assert not device.breaker.is_open
+
+    @pytest.mark.asyncio
+    async def test_probe_reapplies_desired_state(self, device: FakeDevice, mocker: MockerFixture):
+        callback = mocker.Mock()
+        device.breaker.on_recover(callback)
+        device.reachable = False
+        await device.turn_on(brightness=50, rgb=(255, 0, 0))
+        await device.turn_on(brightness=50, rgb=(255, 0, 0))
+        assert not await device.probe() # not due yet
+
+        make_probe_due(device.breaker)
+        assert not await device.probe()
+        assert device.breaker.delay == 20
+
+        device.reachable = True
+        make_probe_due(device.breaker)
+        assert await device.probe()
+        callback.assert_called_once()
+        assert device.sent == [(50, (255, 0, 0))]
+
+    @pytest.mark.asyncio
+    async def test_probe_reapplies_off(self, device: FakeDevice):
+        device.reachable = False
+        await device.turn_on(brightness=50)
+        await device.turn_off()
+        device.reachable = True
+        make_probe_due(device.breaker)
+        assert await device.probe()
+        assert device.sent == ["off"]
+
+    @pytest.mark.asyncio
+    async def test_timeout_counts_as_failure(self, device: FakeDevice):
+        device.delay = 5
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                await asyncio.wait_for(device.turn_on(brightness=50), 0.01)
+        assert device.breaker.is_open
+
+    @pytest.mark.asyncio
+    async def test_replacement_keeps_breaker(self, mocker: MockerFixture):
+        mocker.patch.object(FakeDevice, "DEFAULT_NAME", "flaky")
+        pool = DevicePool()
+        first = pool.get(FakeDevice)
+        first.reachable = False
+        await first.turn_on(brightness=50)
+        await first.turn_on(brightness=50)
+
+        second = pool.get(FakeDevice)
+        assert second is not first
+        assert second.breaker is first.breaker
+        await second.turn_on(brightness=50)
+        assert second.attempts == 0
+        await pool.close()
@@ -1,5 +1,6 @@
 import asyncio
 import sys
+import time
 from pathlib import Path
 
 import pytest
@@ -9,6 +10,7 @@ from pywizlight import PilotBuilder, PilotParser, wizlight
 
 sys.path.append(str(Path(__file__).parent))
 
+from wrappers.base import ObservedState
 from wrappers.bulb_wrapper import Bulb, get_fractional_range
 
 
@@ -43,6 +45,7 @@ def mock_pilot_state(mocker):
 def mock_wizlight(mocker):
     """Mock wizlight object."""
     light = mocker.MagicMock(spec=wizlight)
+    light.mac = "aabbccddeeff"
     light.turn_on = mocker.AsyncMock()
     light.turn_off = mocker.AsyncMock()
     light.updateState = mocker.AsyncMock()
@@ -52,13 +55,23 @@ def mock_wizlight(mocker):
 class TestBulbFromYaml:
     """Test Bulb.from_yaml class method."""
 
+    @pytest.fixture(autouse=True)
+    def current_loop(self):
+        """wizlight gets the current event loop when it's constructed,
+        which fails once an async test has run and unset it."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        yield loop
+        asyncio.set_event_loop(None)
+        loop.close()
+
     def test_init_without_params(self, mocker: MockerFixture):
         """Test initialization without parameters (uses from_yaml)."""
         mock_bulb = mocker.MagicMock()
         mock_light = mocker.MagicMock()
         mock_bulb.light = mock_light
         mock_from_yaml = mocker.patch("wrappers.bulb_wrapper.Bulb.from_yaml", return_value=mock_bulb)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run", return_value=mocker.MagicMock())
+        mocker.patch("asyncio.run", return_value=mocker.MagicMock())
 
         bulb = Bulb()
         mock_from_yaml.assert_called_once_with("bedroom_light")
@@ -118,7 +131,7 @@ class TestBulbMethods:
     async def test_turn_off(self, mock_wizlight, mocker):
         """Test turning off the bulb."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
         initial_time = bulb.last_accessed
 
@@ -132,7 +145,7 @@ class TestBulbMethods:
     async def test_turn_on_with_rgb(self, mock_wizlight, mocker):
         """Test turning on with RGB color."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
         await bulb.turn_on(brightness=80, rgb=(255, 0, 0))
@@ -145,7 +158,7 @@ class TestBulbMethods:
     async def test_turn_on_with_colortemp(self, mock_wizlight, mocker):
         """Test turning on with color temperature."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         mock_temp_to_rgb = mocker.patch.object(Bulb, "temp_to_rgb", return_value=(255, 200, 150))
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
@@ -158,7 +171,7 @@ class TestBulbMethods:
     async def test_turn_on_rgb_and_colortemp_raises_error(self, mock_wizlight, mocker):
         """Test that providing both RGB and colortemp raises ValueError."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
         with pytest.raises(ValueError, match="cannot provide both rgb and colortemp"):
@@ -168,7 +181,7 @@ class TestBulbMethods:
     async def test_turn_on_no_params(self, mock_wizlight, mocker):
         """Test turning on with no parameters."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
         await bulb.turn_on()
@@ -179,7 +192,7 @@ class TestBulbMethods:
     async def test_set_scene(self, mock_wizlight, mocker):
         """Test setting a scene."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         mock_get_scene = mocker.patch("wrappers.bulb_wrapper.scenes.get_id_from_scene_name", return_value=5)
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
@@ -192,7 +205,7 @@ class TestBulbMethods:
     async def test_set_scene_clamps_brightness(self, mock_wizlight, mocker):
         """Test that set_scene clamps brightness to valid range."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         mocker.patch("wrappers.bulb_wrapper.scenes.get_id_from_scene_name", return_value=5)
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
@@ -208,7 +221,7 @@ class TestBulbMethods:
     async def test_set_scene_clamps_speed(self, mock_wizlight, mocker):
         """Test that set_scene clamps speed to valid range."""
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         mocker.patch("wrappers.bulb_wrapper.scenes.get_id_from_scene_name", return_value=5)
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
@@ -224,7 +237,7 @@ class TestBulbMethods:
         """Test updateState method."""
         mock_wizlight.updateState.return_value = mock_pilot_state
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
 
         state = await bulb.updateState()
@@ -236,40 +249,27 @@ class TestBulbMethods:
 class TestBulbLerp:
     """Test the lerp (linear interpolation) method."""
 
-    @pytest.mark.asyncio
-    async def test_lerp_interrupted_by_external_change(self, mock_wizlight, mock_pilot_state, mocker):
-        """Test lerp interrupted by external state change."""
-        # Create two different states
-        initial_state = mocker.MagicMock(spec=PilotParser)
-        initial_state.get_state.return_value = True
-        initial_state.get_brightness.return_value = 50
-        initial_state.get_rgb.return_value = (255, 255, 255)
-        initial_state.get_colortemp.return_value = 4000
-
-        changed_state = mocker.MagicMock(spec=PilotParser)
-        changed_state.get_state.return_value = True
-        changed_state.get_brightness.return_value = 100  # Different brightness
-        changed_state.get_rgb.return_value = (255, 0, 0)  # Different RGB
-        changed_state.get_colortemp.return_value = 6000  # Different temp
-
+    @pytest.fixture
+    def bulb(self, mock_wizlight, mocker) -> Bulb:
         mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
+        mocker.patch("asyncio.run")
         bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
-        bulb.last_state = initial_state
         bulb.TIME_STEP = 0.05
+        return bulb
 
-        call_count = 0
+    @pytest.mark.asyncio
+    async def test_lerp_interrupted_by_external_change(self, bulb: Bulb, mocker):
+        """Test lerp interrupted by external state change."""
+        mock_turn_on = mocker.patch.object(bulb, "turn_on", new_callable=mocker.AsyncMock)
+        observed = mocker.patch.object(bulb, "observed_state", return_value=None)
 
-        async def mock_update_state():
-            nonlocal call_count
-            call_count += 1
-            if call_count > 1:
-                return changed_state  # Return changed state after first call
-            return initial_state
+        async def turn_on(brightness, colortemp):
+            # the bulb reports what it was set to, until someone sets it to full brightness
+            changed = mock_turn_on.call_count >= 3
+            observed.return_value = ObservedState(True, 255 if changed else brightness, time.monotonic())
 
-        mocker.patch.object(bulb, "turn_on", new_callable=mocker.AsyncMock)
-        mocker.patch.object(bulb, "updateState", side_effect=mock_update_state)
-        await bulb.lerp(
+        mock_turn_on.side_effect = turn_on
+        result = await bulb.lerp(
             start_brightness=20,
             start_temp=3000,
             end_brightness=80,
@@ -277,23 +277,15 @@ class TestBulbLerp:
             duration=1,
         )
 
-        # Should interrupt early
-        assert call_count <= 20  # Would be more steps without interruption
+        assert not result
+        assert mock_turn_on.call_count == 3
+        bulb.light.updateState.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_lerp_state_none_error(self, mock_wizlight, mocker):
-        """Test lerp when state cannot be retrieved."""
-        mock_wizlight.updateState.return_value = None
-        
-        mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
-        bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
-        bulb.last_state = None
-        bulb.TIME_STEP = 0.05
-
+    async def test_lerp_without_known_state(self, bulb: Bulb, mocker):
+        """Test lerp when the bulb's state isn't known."""
         mock_turn_on = mocker.patch.object(bulb, "turn_on", new_callable=mocker.AsyncMock)
-        mocker.patch.object(bulb, "updateState", return_value=None)
-        await bulb.lerp(
+        result = await bulb.lerp(
             start_brightness=20,
             start_temp=3000,
             end_brightness=80,
@@ -301,28 +293,20 @@ class TestBulbLerp:
             duration=1,
         )
 
-        # Should call turn_on with final values
+        # Should run to the end, finishing on the final values
+        assert result
         final_call = mock_turn_on.call_args_list[-1]
         assert final_call[1]["brightness"] == 80
         assert final_call[1]["colortemp"] == 5000
+        bulb.light.updateState.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_lerp_bulb_off_interrupts(self, mock_wizlight, mocker):
+    async def test_lerp_bulb_off_interrupts(self, bulb: Bulb, mocker):
         """Test lerp interrupted when bulb is turned off."""
-        off_state = mocker.MagicMock(spec=PilotParser)
-        off_state.get_state.return_value = False  # Bulb is off
-        off_state.get_brightness.return_value = 0
-        off_state.get_rgb.return_value = (0, 0, 0)
-        off_state.get_colortemp.return_value = 0
-
-        mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
-        mocker.patch("wrappers.bulb_wrapper.asyncio.run")
-        bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
-        bulb.last_state = off_state
-        bulb.TIME_STEP = 0.05
-
         mock_turn_on = mocker.patch.object(bulb, "turn_on", new_callable=mocker.AsyncMock)
-        mocker.patch.object(bulb, "updateState", return_value=off_state)
+        mocker.patch.object(
+            bulb, "observed_state", side_effect=lambda: ObservedState(False, 0, time.monotonic())
+        )
         await bulb.lerp(
             start_brightness=20,
             start_temp=3000,
@@ -334,6 +318,98 @@ class TestBulbLerp:
         # Should interrupt immediately due to off state
         assert mock_turn_on.call_count <= 1
 
+    @pytest.mark.asyncio
+    async def test_lerp_does_not_drift(self, bulb: Bulb, mocker):
+        """Test slow responses don't stretch the lerp."""
+        async def slow_turn_on(**kwargs):
+            await asyncio.sleep(0.08)
+
+        mock_turn_on = mocker.patch.object(bulb, "turn_on", side_effect=slow_turn_on)
+        start = time.perf_counter()
+        result = await bulb.lerp(20, 3000, 80, 5000, duration=1)
+        assert time.perf_counter() - start < 1.2
+        assert result.frames_dropped > 0
+        assert mock_turn_on.call_args_list[-1][1] == {"brightness": 80, "colortemp": 5000, "force": True}
+
+
+class TestBulbFade:
+    """Test fades, which WiZ bulbs can't do by themselves."""
+
+    @pytest.fixture
+    def bulb(self, mock_wizlight, mocker) -> Bulb:
+        mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
+        mocker.patch.object(Bulb, "start_push", new_callable=mocker.AsyncMock, return_value=False)
+        bulb = Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
+        bulb.FADE_INTERVAL = 0.05
+        return bulb
+
+    @pytest.mark.asyncio
+    async def test_fade_from_current_levels(self, bulb: Bulb, mock_pilot_state, mocker):
+        """Test the fade starts from the bulb's state and keeps what isn't given."""
+        mock_pilot_state.get_brightness.return_value = 128 # pywizlight's 0-255 scale, so 50%
+        bulb.light.updateState.return_value = [mock_pilot_state]
+        mock_turn_on = mocker.patch.object(bulb, "turn_on", new_callable=mocker.AsyncMock)
+
+        assert await bulb.fade(colortemp=5000, duration=0.2)
+
+        calls = [call.kwargs for call in mock_turn_on.call_args_list]
+        assert len(calls) == 5
+        assert calls[0] == {"brightness": 50, "colortemp": 4000}
+        assert calls[-1] == {"brightness": 50, "colortemp": 5000, "force": True}
+
+    @pytest.mark.asyncio
+    async def test_fade_when_off(self, bulb: Bulb, mock_pilot_state, mocker):
+        """Test a fade with nothing to start from goes straight to the end."""
+        mock_pilot_state.get_state.return_value = False
+        bulb.light.updateState.return_value = [mock_pilot_state]
+        mock_turn_on = mocker.patch.object(bulb, "turn_on", new_callable=mocker.AsyncMock)
+
+        assert await bulb.fade(brightness=80, colortemp=5000, duration=10)
+
+        mock_turn_on.assert_called_once_with(brightness=80, colortemp=5000)
+
+    @staticmethod
+    def reports_what_it_is_sent(bulb: Bulb, mocker):
+        """Make the bulb report each command back, as its push updates would"""
+        mocker.patch("wrappers.bulb_wrapper.mutable_globals").use_bulb = True
+        sent = []
+
+        async def turn_on(builder: PilotBuilder):
+            sent.append(builder.pilot_params["dimming"])
+            bulb._on_push([PilotParser({"state": True, **builder.pilot_params})])
+
+        bulb.light.turn_on.side_effect = turn_on
+        return sent
+
+    @pytest.mark.asyncio
+    async def test_fade_from_full_brightness(self, bulb: Bulb, mock_pilot_state, mocker):
+        """Test a fade from a bulb reporting more than 100 on pywizlight's 0-255 scale runs to the end."""
+        mock_pilot_state.get_brightness.return_value = 255
+        bulb.light.updateState.return_value = [mock_pilot_state]
+        sent = self.reports_what_it_is_sent(bulb, mocker)
+
+        assert await bulb.fade(brightness=40, colortemp=5000, duration=0.2)
+        assert sent[0] == 100
+        assert sent[-1] == 40
+
+    @pytest.mark.asyncio
+    async def test_fade_start_clamped(self, bulb: Bulb, mocker):
+        """Test a start brightness above 100 is clamped, rather than read back as an interruption."""
+        sent = self.reports_what_it_is_sent(bulb, mocker)
+
+        assert await bulb.fade(brightness=150, colortemp=3000, duration=0.2, start=(204, 2700))
+        assert sent == [100] * 5 # only the colourtemp changes
+        assert bulb.observed_state().brightness == 100
+
+    @pytest.mark.asyncio
+    async def test_fade_reaches_end_within_tolerance(self, bulb: Bulb, mocker):
+        """Test the last frame is sent even when it's within the tolerance of the one before."""
+        sent = self.reports_what_it_is_sent(bulb, mocker)
+
+        assert await bulb.fade(colortemp=3020, duration=0.2, start=(50, 3000))
+        assert len(sent) == 2 # the first frame, then everything up to the last is too small a change
+        assert bulb._commanded.colortemp == 3020
+
 
 # class TestTempToRgb:
 #     """Test temperature to RGB conversion."""
@@ -349,4 +425,74 @@ class TestGetRange:
         assert len(result) == 11  # 10 steps + 1
         assert result[0] == 0
         assert result[-1] == 100
-        
\ No newline at end of file
+
+    @pytest.mark.parametrize(("start", "stop", "length", "expected"), [
+        (100, 0, 4, [100, 75, 50, 25, 0]),
+        (50, 50, 3, [50, 50, 50, 50]),
+        (10, 12, 4, [10, 10, 11, 12, 12]),
+        (10, 80, 0, [80]),
+    ])
+    def test_get_range_edge_cases(self, start, stop, length, expected):
+        """Test descending, equal and short ranges."""
+        assert list(get_fractional_range(start, stop, length)) == expected
+
+    def test_get_range_negative_length(self):
+        with pytest.raises(ValueError, match="negative"):
+            get_fractional_range(0, 10, -1)
+        
+
+class TestPushState:
+    """Test the state cache fed by push updates."""
+
+    @pytest.fixture
+    def bulb(self, mock_wizlight, mocker) -> Bulb:
+        mock_wizlight.start_push = mocker.AsyncMock(return_value=True)
+        mocker.patch("wrappers.bulb_wrapper.wizlight", return_value=mock_wizlight)
+        return Bulb(ip="192.168.1.100", port=38899, mac="aabbccddeeff")
+
+    @staticmethod
+    def push(bulb: Bulb, state) -> None:
+        callback = bulb.light.start_push.call_args[0][0]
+        callback([state])
+
+    @pytest.mark.asyncio
+    async def test_reads_served_from_pushes(self, bulb: Bulb, mock_pilot_state):
+        bulb.light.updateState.return_value = [mock_pilot_state]
+        assert await bulb.updateState() == mock_pilot_state
+        bulb.light.start_push.assert_called_once()
+
+        pushed = PilotParser({"state": False, "dimming": 10})
+        self.push(bulb, pushed)
+        assert await bulb.updateState() is pushed
+        assert not await bulb.is_on
+        bulb.light.updateState.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_polls_when_pushes_stop(self, bulb: Bulb, mock_pilot_state):
+        bulb.light.updateState.return_value = [mock_pilot_state]
+        await bulb.updateState()
+        self.push(bulb, PilotParser({"state": False}))
+        bulb.state_max_age = 0
+        assert await bulb.updateState() == mock_pilot_state
+        assert bulb.light.updateState.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_polls_when_push_unavailable(self, bulb: Bulb, mock_pilot_state):
+        bulb.light.start_push.return_value = False
+        bulb.light.updateState.return_value = [mock_pilot_state]
+        await bulb.updateState()
+        await bulb.updateState()
+        assert not bulb.push_running
+        bulb.light.start_push.assert_called_once()
+        assert bulb.light.updateState.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_close_stops_push(self, bulb: Bulb, mocker: MockerFixture):
+        push_cancel = mocker.Mock()
+        bulb.light.push_cancel = push_cancel
+        await bulb.start_push()
+        await bulb.close()
+        assert not bulb.push_running
+        push_cancel.assert_called_once()
+        assert bulb.light.push_cancel is None
+        bulb.light.async_close.assert_called_once()
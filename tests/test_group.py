@@ -0,0 +1,106 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import yaml
+from pytest_mock import MockerFixture
+
+sys.path.append(str(Path(__file__).parent))
+
+from conftest import FakeDevice
+
+from utils.device_registry import DeviceRegistry
+from wrappers.group import DeviceGroup, UnknownGroupError
+from wrappers.pool import DevicePool
+
+DEVICES = {
+    "lamp": {"ip": "192.168.1.2", "mac": "aa", "class": "fake", "room": "bedroom"},
+    "strip": {"ip": "192.168.1.3", "mac": "bb", "class": "fake", "room": "bedroom", "groups": ["party"]},
+    "big_light": {"ip": "192.168.1.4", "mac": "cc", "class": "fake", "room": "lounge", "groups": ["party"]},
+    "fridge": {"ip": "192.168.1.5", "mac": "dd", "class": "toaster", "room": "kitchen"},
+}
+
+
+@pytest.fixture
+def pool(tmp_path: Path, mocker: MockerFixture) -> DevicePool:
+    yaml_file = tmp_path / "objects.yaml"
+    yaml_file.write_text(yaml.dump(DEVICES))
+    registry = DeviceRegistry(yaml_file)
+    mocker.patch("wrappers.group.get_registry", return_value=registry)
+    mocker.patch("wrappers.base.get_registry", return_value=registry)
+    mocker.patch.dict("wrappers.group.DEVICE_CLASSES", {"fake": FakeDevice})
+    mock_globals = mocker.patch("wrappers.group.mutable_globals")
+    mock_globals.use_bulb = True
+    pool = DevicePool()
+    mocker.patch("wrappers.group.pool", pool)
+    return pool
+
+
+class TestDeviceGroup:
+    def test_members(self, pool: DevicePool):
+        assert set(DeviceGroup("bedroom").members) == {"lamp", "strip"}
+        assert set(DeviceGroup("party").members) == {"strip", "big_light"}
+        assert set(DeviceGroup().members) == {"lamp", "strip", "big_light"} # the fridge has no wrapper
+        assert DeviceGroup("bedroom").members["lamp"] is pool.get(FakeDevice, "lamp")
+
+    def test_unknown_group(self, pool: DevicePool):
+        with pytest.raises(UnknownGroupError):
+            DeviceGroup("garage")
+
+    @pytest.mark.asyncio
+    async def test_turn_on_passes_colortemp(self, pool: DevicePool):
+        await DeviceGroup("bedroom").turn_on(brightness=40, colortemp=2700)
+        for name in ("lamp", "strip"):
+            assert pool.get(FakeDevice, name).calls == [("on", {"brightness": 40, "colortemp": 2700})]
+        assert pool.get(FakeDevice, "big_light").calls == []
+        with pytest.raises(ValueError, match="both"):
+            await DeviceGroup().turn_on(rgb=(1, 2, 3), colortemp=2700)
+
+    @pytest.mark.asyncio
+    async def test_concurrent(self, pool: DevicePool, mocker: MockerFixture):
+        mocker.patch.object(FakeDevice, "delays", {"192.168.1.2": 0.2, "192.168.1.3": 0.2, "192.168.1.4": 0.2})
+        start = time.perf_counter()
+        await DeviceGroup().turn_on()
+        assert time.perf_counter() - start < 0.35
+        assert await DeviceGroup().is_on
+
+    @pytest.mark.asyncio
+    async def test_slow_device_times_out(self, pool: DevicePool, mocker: MockerFixture):
+        mocker.patch.object(FakeDevice, "delays", {"192.168.1.3": 5})
+        group = DeviceGroup("party", timeout=0.1)
+        start = time.perf_counter()
+        await group.turn_on()
+        assert time.perf_counter() - start < 0.3
+        assert await pool.get(FakeDevice, "big_light").is_on
+        assert not await group.is_connected
+        assert await group.is_on # of the devices that answered
+
+    @pytest.mark.asyncio
+    async def test_timed_out_device_is_replaced(self, pool: DevicePool, mocker: MockerFixture):
+        mocker.patch.object(FakeDevice, "delays", {"192.168.1.2": 5})
+        slow = pool.get(FakeDevice, "lamp")
+        await DeviceGroup("bedroom", timeout=0.05).turn_off()
+        assert not slow.healthy
+        assert pool.get(FakeDevice, "lamp") is not slow
+
+    @pytest.mark.asyncio
+    async def test_fade_in_step(self, pool: DevicePool, mocker: MockerFixture):
+        mocker.patch.object(FakeDevice, "delays", {"192.168.1.3": 0.05})
+        assert await DeviceGroup("bedroom").fade(brightness=40, colortemp=2700, duration=0.3, start=(10, 2000))
+        lamp, strip = pool.get(FakeDevice, "lamp").frames, pool.get(FakeDevice, "strip").frames
+        # the slow strip stretches the frames for both, rather than falling behind
+        assert lamp == strip
+        assert lamp[0] == (10, 2000)
+        assert lamp[-1] == (40, 2700)
+
+    @pytest.mark.asyncio
+    async def test_fade_without_start(self, pool: DevicePool):
+        # a device that doesn't know its levels jumps straight to the end
+        assert await DeviceGroup("bedroom").fade(brightness=40, colortemp=2700, duration=1)
+        assert pool.get(FakeDevice, "lamp").calls == [("on", {"brightness": 40, "colortemp": 2700})]
+
+    @pytest.mark.asyncio
+    async def test_disabled_devices_skipped(self, pool: DevicePool, mocker: MockerFixture):
+        mocker.patch("wrappers.group.mutable_globals").use_bulb = False
+        assert DeviceGroup().members == {}
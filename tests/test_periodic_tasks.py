@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+import pytest
+from pytest_mock import MockerFixture
+
+import global_vars as gbl
+import periodic_tasks
+from periodic_tasks import (
+    LIGHT_CHECK_JOB_ID,
+    adaptive_light_check,
+    next_light_check_delay,
+)
+
+
+@pytest.fixture
+def mock_globals(mocker: MockerFixture):
+    mock_globals = mocker.patch("periodic_tasks.mutable_globals")
+    mock_globals.auto_colourtemp = True
+    mock_globals.zenith_not_time = False
+    return mock_globals
+
+
+class TestNextLightCheckDelay:
+    def test_disabled_waits_longest(self, mock_globals):
+        mock_globals.auto_colourtemp = False
+        assert next_light_check_delay() == gbl.MAX_LIGHT_CHECK_INTERVAL
+
+    @pytest.mark.parametrize("zenith_not_time", [True, False])
+    def test_within_bounds(self, mock_globals, zenith_not_time):
+        mock_globals.zenith_not_time = zenith_not_time
+        assert gbl.LIGHT_CHECK_INTERVAL <= next_light_check_delay() <= gbl.MAX_LIGHT_CHECK_INTERVAL
+
+    def test_steep_curve_checks_sooner(self, mock_globals, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(gbl, "MAX_LIGHT_CHECK_INTERVAL", timedelta(days=1))
+        flat = next_light_check_delay()
+        monkeypatch.setattr(gbl, "TIME_WAYPOINTS", {k: v * 100 for k, v in gbl.TIME_WAYPOINTS.items()})
+        assert next_light_check_delay() <= flat
+
+
+@pytest.mark.asyncio
+async def test_adaptive_light_check_reschedules(mocker: MockerFixture, mock_globals):
+    mock_check = mocker.patch("periodic_tasks.periodic_light_check", side_effect=RuntimeError)
+    scheduler = mocker.MagicMock()
+
+    with pytest.raises(RuntimeError):
+        await adaptive_light_check(scheduler)
+
+    mock_check.assert_awaited_once()
+    scheduler.add_job.assert_called_once()
+    args, kwargs = scheduler.add_job.call_args
+    assert args[0] is periodic_tasks.adaptive_light_check
+    assert kwargs["id"] == LIGHT_CHECK_JOB_ID
+    assert kwargs["replace_existing"]
@@ -0,0 +1,135 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+import yaml
+from pytest_mock import MockerFixture
+
+sys.path.append(str(Path(__file__).parent))
+
+from conftest import FakeDevice
+
+from wrappers.pool import DevicePool
+
+
+@pytest.fixture
+def pool() -> DevicePool:
+    FakeDevice.instances = 0
+    return DevicePool()
+
+
+class TestDevicePool:
+    def test_instances_are_shared(self, pool: DevicePool):
+        device = pool.get(FakeDevice)
+        assert pool.get(FakeDevice) is device
+        assert FakeDevice.instances == 1
+
+    def test_named_devices(self, pool: DevicePool, tmp_path: Path, mocker: MockerFixture):
+        yaml_file = tmp_path / "objects.yaml"
+        yaml_file.write_text(yaml.dump({"lamp": {"ip": "192.168.1.2", "mac": "aa"}}))
+        mocker.patch("wrappers.base.OBJECTS_FILE", yaml_file)
+
+        lamp = pool.get(FakeDevice, "lamp")
+        assert lamp.ip == "192.168.1.2"
+        assert pool.get(FakeDevice, "lamp") is lamp
+        assert pool.get(FakeDevice) is not lamp
+
+    @pytest.mark.asyncio
+    async def test_replaced_after_failure(self, pool: DevicePool):
+        device = pool.get(FakeDevice)
+        device.commands_skipped = 3
+        device.reachable = False
+        await device.turn_on()
+        assert not device.healthy
+
+        replacement = pool.get(FakeDevice)
+        assert replacement is not device
+        assert replacement.healthy
+        assert replacement.commands_skipped == 3
+        await pool.close()
+        assert device.closed
+
+    @pytest.mark.asyncio
+    async def test_recovers_without_replacement(self, pool: DevicePool):
+        device = pool.get(FakeDevice)
+        device.reachable = False
+        await device.turn_on()
+        device.reachable = True
+        await device.turn_on()
+        assert pool.get(FakeDevice) is device
+
+    @pytest.mark.asyncio
+    async def test_discard(self, pool: DevicePool):
+        device = pool.get(FakeDevice)
+        pool.discard(FakeDevice)
+        assert pool.get(FakeDevice) is not device
+        await pool.close()
+        assert device.closed
+
+    @pytest.mark.asyncio
+    async def test_close(self, pool: DevicePool):
+        device = pool.get(FakeDevice)
+        assert len(pool) == 1
+        await pool.close()
+        assert len(pool) == 0
+        assert device.closed
+
+    @pytest.mark.asyncio
+    async def test_pinned_to_loop(self, pool: DevicePool):
+        loop = asyncio.get_running_loop()
+        existing = pool.get(FakeDevice)
+        pool.pin(loop)
+        ran_on = []
+
+        async def note():
+            ran_on.append(asyncio.get_running_loop())
+
+        def request(device: FakeDevice):
+            # like a request handled on its own thread and event loop
+            asyncio.run(device.actor.run(note))
+
+        pool.discard(FakeDevice)
+        added = pool.get(FakeDevice)
+        for device in (existing, added):
+            await loop.run_in_executor(None, request, device)
+        assert ran_on == [loop, loop]
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_spawn(self, pool: DevicePool):
+        loop = asyncio.get_running_loop()
+        pool.pin(loop)
+        ran_on = []
+
+        async def background():
+            ran_on.append(asyncio.get_running_loop())
+            await asyncio.sleep(10)
+
+        def request():
+            # returns as soon as it's started, leaving it running on the pinned loop
+            async def handler():
+                return pool.spawn(background())
+            return asyncio.run(handler())
+
+        future = await loop.run_in_executor(None, request)
+        await asyncio.sleep(0.01)
+        assert ran_on == [loop]
+        assert not future.done()
+
+        future.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wrap_future(future)
+
+    def test_concurrent_gets_share_one_instance(self, pool: DevicePool):
+        class SlowToBuild(FakeDevice):
+            def __init__(self, *args, **kwargs):
+                time.sleep(0.01)
+                super().__init__(*args, **kwargs)
+
+        with ThreadPoolExecutor(8) as executor:
+            devices = list(executor.map(lambda _: pool.get(SlowToBuild), range(8)))
+        assert FakeDevice.instances == 1
+        assert all(device is devices[0] for device in devices)
@@ -0,0 +1,204 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import FakeDevice
+
+from wrappers.base import ObservedState
+from wrappers.transition import Transition, TransitionClock, fade_together
+
+
+class TestSchedule:
+    def test_frames(self):
+        transition = Transition(FakeDevice(), (0, 2000), (100, 3000), duration=1, interval=0.25)
+        assert list(transition.offsets) == [0.0, 0.25, 0.5, 0.75, 1.0]
+        assert list(transition.brightnesses) == [0, 25, 50, 75, 100]
+        assert list(transition.colourtemps) == [2000, 2250, 2500, 2750, 3000]
+
+    def test_repeated_frames_dropped(self):
+        transition = Transition(FakeDevice(), (10, 3000), (12, 3000), duration=1, interval=0.25)
+        assert list(transition.brightnesses) == [10, 11, 12]
+        assert list(transition.offsets) == [0.0, 0.5, 0.75]
+
+    def test_no_duration(self):
+        transition = Transition(FakeDevice(), (10, 3000), (80, 5000), duration=0)
+        assert list(transition.brightnesses) == [80]
+        assert list(transition.colourtemps) == [5000]
+
+    def test_levels_made_whole(self):
+        transition = Transition(FakeDevice(), (-5, 2000.4), (10.6, 2700.5), duration=1, interval=0.5)
+        assert list(transition.brightnesses) == [0, 6, 11]
+        assert transition.colourtemps[0] == 2000
+        assert transition.colourtemps[-1] == 2700 # rounded half to even
+
+    def test_bad_interval(self):
+        with pytest.raises(ValueError, match="interval"):
+            Transition(FakeDevice(), (10, 3000), (80, 5000), duration=1, interval=0)
+
+
+class TestRun:
+    @pytest.mark.asyncio
+    async def test_sends_every_frame(self):
+        device = FakeDevice()
+        result = await Transition(device, (0, 2000), (100, 3000), duration=0.2, interval=0.05).run()
+        assert result
+        assert result.frames_sent == 5
+        assert result.frames_dropped == 0
+        assert device.frames[-1] == (100, 3000)
+
+    @pytest.mark.asyncio
+    async def test_slow_device_drops_frames(self):
+        device = FakeDevice(delay=0.07)
+        start = time.perf_counter()
+        result = await Transition(device, (0, 2000), (100, 3000), duration=0.5, interval=0.02).run()
+        elapsed = time.perf_counter() - start
+
+        # finishes on time, on the final values, having skipped what it couldn't send
+        assert elapsed < 0.5 + 2 * device.delay
+        assert result.completed
+        assert result.frames_dropped > 0
+        assert result.frames_sent + result.frames_dropped == 26
+        assert device.frames[-1] == (100, 3000)
+
+    @pytest.mark.asyncio
+    async def test_interrupted_by_turn_off(self):
+        device = FakeDevice()
+        transition = Transition(device, (0, 2000), (100, 3000), duration=0.4, interval=0.05)
+        task = asyncio.create_task(transition.run())
+        await asyncio.sleep(0.12)
+        await device.turn_off()
+        result = await task
+
+        assert not result
+        assert 0 < result.frames_sent < len(transition)
+        assert device.frames[-1] != (100, 3000)
+
+    @pytest.mark.asyncio
+    async def test_interrupted_by_brightness_change(self):
+        device = FakeDevice()
+        transition = Transition(device, (0, 2000), (50, 3000), duration=0.4, interval=0.05, tolerance=5)
+        task = asyncio.create_task(transition.run())
+        await asyncio.sleep(0.12)
+        device.state = ObservedState(True, 200, time.monotonic())
+        result = await task
+
+        assert not result
+        assert device.frames[-1] != (50, 3000)
+
+    @pytest.mark.asyncio
+    async def test_brightness_within_tolerance_not_interrupted(self):
+        device = FakeDevice()
+        transition = Transition(device, (0, 2000), (50, 3000), duration=0.3, interval=0.05, tolerance=5)
+        task = asyncio.create_task(transition.run())
+        await asyncio.sleep(0.12)
+        device.state = ObservedState(True, device.frames[-1][0] + 3, time.monotonic())
+        assert await task
+
+    @pytest.mark.asyncio
+    async def test_old_state_ignored(self):
+        device = FakeDevice()
+        device.state = ObservedState(False, 0, time.monotonic())
+        result = await Transition(device, (0, 2000), (100, 3000), duration=0.1, interval=0.05).run()
+        assert result
+        assert device.frames[-1] == (100, 3000)
+
+
+class NativeFadeDevice(FakeDevice):
+    NATIVE_FADE = True
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__(delay=delay)
+        self.fades: list[tuple[float, tuple[int, int] | None]] = []
+
+    async def fade(self, brightness=None, colortemp=None, duration=0.0, start=None) -> bool:
+        self.fades.append((duration, start))
+        return True
+
+
+class TestTransitionClock:
+    @pytest.mark.asyncio
+    async def test_lock_step(self):
+        bulb, strip = FakeDevice(delay=0.005), FakeDevice(delay=0.01)
+        clock = TransitionClock(0.2, interval=0.05)
+        clock.add(bulb, (0, 2000), (100, 3000))
+        clock.add(strip, (100, 3000), (0, 2000))
+        results = await clock.run()
+
+        assert all(results.values())
+        assert len(bulb.frames) == len(strip.frames) == 5
+        assert bulb.frames[2] == strip.frames[2] == (50, 2500)
+        # each frame went to both at once; sent one after the other, they'd reach the
+        # second device at least the first one's delay later
+        for bulb_start, strip_start in zip(bulb.started, strip.started, strict=True):
+            assert abs(bulb_start - strip_start) < bulb.delay
+
+    @pytest.mark.asyncio
+    async def test_adapts_to_slowest_device(self):
+        fast, slow = FakeDevice(), FakeDevice(delay=0.05)
+        clock = TransitionClock(0.5, interval=0.01, max_interval=1)
+        clock.add(fast, (0, 2000), (100, 3000))
+        clock.add(slow, (0, 2000), (100, 3000))
+        start = time.perf_counter()
+        results = await clock.run()
+
+        assert time.perf_counter() - start < 0.5 + 2 * slow.delay
+        assert clock.interval >= slow.delay
+        assert clock.latency(slow) > clock.latency(fast)
+        assert results[slow].max_lateness > results[fast].max_lateness
+        assert fast.frames == slow.frames
+        assert fast.frames[-1] == (100, 3000)
+        assert len(fast.frames) < 20
+
+    @pytest.mark.asyncio
+    async def test_unresponsive_device_dropped(self):
+        ok, stuck = FakeDevice(), FakeDevice(delay=5)
+        clock = TransitionClock(0.2, interval=0.05, timeout=0.1)
+        clock.add(ok, (0, 2000), (100, 3000))
+        clock.add(stuck, (0, 2000), (100, 3000))
+        results = await clock.run()
+
+        assert results[ok]
+        assert not results[stuck]
+        assert not stuck.healthy
+        assert ok.frames[-1] == (100, 3000)
+
+    @pytest.mark.asyncio
+    async def test_interrupted_device_leaves(self):
+        keeps_going, interrupted = FakeDevice(), FakeDevice()
+        clock = TransitionClock(0.3, interval=0.05)
+        clock.add(keeps_going, (0, 2000), (100, 3000))
+        clock.add(interrupted, (0, 2000), (100, 3000))
+        task = asyncio.create_task(clock.run())
+        await asyncio.sleep(0.12)
+        await interrupted.turn_off()
+        results = await task
+
+        assert results[keeps_going]
+        assert not results[interrupted]
+        assert len(interrupted.frames) < len(keeps_going.frames)
+
+    @pytest.mark.asyncio
+    async def test_native_fade_sent_once(self):
+        bulb, strip = FakeDevice(), NativeFadeDevice()
+        results = await fade_together([bulb, strip], brightness=100, colortemp=3000, duration=0.2, start=(0, 2000))
+
+        assert all(results.values())
+        assert strip.fades == [(0.2, (0, 2000))]
+        assert len(bulb.frames) > 1
+
+    @pytest.mark.asyncio
+    async def test_fade_together_from_current_levels(self, mocker):
+        bulb, strip = FakeDevice(), NativeFadeDevice()
+        mocker.patch.object(bulb, "current_levels", new_callable=mocker.AsyncMock, return_value=(50, 2000))
+        strip_levels = mocker.patch.object(strip, "current_levels", new_callable=mocker.AsyncMock)
+        await fade_together([bulb, strip], colortemp=3000, duration=0.1)
+
+        assert bulb.frames[0] == (50, 2000)
+        assert bulb.frames[-1] == (50, 3000)
+        assert strip.fades == [(0.1, None)]
+        strip_levels.assert_not_called()
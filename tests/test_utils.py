@@ -1,18 +1,36 @@
-from datetime import datetime, timedelta
+import asyncio
+import itertools
+import logging
+import math
+import random
+from array import array
+from datetime import date, datetime, time, timedelta
+from logging.handlers import QueueHandler
 from pathlib import Path
+from typing import ClassVar
 
+import astral.sun
 import pytest
+import yaml
+from pydantic import ValidationError
 from pytest import LogCaptureFixture  # noqa: PT013
+from pytest_mock import MockerFixture
 
+import global_vars as gbl
+from utils import conversions
+from utils.curves import WaypointCurve, compile_waypoints, time_curve
+from utils.device_registry import DeviceRegistry, get_registry
+from utils.get_logger import get_logger, namer
 from utils.json_wrapper import MutableGlobalsWrapper
 from utils.misc import config_to_bool_function
+from utils.solar import DEFAULT_LOCATION, ZenithSchedule, daily_schedule
 
 
-@pytest.fixture
-def wrapper(tmp_path:Path):
+@pytest.fixture(params=[False, True], ids=["uncached", "cached"])
+def wrapper(tmp_path:Path, request: pytest.FixtureRequest):
     fpath = tmp_path / "output.json"
     fpath.touch()
-    return MutableGlobalsWrapper(fpath)
+    return MutableGlobalsWrapper(fpath, cached=request.param)
 
 def check_defaults(wrapper: MutableGlobalsWrapper):
     assert not wrapper.visitor_present
@@ -54,7 +72,147 @@ class TestMutableGlobals:
             if record.levelname == "ERROR" and "Error loading" in record.message:
                 return
         raise AssertionError("Expected error log not found")
+
+    def test_cached_sees_external_edits(self, tmp_path: Path):
+        fpath = tmp_path / "output.json"
+        cached = MutableGlobalsWrapper(fpath, cached=True)
+        other_process = MutableGlobalsWrapper(fpath)
+        cached.write_default()
+        assert cached.use_bulb
+
+        other_process.use_bulb = False
+        assert not cached.use_bulb
+        other_process.use_bulb = True
+        assert cached.use_bulb
+
+    def test_transaction_writes_once(self, wrapper: MutableGlobalsWrapper, mocker: MockerFixture):
+        wrapper.write_default()
+        spy = mocker.spy(wrapper, "_write")
+        with wrapper.transaction():
+            wrapper.visitor_present = True
+            wrapper.use_bulb = False
+            assert wrapper.visitor_present
+            assert spy.call_count == 0
+        assert spy.call_count == 1
+        assert wrapper.visitor_present
+        assert not wrapper.use_bulb
+        assert list(wrapper.file.parent.iterdir()) == [wrapper.file]
+
+    def test_transaction_rolls_back(self, wrapper: MutableGlobalsWrapper):
+        wrapper.write_default()
+        def fail_in_transaction():
+            with wrapper.transaction():
+                wrapper.visitor_present = True
+                raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            fail_in_transaction()
+        assert not wrapper.visitor_present
+
+    def test_write_delay_coalesces(self, tmp_path: Path, mocker: MockerFixture):
+        wrapper = MutableGlobalsWrapper(tmp_path / "output.json", write_delay=60)
+        wrapper.write_default()
+        spy = mocker.spy(wrapper, "_write")
+
+        wrapper.use_bulb = False
+        wrapper.visitor_present = True
+        assert not wrapper.use_bulb
+        assert spy.call_count == 0
+        wrapper.flush()
+        assert spy.call_count == 1
+        assert not MutableGlobalsWrapper(wrapper.file).use_bulb
+
+        # toggling back and forth within the window doesn't write anything
+        wrapper.use_bulb = True
+        wrapper.use_bulb = False
+        wrapper.flush()
+        assert spy.call_count == 1
+
+    def test_write_delay_flushes_after_delay(self, tmp_path: Path):
+        wrapper = MutableGlobalsWrapper(tmp_path / "output.json", write_delay=0.01)
+        wrapper.write_default()
+        wrapper.visitor_present = True
+        assert wrapper._flush_timer is not None
+        wrapper._flush_timer.join()
+        assert MutableGlobalsWrapper(wrapper.file).visitor_present
+
+    def test_cached_skips_reading(self, wrapper: MutableGlobalsWrapper, mocker: MockerFixture):
+        wrapper.write_default()
+        _ = wrapper.data
+        spy = mocker.spy(wrapper, "_load")
+        for _ in range(5):
+            _ = wrapper.use_bulb
+        assert spy.call_count == (0 if wrapper.cached else 5)
     
+class TestSubscriptions:
+    @pytest.fixture
+    def changes(self) -> list:
+        return []
+
+    @pytest.fixture
+    def callback(self, changes: list):
+        async def on_change(key, value):
+            changes.append((key, value))
+        return on_change
+
+    @pytest.mark.asyncio
+    async def test_notified_on_set(self, wrapper: MutableGlobalsWrapper, changes: list, callback):
+        wrapper.write_default()
+        wrapper.subscribe("auto_colourtemp", callback)
+
+        wrapper.auto_colourtemp = True # unchanged
+        wrapper.visitor_present = True # not subscribed
+        wrapper.auto_colourtemp = False
+        await asyncio.sleep(0.01)
+        assert changes == [("auto_colourtemp", False)]
+
+    @pytest.mark.asyncio
+    async def test_notified_once_per_transaction(self, wrapper: MutableGlobalsWrapper, changes: list, callback):
+        wrapper.write_default()
+        wrapper.subscribe("auto_colourtemp", callback)
+        wrapper.subscribe("zenith_not_time", callback)
+
+        with wrapper.transaction():
+            wrapper.auto_colourtemp = False
+            wrapper.auto_colourtemp = True
+            wrapper.zenith_not_time = True
+        await asyncio.sleep(0.01)
+        assert changes == [("zenith_not_time", True)]
+
+    @pytest.mark.asyncio
+    async def test_notified_on_external_edit(self, wrapper: MutableGlobalsWrapper, changes: list, callback):
+        wrapper.write_default()
+        wrapper.subscribe("use_wled", callback)
+        watch_task = asyncio.create_task(wrapper.watch(interval=0.01))
+
+        MutableGlobalsWrapper(wrapper.file).use_wled = False
+        await asyncio.sleep(0.05)
+        watch_task.cancel()
+        assert changes == [("use_wled", False)]
+
+    @pytest.mark.asyncio
+    async def test_unsubscribe(self, wrapper: MutableGlobalsWrapper, changes: list, callback):
+        wrapper.write_default()
+        wrapper.subscribe("auto_colourtemp", callback)
+        wrapper.unsubscribe("auto_colourtemp", callback)
+        wrapper.auto_colourtemp = False
+        await asyncio.sleep(0.01)
+        assert changes == []
+
+
+class TestGetLogger:
+    def test_loggers_share_queue_handler(self):
+        first = get_logger("first_test_logger")
+        second = get_logger("second_test_logger", "DEBUG")
+        assert len(first.handlers) == 1
+        assert isinstance(first.handlers[0], QueueHandler)
+        assert first.handlers == second.handlers
+        assert second.level == logging.DEBUG
+
+    def test_namer(self):
+        assert Path(namer(str(Path("logs") / "log.txt.1"))) == Path("logs") / "log_1.txt"
+
+
 class TestConfigToBoolFunction:
     @pytest.mark.parametrize("option", ["true", "True", True, 1, "1"])
     def test_set_true(self, option):
@@ -77,3 +235,255 @@ class TestConfigToBoolFunction:
     def test_invalid_option(self):
         with pytest.raises(ValueError, match="Invalid option: qwerty"):
             config_to_bool_function("qwerty")
+
+
+class TestConversionTables:
+    def test_rgb_table_matches_calculation(self):
+        for temp in range(conversions.TABLE_MIN_TEMP, conversions.TABLE_MAX_TEMP + 1):
+            assert conversions.temp_to_rgb(temp) == conversions._calculate_rgb(temp)
+
+    def test_rgbww_table_matches_calculation(self):
+        for temp in range(conversions.TABLE_MIN_TEMP, conversions.TABLE_MAX_TEMP + 1):
+            expected = conversions._calculate_rgbww(temp, gbl.MIN_COLORTEMP, gbl.MAX_COLORTEMP)
+            assert conversions.temp_to_rgbww(temp) == expected
+
+    @pytest.mark.parametrize("temp", [999, 40_001, 2700.5, 2700.0])
+    def test_values_outside_table(self, temp):
+        assert conversions.temp_to_rgb(temp) == conversions._calculate_rgb(temp)
+        expected = conversions._calculate_rgbww(temp, gbl.MIN_COLORTEMP, gbl.MAX_COLORTEMP)
+        assert conversions.temp_to_rgbww(temp) == expected
+
+    def test_rgbww_table_follows_limits(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(gbl, "MIN_COLORTEMP", 3000)
+        assert conversions.temp_to_rgbww(2500) == conversions._calculate_rgbww(2500, 3000, gbl.MAX_COLORTEMP)
+
+
+class TestBatchConversions:
+    temps: ClassVar[list[float]] = [*range(900, 10_000, 7), 2700.0, 2700.5, 41_000, 1320]
+
+    def test_rgb_many_matches_scalar(self):
+        expected = [channel for temp in self.temps for channel in conversions.temp_to_rgb(temp)]
+        assert conversions.temp_to_rgb_many(self.temps).tolist() == expected
+
+    def test_rgbww_many_matches_scalar(self):
+        expected = [channel for temp in self.temps for channel in conversions.temp_to_rgbww(temp)]
+        assert conversions.temp_to_rgbww_many(self.temps).tolist() == expected
+
+    def test_array_input(self):
+        temps = array("H", range(1000, 2000))
+        expected = [channel for temp in temps for channel in conversions.temp_to_rgb(temp)]
+        assert conversions.temp_to_rgb_many(temps).tolist() == expected
+
+    def test_empty(self):
+        assert len(conversions.temp_to_rgb_many([])) == 0
+
+
+def brute_force_rgb_to_temp(rgb, approximate=True) -> int:
+    """The original linear search that `rgb_to_temp` has to agree with"""
+    best_dist = 100.0
+    best_temp = None
+    for temp in range(1_000, 10_000):
+        rgb_current = conversions.temp_to_rgb(temp)
+        if rgb_current == rgb:
+            return temp
+        if not approximate:
+            continue
+        dist = math.dist(rgb_current, rgb)
+        if dist < best_dist:
+            best_dist = dist
+            best_temp = temp
+    if best_temp is None:
+        raise RuntimeError
+    return best_temp
+
+
+class TestRgbToTemp:
+    @pytest.mark.parametrize("temp", [1000, 1900, 2700, 4500, 6500, 6600, 6700, 9999])
+    def test_exact(self, temp):
+        rgb = conversions.temp_to_rgb(temp)
+        assert conversions.rgb_to_temp(rgb, approximate=False) == brute_force_rgb_to_temp(rgb)
+        assert conversions.rgb_to_temp(conversions.rgb_to_hex(rgb)) == brute_force_rgb_to_temp(rgb)
+
+    def test_exact_not_found(self):
+        with pytest.raises(RuntimeError, match="couldn't get temp"):
+            conversions.rgb_to_temp((255, 200, 1), approximate=False)
+
+    def test_too_far_away(self):
+        with pytest.raises(RuntimeError, match="couldn't get temp"):
+            conversions.rgb_to_temp((0, 0, 0))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        targets = [tuple(rng.randint(0, 255) for _ in range(3)) for _ in range(50)]
+        targets += [(255, rng.randint(60, 255), rng.randint(0, 255)) for _ in range(50)]
+        for target in targets:
+            try:
+                expected = brute_force_rgb_to_temp(target)
+            except RuntimeError:
+                with pytest.raises(RuntimeError):
+                    conversions.rgb_to_temp(target)
+            else:
+                assert conversions.rgb_to_temp(target) == expected
+
+
+def linear_scan_lerp(waypoint, waypoints_dict) -> int:
+    """The original sort-and-scan interpolation that `WaypointCurve` has to agree with"""
+    waypoints = sorted(waypoints_dict.items())
+    if waypoint <= waypoints[0][0]:
+        return waypoints[0][1]
+    if waypoint >= waypoints[-1][0]:
+        return waypoints[-1][1]
+    for (waypoint_1, colortemp_1), (waypoint_2, colortemp_2) in itertools.pairwise(waypoints):
+        if waypoint_1 <= waypoint <= waypoint_2:
+            factor = (waypoint - waypoint_1) / (waypoint_2 - waypoint_1)
+            return round(colortemp_1 + factor * (colortemp_2 - colortemp_1))
+    raise AssertionError
+
+
+class TestWaypointCurve:
+    def test_matches_linear_scan(self):
+        curve = WaypointCurve(gbl.ZENITH_WAYPOINTS)
+        zeniths = [z / 4 for z in range(-40, 480)]
+        assert curve.many(zeniths) == [linear_scan_lerp(z, gbl.ZENITH_WAYPOINTS) for z in zeniths]
+
+    def test_time_curve(self):
+        curve = time_curve()
+        assert curve(0) == gbl.TIME_WAYPOINTS[time(6, 0)]
+        assert curve(12 * 3600) == gbl.TIME_WAYPOINTS[time(12, 0)]
+        assert curve(24 * 3600) == gbl.TIME_WAYPOINTS[time(23, 0)]
+
+    @pytest.mark.parametrize("waypoints", [{}, {0.0: "warm"}, {0.0: -100}, {0.0: 2700, "a": 3000}])
+    def test_invalid_waypoints(self, waypoints):
+        with pytest.raises(ValueError):  # noqa: PT011
+            WaypointCurve(waypoints)
+
+    @pytest.mark.parametrize("start", [0.0, 5.0, 12.5, 25.0])
+    def test_next_change(self, start):
+        curve = WaypointCurve({10.0: 2000, 20.0: 3000, 30.0: 3000, 40.0: 2000})
+        change = curve.next_change(start, 100)
+        assert change is not None
+        assert abs(curve(change) - curve(start)) == pytest.approx(100, abs=1)
+        assert all(abs(curve(x / 10) - curve(start)) < 100 for x in range(round(start * 10) + 1, round(change * 10)))
+
+    def test_next_change_none_when_flat(self):
+        curve = WaypointCurve({10.0: 2000, 20.0: 3000})
+        assert curve.next_change(20.0, 100) is None
+        with pytest.raises(ValueError, match="tolerance must be positive"):
+            curve.next_change(0.0, 0)
+
+    def test_rebuilds_when_waypoints_change(self):
+        waypoints = {0.0: 2000, 10.0: 3000}
+        curve = compile_waypoints(waypoints)
+        assert compile_waypoints(waypoints) is curve
+        waypoints[10.0] = 4000
+        assert compile_waypoints(waypoints) is not curve
+        assert compile_waypoints(waypoints)(5.0) == 3000
+
+
+class TestZenithSchedule:
+    day = date(2026, 6, 21)
+
+    @pytest.fixture
+    def schedule(self) -> ZenithSchedule:
+        return ZenithSchedule(self.day)
+
+    @pytest.mark.parametrize("t", [time(0, 0), time(6, 30), time(12, 0), time(20, 59), time(23, 59)])
+    def test_matches_astral(self, schedule: ZenithSchedule, t: time):
+        dt = datetime.combine(self.day, t, tzinfo=DEFAULT_LOCATION.tzinfo)
+        zenith = astral.sun.zenith(DEFAULT_LOCATION.observer, dt)
+        assert schedule.zenith_at(dt) == pytest.approx(zenith, abs=1e-3)
+        assert schedule.colourtemp_at(dt) == pytest.approx(WaypointCurve(gbl.ZENITH_WAYPOINTS)(zenith), abs=1)
+
+    def test_next_change(self, schedule: ZenithSchedule):
+        start = datetime.combine(self.day, time(19, 0), tzinfo=DEFAULT_LOCATION.tzinfo)
+        change = schedule.next_change(start, 50)
+        assert change is not None
+        assert start < change < start + timedelta(hours=1)
+        assert abs(schedule.colourtemp_at(change) - schedule.colourtemp_at(start)) >= 50
+        assert schedule.colourtemp_at(change - timedelta(minutes=1)) - schedule.colourtemp_at(start) < 50
+
+    def test_daily_schedule_is_cached(self):
+        now = datetime.combine(self.day, time(12, 0))
+        schedule = daily_schedule(now)
+        assert daily_schedule(now + timedelta(hours=11)) is schedule
+
+    def test_daily_schedule_rolls_over_at_midnight(self):
+        schedule = daily_schedule(datetime.combine(self.day, time(23, 59)))
+        tomorrow = daily_schedule(datetime.combine(self.day, time(23, 59)) + timedelta(minutes=1))
+        assert tomorrow is not schedule
+        assert tomorrow.date == self.day + timedelta(days=1)
+
+
+class TestDeviceRegistry:
+    devices: ClassVar[dict[str, dict]] = {
+        "lamp": {"ip": "192.168.1.2", "mac": "aa", "type": "bulb", "class": "wizlight"},
+        "strip": {"ip": "192.168.1.3", "mac": "bb", "port": 80, "type": "led_strip", "class": "WLED"},
+    }
+
+    @pytest.fixture
+    def yaml_file(self, tmp_path: Path) -> Path:
+        yaml_file = tmp_path / "objects.yaml"
+        yaml_file.write_text(yaml.dump(self.devices))
+        return yaml_file
+
+    def test_lookup(self, yaml_file: Path):
+        registry = DeviceRegistry(yaml_file)
+        assert len(registry) == 2
+        assert "lamp" in registry
+        lamp = registry["lamp"]
+        assert (lamp.name, lamp.ip, lamp.mac, lamp.port) == ("lamp", "192.168.1.2", "aa", 38899)
+        assert registry["strip"].port == 80
+        assert [device.name for device in registry.by_type("led_strip")] == ["strip"]
+        assert [device.name for device in registry.by_class("wizlight")] == ["lamp"]
+        with pytest.raises(KeyError):
+            registry["missing"]
+
+    def test_parsed_once(self, yaml_file: Path, mocker: MockerFixture):
+        registry = DeviceRegistry(yaml_file, check_interval=0)
+        parse = mocker.spy(registry, "_parse")
+        for _ in range(5):
+            registry["lamp"]
+        assert parse.call_count == 1
+
+    def test_reloads_when_changed(self, yaml_file: Path):
+        registry = DeviceRegistry(yaml_file, check_interval=0)
+        assert registry["lamp"].ip == "192.168.1.2"
+        yaml_file.write_text(yaml.dump({"lamp": {"ip": "192.168.1.99", "mac": "aa"}}))
+        assert registry["lamp"].ip == "192.168.1.99"
+        assert "strip" not in registry
+
+    def test_change_check_is_throttled(self, yaml_file: Path):
+        registry = DeviceRegistry(yaml_file, check_interval=60)
+        assert registry["lamp"].ip == "192.168.1.2"
+        yaml_file.write_text(yaml.dump({"lamp": {"ip": "192.168.1.99", "mac": "aa"}}))
+        assert registry["lamp"].ip == "192.168.1.2"
+        registry.reload()
+        assert registry["lamp"].ip == "192.168.1.99"
+
+    def test_invalid_file(self, yaml_file: Path):
+        yaml_file.write_text(yaml.dump({"lamp": {"mac": "aa"}}))
+        with pytest.raises(ValidationError):
+            DeviceRegistry(yaml_file)["lamp"]
+
+    def test_keeps_devices_if_reload_fails(self, yaml_file: Path):
+        registry = DeviceRegistry(yaml_file, check_interval=0)
+        assert registry["lamp"].ip == "192.168.1.2"
+        yaml_file.write_text("lamp: [")
+        assert registry["lamp"].ip == "192.168.1.2"
+
+    def test_groups(self, tmp_path: Path):
+        yaml_file = tmp_path / "objects.yaml"
+        yaml_file.write_text(yaml.dump({
+            "lamp": {"ip": "1", "mac": "aa", "room": "bedroom"},
+            "strip": {"ip": "2", "mac": "bb", "room": "bedroom", "groups": ["party"]},
+            "big_light": {"ip": "3", "mac": "cc", "groups": ["party"]},
+        }))
+        registry = DeviceRegistry(yaml_file)
+        assert registry.group_names == {"all", "bedroom", "party"}
+        assert {device.name for device in registry.group("bedroom")} == {"lamp", "strip"}
+        assert {device.name for device in registry.group("party")} == {"strip", "big_light"}
+        assert len(registry.group("all")) == 3
+        assert registry.group("garage") == []
+
+    def test_get_registry_is_shared(self, yaml_file: Path):
+        assert get_registry(yaml_file) is get_registry(str(yaml_file))
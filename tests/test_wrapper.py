@@ -1,5 +1,6 @@
 import asyncio
 import sys
+import time
 from pathlib import Path
 
 import pytest
@@ -7,7 +8,12 @@ from pytest_mock import MockerFixture
 
 sys.path.append(str(Path(__file__).parent))
 
-from wrappers.base import FailedConnectionError, ignore_failed_connection
+from conftest import FakeDevice
+
+import global_vars as gbl
+from wrappers.all import AllObjects
+from wrappers.base import FailedConnectionError, ObservedState, ignore_failed_connection
+from wrappers.bulb_wrapper import Bulb
 
 
 def test_ignore_exception_annotation(mocker: MockerFixture):
@@ -25,4 +31,111 @@ def test_ignore_exception_annotation(mocker: MockerFixture):
 
     with pytest.raises(FailedConnectionError):
         asyncio.run(test_instance.test_method_should_raise())
-    asyncio.run(test_instance.test_method_should_not_raise())
\ No newline at end of file
+    asyncio.run(test_instance.test_method_should_not_raise())
+
+class TestCommandCache:
+    @pytest.mark.asyncio
+    async def test_repeated_command_skipped(self):
+        device = FakeDevice()
+        await device.turn_on(colortemp=3000)
+        await device.turn_on(colortemp=3000)
+        await device.turn_on(colortemp=3000 + gbl.COMMAND_COLOURTEMP_TOLERANCE)
+        assert len(device.sent) == 1
+        assert device.commands_skipped == 2
+
+        await device.turn_on(colortemp=3000 + gbl.COMMAND_COLOURTEMP_TOLERANCE + 1)
+        assert len(device.sent) == 2
+
+    @pytest.mark.asyncio
+    async def test_commands_merged(self):
+        device = FakeDevice()
+        await device.turn_on(brightness=50, colortemp=3000)
+        await device.turn_on(brightness=50)
+        await device.turn_on(colortemp=3000)
+        assert len(device.sent) == 1
+
+        await device.turn_on(rgb=(255, 0, 0))
+        await device.turn_on(rgb=[255, 0, 0])
+        assert len(device.sent) == 2
+        await device.turn_on(colortemp=3000)
+        assert len(device.sent) == 3
+
+    @pytest.mark.asyncio
+    async def test_bare_turn_on_never_skipped(self):
+        """It may have been turned off without anything noticing"""
+        device = FakeDevice()
+        await device.turn_on(brightness=80, colortemp=3000)
+        await device.turn_on()
+        assert len(device.sent) == 2
+        assert device.commands_skipped == 0
+
+    @pytest.mark.asyncio
+    async def test_forced_command_sent(self):
+        device = FakeDevice()
+        await device.turn_on(colortemp=3000)
+        await device.turn_on(colortemp=3010, force=True)
+        assert len(device.sent) == 2
+        assert device.commands_skipped == 0
+
+    @pytest.mark.asyncio
+    async def test_turn_off_invalidates(self):
+        device = FakeDevice()
+        await device.turn_on(colortemp=3000)
+        await device.turn_off()
+        await device.turn_on(colortemp=3000)
+        assert device.sent == [(None, device.temp_to_rgb(3000)), "off", (None, device.temp_to_rgb(3000))]
+
+    @pytest.mark.asyncio
+    async def test_external_change_invalidates(self):
+        device = FakeDevice()
+        await device.turn_on(brightness=50, colortemp=3000)
+        device.state = ObservedState(True, 51, time.monotonic())
+        await device.turn_on(brightness=50, colortemp=3000)
+        assert device.commands_skipped == 1
+
+        device.state = ObservedState(False, 0, time.monotonic())
+        await device.turn_on(brightness=50, colortemp=3000)
+        assert len(device.sent) == 2
+
+    def test_cache_outlasts_light_checks(self):
+        """The scheduler's repeated colourtemp checks would never be skipped otherwise"""
+        assert gbl.MAX_LIGHT_CHECK_INTERVAL.total_seconds() <= gbl.COMMAND_CACHE_MAX_AGE
+
+    @pytest.mark.asyncio
+    async def test_stale_command_resent(self, mocker: MockerFixture):
+        mocker.patch.object(gbl, "COMMAND_CACHE_MAX_AGE", -1)
+        device = FakeDevice()
+        await device.turn_on(colortemp=3000)
+        await device.turn_on(colortemp=3000)
+        assert len(device.sent) == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_command_not_cached(self):
+        device = FakeDevice()
+        device.reachable = False
+        await device.turn_on(colortemp=3000)
+        device.reachable = True
+        await device.turn_on(colortemp=3000)
+        assert len(device.sent) == 1
+        assert device.commands_skipped == 0
+
+    @pytest.mark.asyncio
+    async def test_disabled_device_not_cached(self, mocker: MockerFixture):
+        mocker.patch.object(FakeDevice, "enabled", new_callable=mocker.PropertyMock, return_value=False)
+        device = FakeDevice()
+        await device.turn_on(colortemp=3000)
+        await device.turn_on(colortemp=3000)
+        assert device.commands_skipped == 0
+
+    @pytest.mark.asyncio
+    async def test_skipped_through_all_objects(self, mocker: MockerFixture):
+        bulb, strip = FakeDevice(), FakeDevice()
+        mocker.patch("wrappers.all.pool.get", side_effect=lambda cls: bulb if cls is Bulb else strip)
+        mocker.patch("wrappers.all.mutable_globals", use_bulb=True, use_wled=True)
+        lights = AllObjects()
+        await lights.turn_on(colortemp=3000)
+        await lights.turn_on(colortemp=3000 + gbl.COMMAND_COLOURTEMP_TOLERANCE)
+        assert len(bulb.sent) == len(strip.sent) == 1
+        assert bulb.commands_skipped == strip.commands_skipped == 1
+        await bulb.actor.close()
+        await strip.actor.close()
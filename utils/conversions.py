@@ -1,11 +1,32 @@
 import math
+from array import array
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from functools import cache, lru_cache
 from typing import cast
 
 import global_vars as gbl
 from extra_types import RGBtype, RGBWWtype
 from utils.misc import clamp
 
-__all__ = ["rgb_to_hex", "hex_to_rgb", "temp_to_rgb", "rgb_to_temp", "temp_to_rgbww"]
+__all__ = [
+    "hex_to_rgb",
+    "rgb_to_hex",
+    "rgb_to_temp",
+    "temp_to_rgb",
+    "temp_to_rgb_many",
+    "temp_to_rgbww",
+    "temp_to_rgbww_many"
+]
+
+# colourtemps in this range (inclusive) are served from precomputed lookup tables
+TABLE_MIN_TEMP = 1_000
+TABLE_MAX_TEMP = 40_000
+
+# `rgb_to_temp` searches colourtemps in range(INVERSE_MIN_TEMP, INVERSE_MAX_TEMP)
+INVERSE_MIN_TEMP = 1_000
+INVERSE_MAX_TEMP = 10_000
+MAX_INVERSE_DISTANCE = 100.0 # any further than this gives dubious results
 
 def rgb_to_hex(rgb: RGBtype) -> str:
     return "{:02X}{:02X}{:02X}".format(*rgb)
@@ -23,12 +44,19 @@ def hex_to_rgb(hex_colour: str) -> RGBtype:
     return (r, g, b)
 
 
-def temp_to_rgb(temp: int|float) -> RGBtype:
-    """Convert color temperature in Kelvin to RGB values.
-    Input colourtemp should be between 1000 and 40000 Kelvin.
+def _table_index(temp: float) -> int | None:
+    """The index of `temp` in the lookup tables, or None if it isn't a whole number in range."""
+    try:
+        int_temp = int(temp)
+    except (OverflowError, ValueError): # inf or nan
+        return None
+    if int_temp != temp or not TABLE_MIN_TEMP <= int_temp <= TABLE_MAX_TEMP:
+        return None
+    return int_temp - TABLE_MIN_TEMP
 
-    Algorithm from [Tanner Helland](http://www.tannerhelland.com/4435/convert-temperature-rgb-algorithm-code/)
-    """
+
+def _calculate_rgb(temp: float) -> RGBtype:
+    """Algorithm from [Tanner Helland](http://www.tannerhelland.com/4435/convert-temperature-rgb-algorithm-code/)"""
     temp = cast(float, temp / 100)
 
     if temp <= 66:
@@ -51,11 +79,56 @@ def temp_to_rgb(temp: int|float) -> RGBtype:
     green = clamp(green, 0.0, 255.0)
     blue = clamp(blue, 0.0, 255.0)
 
-    return round(red), round(green), round(blue)  
+    return round(red), round(green), round(blue)
+
+
+@cache
+def _rgb_table() -> array:
+    """Packed (r, g, b) bytes for every whole colourtemp in the table range, built on first use."""
+    table = array("B")
+    for temp in range(TABLE_MIN_TEMP, TABLE_MAX_TEMP + 1):
+        table.extend(_calculate_rgb(temp))
+    return table
+
+
+def temp_to_rgb(temp: float) -> RGBtype:
+    """Convert color temperature in Kelvin to RGB values.
+    Input colourtemp should be between 1000 and 40000 Kelvin.
+
+    Whole-number colourtemps in that range are looked up from a precomputed table,
+    anything else is calculated directly.
+    """
+    index = _table_index(temp)
+    if index is None:
+        return _calculate_rgb(temp)
+    table = _rgb_table()
+    index *= 3
+    return table[index], table[index + 1], table[index + 2]
+
+@cache
+def _inverse_index() -> tuple[dict[RGBtype, int], list[int], list[tuple[RGBtype, int]]]:
+    """Index of the colours `temp_to_rgb` can produce, built on first use.
+
+    Returns:
+        The lowest colourtemp for each colour,
+        the green value of each colour in ascending order,
+        and the (colour, lowest colourtemp) pairs in the same order.
+    """
+    exact: dict[RGBtype, int] = {}
+    for temp in range(INVERSE_MIN_TEMP, INVERSE_MAX_TEMP):
+        exact.setdefault(temp_to_rgb(temp), temp)
+
+    by_green = sorted(exact.items(), key=lambda item: (item[0][1], item[1]))
+    greens = [rgb[1] for rgb, _ in by_green]
+    return exact, greens, by_green
+
 
 def rgb_to_temp(rgb_or_hex: RGBtype | str, approximate=True) -> int:
     """The reverse of `temp_to_rgb()`.
-    Brute forces the answer to avoid manual calculation.
+
+    Exact matches are a dictionary lookup. Approximate matches bisect on the green channel
+    and search outwards until the green difference alone is further than the best match,
+    so only nearby colours are compared.
 
     Args:
         rgb_or_hex (RGBtype | str): The color, as either an (r,g,b) tuple or hex string
@@ -65,24 +138,31 @@ def rgb_to_temp(rgb_or_hex: RGBtype | str, approximate=True) -> int:
         RuntimeError: If a temperature couldn't be found.
 
     Returns:
-        int: The colour temperature that matches the input value
+        int: The lowest colour temperature that matches the input value
     """
-    rgb_target = hex_to_rgb(rgb_or_hex) if isinstance(rgb_or_hex, str) else rgb_or_hex
+    rgb_target = hex_to_rgb(rgb_or_hex) if isinstance(rgb_or_hex, str) else tuple(rgb_or_hex)
+    exact, greens, by_green = _inverse_index()
 
-    best_dist = 100.0 # any further than this gives dubious results 
-    best_temp = None
-    for temp in range(1_000, 10_000):
-        rgb_current = temp_to_rgb(temp)
-        if rgb_current == rgb_target:
-            return temp
+    if rgb_target in exact:
+        return exact[rgb_target]
 
-        if not approximate:
-            continue
+    if not approximate:
+        raise RuntimeError(f"couldn't get temp for {rgb_or_hex}")
 
-        dist = math.dist(rgb_current, rgb_target)
-        if dist < best_dist:
-            best_dist = dist
-            best_temp = temp
+    green = rgb_target[1]
+    best_dist = MAX_INVERSE_DISTANCE
+    best_temp = None
+    start = bisect_left(greens, green)
+    for indices in (range(start, len(greens)), range(start - 1, -1, -1)):
+        for i in indices:
+            if abs(greens[i] - green) > best_dist:
+                break
+            rgb_current, temp = by_green[i]
+            dist = math.dist(rgb_current, rgb_target)
+            # ties go to the lowest colourtemp
+            if dist < best_dist or (dist == best_dist and best_temp is not None and temp < best_temp):
+                best_dist = dist
+                best_temp = temp
 
     if best_temp is not None:
         return best_temp
@@ -90,14 +170,11 @@ def rgb_to_temp(rgb_or_hex: RGBtype | str, approximate=True) -> int:
         raise RuntimeError(f"couldn't get temp for {rgb_or_hex}")
 
 
-def temp_to_rgbww(temp: int|float) -> RGBWWtype:
-    """
-    Converts Kelvin color temperature to a WiZ 5-tuple (R, G, B, CW, WW).
-    """
-    alpha = clamp((temp - gbl.MIN_COLORTEMP) / (gbl.MAX_COLORTEMP - gbl.MIN_COLORTEMP), 0.0, 1.0)
+def _calculate_rgbww(temp: float, min_temp: int, max_temp: int) -> RGBWWtype:
+    alpha = clamp((temp - min_temp) / (max_temp - min_temp), 0.0, 1.0)
     
     # High-CRI mode using white diodes only, for temp > 2200
-    if temp > gbl.MIN_COLORTEMP:
+    if temp > min_temp:
         cool_white = int(round(255 * alpha))
         warm_white = 255 - cool_white
         return (0, 0, 0, cool_white, warm_white)
@@ -111,4 +188,84 @@ def temp_to_rgbww(temp: int|float) -> RGBWWtype:
     cool_white = int(round(white * alpha))
     warm_white = white - cool_white
     
-    return (red, green, blue, cool_white, warm_white)
\ No newline at end of file
+    return (red, green, blue, cool_white, warm_white)
+
+
+@lru_cache(maxsize=1)
+def _rgbww_table(min_temp: int, max_temp: int) -> array:
+    """Packed (r, g, b, cw, ww) bytes for every whole colourtemp in the table range.
+    Keyed on the colourtemp limits so it's rebuilt if they change."""
+    table = array("B")
+    for temp in range(TABLE_MIN_TEMP, TABLE_MAX_TEMP + 1):
+        table.extend(_calculate_rgbww(temp, min_temp, max_temp))
+    return table
+
+
+def temp_to_rgbww(temp: float) -> RGBWWtype:
+    """
+    Converts Kelvin color temperature to a WiZ 5-tuple (R, G, B, CW, WW).
+    """
+    index = _table_index(temp)
+    if index is None:
+        return _calculate_rgbww(temp, gbl.MIN_COLORTEMP, gbl.MAX_COLORTEMP)
+    table = _rgbww_table(gbl.MIN_COLORTEMP, gbl.MAX_COLORTEMP)
+    index *= 5
+    return table[index], table[index + 1], table[index + 2], table[index + 3], table[index + 4]
+
+
+def _table_rows(table: array, width: int) -> list[bytes]:
+    """Split a packed table into one bytes object per colourtemp, for joining in the batch functions."""
+    packed = table.tobytes()
+    return [packed[i:i + width] for i in range(0, len(packed), width)]
+
+
+@cache
+def _rgb_rows() -> list[bytes]:
+    return _table_rows(_rgb_table(), 3)
+
+
+@lru_cache(maxsize=1)
+def _rgbww_rows(min_temp: int, max_temp: int) -> list[bytes]:
+    return _table_rows(_rgbww_table(min_temp, max_temp), 5)
+
+
+def _convert_many(
+        temps: Iterable[int|float], rows: list[bytes], calculate: Callable[[int|float], tuple[int, ...]]
+        ) -> array:
+    if hasattr(temps, "tolist"): # NumPy array, convert to python numbers in one go
+        temps = temps.tolist()
+
+    def convert(temp: float) -> bytes:
+        index = _table_index(temp)
+        return bytes(calculate(temp)) if index is None else rows[index]
+
+    # whole numbers in range are by far the most common, so check for them inline
+    return array("B", b"".join([
+        rows[temp - TABLE_MIN_TEMP]
+        if temp.__class__ is int and TABLE_MIN_TEMP <= temp <= TABLE_MAX_TEMP
+        else convert(temp)
+        for temp in temps
+    ]))
+
+
+def temp_to_rgb_many(temps: Iterable[int|float]) -> array:
+    """Batch version of `temp_to_rgb()`, for any sequence of colourtemps (including NumPy arrays).
+
+    Returns:
+        array: The packed channel values, 3 bytes per input in the order (r, g, b).
+        Use `numpy.frombuffer(ret, dtype=numpy.uint8).reshape(-1, 3)` to get one row per input.
+    """
+    return _convert_many(temps, _rgb_rows(), _calculate_rgb)
+
+
+def temp_to_rgbww_many(temps: Iterable[int|float]) -> array:
+    """Batch version of `temp_to_rgbww()`, for any sequence of colourtemps (including NumPy arrays).
+
+    Returns:
+        array: The packed channel values, 5 bytes per input in the order (r, g, b, cw, ww).
+        Use `numpy.frombuffer(ret, dtype=numpy.uint8).reshape(-1, 5)` to get one row per input.
+    """
+    min_temp, max_temp = gbl.MIN_COLORTEMP, gbl.MAX_COLORTEMP
+    return _convert_many(
+        temps, _rgbww_rows(min_temp, max_temp), lambda temp: _calculate_rgbww(temp, min_temp, max_temp)
+    )
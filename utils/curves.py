@@ -0,0 +1,118 @@
+from bisect import bisect_right
+from collections.abc import Iterable, Mapping
+from datetime import time
+from functools import lru_cache
+from numbers import Real
+from typing import Generic
+
+import global_vars as gbl
+from extra_types import WayPointType
+
+__all__ = ["WaypointCurve", "compile_waypoints", "time_curve", "time_to_seconds", "zenith_curve"]
+
+
+class WaypointCurve(Generic[WayPointType]):
+    """Piecewise-linear colourtemp curve, compiled once from a dictionary of waypoints.
+
+    Keys are the inputs (e.g. zenith in degrees) and values are the colourtemp at that input.
+    Inputs before the first waypoint or after the last are clamped to the first/ last colourtemp.
+
+    ```
+    curve = WaypointCurve({0.0: 6500, 90.0: 2700})
+    curve(45.0) # 4600
+    curve.many([0.0, 45.0, 90.0]) # [6500, 4600, 2700]
+    ```
+    """
+
+    def __init__(self, waypoints: Mapping[WayPointType, int]):
+        if not waypoints:
+            raise ValueError("waypoints must contain at least one entry")
+        try:
+            items = sorted(waypoints.items(), key=lambda item: item[0])
+        except TypeError as e:
+            raise ValueError(f"waypoint inputs must be comparable: {e}") from e
+        for waypoint, colourtemp in items:
+            if isinstance(colourtemp, bool) or not isinstance(colourtemp, Real) or colourtemp <= 0:
+                raise ValueError(f"invalid colourtemp {colourtemp!r} for waypoint {waypoint!r}")
+
+        self.inputs: list[WayPointType] = [waypoint for waypoint, _ in items]
+        self.colourtemps: list[int] = [colourtemp for _, colourtemp in items]
+
+    def __call__(self, waypoint: WayPointType) -> int:
+        """The colourtemp for a given input"""
+        i = bisect_right(self.inputs, waypoint)
+        if i == 0:
+            return self.colourtemps[0]
+        if i == len(self.inputs):
+            return self.colourtemps[-1]
+
+        waypoint_1, waypoint_2 = self.inputs[i - 1], self.inputs[i]
+        colourtemp_1, colourtemp_2 = self.colourtemps[i - 1], self.colourtemps[i]
+        factor = (waypoint - waypoint_1) / (waypoint_2 - waypoint_1)
+        return round(colourtemp_1 + factor * (colourtemp_2 - colourtemp_1))
+
+    def many(self, waypoints: Iterable[WayPointType]) -> list[int]:
+        """The colourtemp for each of the given inputs"""
+        return [self(waypoint) for waypoint in waypoints]
+
+    def next_change(self, waypoint: WayPointType, tolerance: float) -> WayPointType | None:
+        """The first input after `waypoint` where the colourtemp has moved at least `tolerance` Kelvin
+        away from the colourtemp at `waypoint`, or None if that never happens.
+
+        Solved directly from the line segments, so flat stretches of the curve are skipped in one step.
+        """
+        if tolerance <= 0:
+            raise ValueError("tolerance must be positive")
+        current = self(waypoint)
+        targets = (current - tolerance, current + tolerance)
+
+        for i in range(max(bisect_right(self.inputs, waypoint), 1), len(self.inputs)):
+            waypoint_1, waypoint_2 = self.inputs[i - 1], self.inputs[i]
+            colourtemp_1, colourtemp_2 = self.colourtemps[i - 1], self.colourtemps[i]
+            if colourtemp_1 == colourtemp_2:
+                continue
+
+            crossings = []
+            for target in targets:
+                factor = (target - colourtemp_1) / (colourtemp_2 - colourtemp_1)
+                if 0 <= factor <= 1:
+                    crossing = waypoint_1 + factor * (waypoint_2 - waypoint_1)
+                    if crossing > waypoint:
+                        crossings.append(crossing)
+            if crossings:
+                return min(crossings)
+        return None
+
+    def __repr__(self) -> str:
+        return f"WaypointCurve({dict(zip(self.inputs, self.colourtemps, strict=True))})"
+
+
+def time_to_seconds(t: time) -> int:
+    """Converts a datetime.time object into total seconds since midnight."""
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+@lru_cache(maxsize=8)
+def _compile(items: tuple) -> WaypointCurve:
+    return WaypointCurve(dict(items))
+
+
+@lru_cache(maxsize=2)
+def _compile_time(items: tuple[tuple[time, int], ...]) -> WaypointCurve[int]:
+    return WaypointCurve({time_to_seconds(t): colourtemp for t, colourtemp in items})
+
+
+def compile_waypoints(waypoints: Mapping[WayPointType, int]) -> WaypointCurve[WayPointType]:
+    """The compiled curve for `waypoints`.
+    Curves are cached on the waypoints' contents, so they're rebuilt when the waypoints change."""
+    return _compile(tuple(waypoints.items()))
+
+
+def time_curve() -> WaypointCurve[int]:
+    """Curve for `gbl.TIME_WAYPOINTS`, taking seconds since midnight as input"""
+    return _compile_time(tuple(gbl.TIME_WAYPOINTS.items()))
+
+
+def zenith_curve() -> WaypointCurve[float]:
+    """Curve for `gbl.ZENITH_WAYPOINTS`, taking the solar zenith in degrees as input"""
+    return compile_waypoints(gbl.ZENITH_WAYPOINTS)
@@ -0,0 +1,108 @@
+import math
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import yaml
+from pydantic import ValidationError
+
+from extra_types import DeviceInfo
+from utils.files import FileSignature, file_signature
+from utils.get_logger import get_logger
+
+__all__ = ["ALL_DEVICES", "OBJECTS_FILE", "DeviceRegistry", "get_registry"]
+
+logger = get_logger(__name__)
+
+OBJECTS_FILE = Path(__file__).parents[1] / "objects.yaml"
+ALL_DEVICES = "all"
+CHECK_INTERVAL = 5.0 # seconds between checking whether the file has changed
+
+
+class DeviceRegistry:
+    """The devices in `objects.yaml`, parsed and validated into `DeviceInfo` records keyed by name.
+
+    The file is only re-parsed when it changes, and it's checked for changes
+    at most once every `check_interval` seconds, so most lookups don't touch the disk at all.
+    """
+
+    def __init__(self, file: Path = OBJECTS_FILE, check_interval: float = CHECK_INTERVAL):
+        self.file = file
+        self.check_interval = check_interval
+        self._devices: dict[str, DeviceInfo] = {}
+        self._signature: FileSignature | None = None
+        self._last_check = -math.inf
+
+    def _parse(self) -> dict[str, DeviceInfo]:
+        with open(self.file) as f:
+            entries = yaml.safe_load(f) or {}
+        return {name: DeviceInfo(name=name, **entry) for name, entry in entries.items()}
+
+    def reload(self):
+        """Re-parse the file now. If it has become invalid, the previous devices are kept"""
+        self._last_check = time.monotonic()
+        signature = file_signature(self.file)
+        try:
+            devices = self._parse()
+        except (OSError, yaml.YAMLError, ValidationError, TypeError) as e:
+            if self._signature is None: # never loaded successfully
+                raise
+            logger.error("couldn't reload %s, keeping previous devices: %s", self.file.name, e)
+            return
+        self._devices = devices
+        self._signature = signature
+
+    @property
+    def devices(self) -> dict[str, DeviceInfo]:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self._last_check = time.monotonic()
+            if self._signature is None or file_signature(self.file) != self._signature:
+                self.reload()
+        return self._devices
+
+    def __getitem__(self, name: str) -> DeviceInfo:
+        return self.devices[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.devices
+
+    def __iter__(self) -> Iterator[DeviceInfo]:
+        return iter(self.devices.values())
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def by_type(self, device_type: str) -> list[DeviceInfo]:
+        return [device for device in self if device.device_type == device_type]
+
+    def by_class(self, device_class: str) -> list[DeviceInfo]:
+        return [device for device in self if device.device_class == device_class]
+
+    def group(self, name: str) -> list[DeviceInfo]:
+        """Devices in the room or group called `name`. `all` is every device"""
+        if name == ALL_DEVICES:
+            return list(self)
+        return [device for device in self if device.room == name or name in device.groups]
+
+    @property
+    def group_names(self) -> set[str]:
+        names = {ALL_DEVICES}
+        for device in self:
+            if device.room is not None:
+                names.add(device.room)
+            names.update(device.groups)
+        return names
+
+    def __repr__(self) -> str:
+        return f"DeviceRegistry({self.file}): {list(self.devices)}"
+
+
+_registries: dict[Path, DeviceRegistry] = {}
+
+
+def get_registry(file: str | Path = OBJECTS_FILE) -> DeviceRegistry:
+    """The shared registry for `file`"""
+    path = Path(file).resolve()
+    if path not in _registries:
+        _registries[path] = DeviceRegistry(path)
+    return _registries[path]
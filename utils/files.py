@@ -0,0 +1,29 @@
+import os
+import tempfile
+from pathlib import Path
+
+FileSignature = tuple[int, int, int, int]
+
+def file_signature(file: Path) -> FileSignature | None:
+    """Cheap fingerprint of a file's identity and contents, for noticing when it's been replaced or edited.
+    Returns None if the file doesn't exist."""
+    try:
+        stat = file.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_dev, stat.st_mtime_ns, stat.st_size
+
+
+def atomic_write_text(file: Path, text: str):
+    """Write `text` to a temporary file next to `file`, then rename it over `file`.
+    Readers see either the old contents or the new, never a partial write."""
+    fd, tmp_name = tempfile.mkstemp(dir=file.parent, prefix=f".{file.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        Path(tmp_name).replace(file)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
@@ -1,10 +1,16 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 import global_vars as gbl
 
 MAX_LOG_SIZE_BYTES = 1024 * 1024 # 1 MB
+LOG_FILE = Path(__file__).parent.parent / "log.txt"
+
+_queue_handler: QueueHandler | None = None
+_listener: QueueListener | None = None
 
 def namer(default_name: str) -> str:
     """By default, `RotatingFileHandler` creates logs of the form `log.txt.1`.
@@ -16,6 +22,38 @@ def namer(default_name: str) -> str:
     new_name = f"{base_file.stem}_{index}{base_file.suffix}"
     return str(default_path.parent / new_name)
 
+def file_handler(log_file: Path = LOG_FILE) -> RotatingFileHandler:
+    handler = RotatingFileHandler(log_file, maxBytes=MAX_LOG_SIZE_BYTES, backupCount=2)
+    handler.namer = namer
+    formatter = logging.Formatter("%(asctime)s %(levelname)s - %(message)s", datefmt="%H:%M:%S")
+    handler.setFormatter(formatter)
+    return handler
+
+def get_queue_handler() -> QueueHandler:
+    """The handler shared by every logger, created on first use.
+
+    Logging calls only put the record on a queue; a single background thread
+    formats the records, writes them to the log file and rotates it.
+    """
+    global _queue_handler, _listener
+    if _queue_handler is None:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = QueueListener(log_queue, file_handler(LOG_FILE), respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        _queue_handler = QueueHandler(log_queue)
+    return _queue_handler
+
+def stop_logging():
+    """Write out any queued records and stop the background thread"""
+    global _queue_handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    _queue_handler = None
+    _listener = None
+
 def get_logger(name: str, level=None) -> logging.Logger:
     if level is None:
         level = gbl.LOG_LEVEL
@@ -23,16 +61,9 @@ def get_logger(name: str, level=None) -> logging.Logger:
         raise ValueError(f"Invalid log level: {level}")
     level_int = logging._nameToLevel[level.upper()]
 
-    log_file = Path(__file__).parent.parent / "log.txt"
-    handler = RotatingFileHandler(log_file, maxBytes=MAX_LOG_SIZE_BYTES, backupCount=2)
-    handler.setLevel(level_int)
-    handler.namer = namer
-    formatter = logging.Formatter("%(asctime)s %(levelname)s - %(message)s", datefmt="%H:%M:%S")
-    handler.setFormatter(formatter)
-
     logger = logging.getLogger(name)
     logger.handlers.clear()
     logger.setLevel(level_int)
-    logger.addHandler(handler)
+    logger.addHandler(get_queue_handler())
 
     return logger
@@ -1,14 +1,26 @@
+import asyncio
 import json
+import threading
+from collections.abc import Awaitable, Callable, Iterator, MutableMapping
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Generic, MutableMapping, TypeVar
+from typing import (
+    Any,
+    Generic,
+    TypeVar,
+)
 
 from pydantic import BaseModel, ValidationError
 
 from extra_types import MutableGlobals
+from utils.files import FileSignature, atomic_write_text, file_signature
 from utils.get_logger import get_logger
 
 ModelType = TypeVar("ModelType", bound=BaseModel)
+ChangeCallback = Callable[[str, Any], Awaitable[None]]
+_MISSING = object()
+
 class JsonWrapper(MutableMapping, Generic[ModelType]):
     """Thin wrapper that gives access to a local JSON file in a pythonic way.
 
@@ -32,40 +44,94 @@ class JsonWrapper(MutableMapping, Generic[ModelType]):
     class MyPydanticModel(pydantic.BaseModel):
         some_bool: bool = pydantic.Field(default=...)
     ```
+
+    If `cached` is True, one validated snapshot of the file is kept in memory,
+    and it's only re-read when the file's inode, mtime or size changes (e.g. when another process edits it).
+
+    Writes replace the file atomically. Changes made inside `with wrapper.transaction():` are written together
+    once the block exits. If `write_delay` is set, changes are held in memory for that many seconds
+    and then written together, so rapid toggles cost one write (or none, if they cancel out).
+    Call `flush()` to write them early, e.g. on shutdown.
+
+    Components can `subscribe()` to a key to be called back on their event loop when its value changes,
+    either through this wrapper or (while `watch()` is running) through an edit to the file.
     """
     pydantic_model: type[ModelType]
 
-    def __init__(self, file: Path):
+    def __init__(self, file: Path, cached: bool = False, write_delay: float | None = None):
         if getattr(self, "pydantic_model", None) is None:
             raise ValueError("When subclassing you must assign to pydantic_model")
 
         self.file = file
+        self.cached = cached
+        self.write_delay = write_delay
         self.logger = get_logger(file.stem)
         self.default = self.pydantic_model.model_construct().model_dump()
+        self._snapshot: dict | None = None
+        self._signature: FileSignature | None = None
+
+        self._lock = threading.RLock()
+        self._pending: dict[str, Any] = {}
+        self._transaction_depth = 0
+        self._flush_timer: threading.Timer | None = None
+
+        self._subscribers: dict[str, list[tuple[ChangeCallback, asyncio.AbstractEventLoop]]] = {}
+        self._last_seen: dict[str, Any] = {}
+        self._callback_tasks: set[asyncio.Task] = set()
 
     @staticmethod
     def _format_iso(obj):
         return obj.isoformat() if isinstance(obj, datetime) else obj
 
+    def _write(self, d: dict):
+        atomic_write_text(self.file, json.dumps(d, indent=4, default=self._format_iso) + "\n")
+        self.invalidate()
+
     def write_default(self):
-        output = json.dumps(self.default, indent=4, default=self._format_iso)
-        self.logger.info("writing default values:\n%s", output)
-        self.file.write_text(output + "\n")
-        
-    @property
-    def data(self) -> dict:
+        self.logger.info("writing default values:\n%s", json.dumps(self.default, indent=4, default=self._format_iso))
+        self._write(self.default)
+
+    def _load(self) -> dict:
         try:
             ret = json.loads(self.file.read_text())
             self.pydantic_model.model_validate(ret)
         except (FileNotFoundError, ValidationError) as e:
             self.logger.error("Error loading %s: %s. Reverting to default.", self.file.name, e)
             self.write_default()
-            ret = self.default
+            ret = dict(self.default)
         return ret
 
+    def _read(self) -> dict:
+        """The contents of the file, without any pending changes"""
+        if not self.cached:
+            return self._load()
+
+        # taken before reading, so an edit made while reading is picked up next time
+        signature = file_signature(self.file)
+        if self._snapshot is None or signature is None or signature != self._signature:
+            self._snapshot = self._load()
+            self._signature = signature
+        return dict(self._snapshot)
+
+    @property
+    def data(self) -> dict:
+        with self._lock:
+            ret = self._read()
+            ret.update(self._pending)
+            return ret
+
     @data.setter
     def data(self, d):
-        self.file.write_text(json.dumps(d, indent=4, default=self._format_iso) + "\n")
+        with self._lock:
+            self._cancel_flush()
+            self._pending.clear()
+            self._write(d)
+        self._check_subscriptions()
+
+    def invalidate(self):
+        """Drop the cached snapshot, so the next read comes from the file"""
+        self._snapshot = None
+        self._signature = None
     
     def _get_var(self, key:str):
         ret = self.data[key]
@@ -73,9 +139,129 @@ class JsonWrapper(MutableMapping, Generic[ModelType]):
         return ret
     
     def _set_var(self, key:str, val):
-        data = self.data
-        data[key] = val
-        self.data = data
+        with self._lock:
+            self._pending[key] = val
+            if self._transaction_depth:
+                return
+            self._schedule_flush()
+        self._check_subscriptions()
+
+    def _schedule_flush(self):
+        if self.write_delay is None:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.write_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _cancel_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def flush(self):
+        """Write any pending changes to the file, in a single atomic write"""
+        with self._lock:
+            self._cancel_flush()
+            if self._transaction_depth or not self._pending:
+                return
+            on_disk = self._read()
+            data = on_disk | self._pending
+            self._pending.clear()
+            if data == on_disk:
+                self.logger.debug("pending changes to %s cancelled out, not writing", self.file.name)
+                return
+            self._write(data)
+
+    @contextmanager
+    def transaction(self) -> Iterator["JsonWrapper[ModelType]"]:
+        """Group changes so they're written to the file together when the block exits.
+        If the block raises, the changes made inside it are discarded."""
+        with self._lock:
+            self._transaction_depth += 1
+            saved = dict(self._pending)
+        try:
+            yield self
+        except BaseException:
+            with self._lock:
+                self._pending = saved
+            raise
+        finally:
+            with self._lock:
+                self._transaction_depth -= 1
+                finished = not self._transaction_depth
+                if finished and self._pending:
+                    self._schedule_flush()
+            if finished:
+                self._check_subscriptions()
+
+    def subscribe(self, key: str, callback: ChangeCallback, loop: asyncio.AbstractEventLoop | None = None):
+        """Call `await callback(key, new_value)` whenever the value of `key` changes.
+
+        Callbacks are run as tasks on `loop`, which defaults to the running event loop,
+        so they're safe to trigger from other threads (e.g. the delayed write).
+        """
+        if loop is None:
+            loop = asyncio.get_running_loop()
+        with self._lock:
+            if key not in self._subscribers:
+                self._last_seen[key] = self.data.get(key, _MISSING)
+            self._subscribers.setdefault(key, []).append((callback, loop))
+
+    def unsubscribe(self, key: str, callback: ChangeCallback):
+        with self._lock:
+            remaining = [(cb, loop) for cb, loop in self._subscribers.get(key, []) if cb != callback]
+            if remaining:
+                self._subscribers[key] = remaining
+            else:
+                self._subscribers.pop(key, None)
+                self._last_seen.pop(key, None)
+
+    def _check_subscriptions(self):
+        """Notify subscribers of any values that have changed since they were last checked"""
+        with self._lock:
+            if not self._subscribers:
+                return
+            data = self.data
+            changes = []
+            for key in self._subscribers:
+                value = data.get(key, _MISSING)
+                if value != self._last_seen[key]:
+                    self._last_seen[key] = value
+                    changes.append((key, value))
+            notifications = [
+                (callback, loop, key, value)
+                for key, value in changes
+                for callback, loop in self._subscribers[key]
+            ]
+
+        for callback, loop, key, value in notifications:
+            self.logger.debug("%s changed to %s, notifying %s", key, value, getattr(callback, "__name__", callback))
+            try:
+                loop.call_soon_threadsafe(self._run_callback, callback, key, value)
+            except RuntimeError: # loop is closed
+                self.logger.warning("event loop for %s subscriber is closed, unsubscribing", key)
+                self.unsubscribe(key, callback)
+
+    def _run_callback(self, callback: ChangeCallback, key: str, value):
+        task = asyncio.ensure_future(callback(key, value))
+        self._callback_tasks.add(task)
+        task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task):
+        self._callback_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("error in change subscriber: %s", task.exception())
+
+    async def watch(self, interval: float = 1.0):
+        """Check the file for external edits every `interval` seconds and notify subscribers. Runs until cancelled.
+        With `cached=True` each check is a single `stat()` unless the file has changed."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._check_subscriptions()
+            except Exception as e: # noqa: BLE001
+                self.logger.error("error checking %s for changes: %s", self.file.name, e)
     
     def __getitem__(self, key):
         return self._get_var(key)
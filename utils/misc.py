@@ -1,3 +1,4 @@
+import atexit
 from datetime import datetime, time, timedelta
 from pathlib import Path
 from typing import Callable, Mapping
@@ -7,12 +8,17 @@ import humanize
 
 import global_vars as gbl
 from extra_types import WayPointType
+from utils.curves import WaypointCurve, time_curve, time_to_seconds
 from utils.get_logger import get_logger
 from utils.json_wrapper import MutableGlobalsWrapper
+from utils.solar import DEFAULT_LOCATION, daily_schedule, sun_events
 
 logger = get_logger(__name__)
 
-mutable_globals = MutableGlobalsWrapper(Path(__file__).parent / "mutable_globals.json")
+mutable_globals = MutableGlobalsWrapper(
+    Path(__file__).parent / "mutable_globals.json", cached=True, write_delay=gbl.MUTABLE_GLOBALS_WRITE_DELAY
+)
+atexit.register(mutable_globals.flush)
 
 def format_time(t: datetime| timedelta | time) -> str:
     if isinstance(t, timedelta):
@@ -51,12 +57,13 @@ def config_to_bool_function(option: str|bool|int) -> Callable[[bool, str], bool]
 def clamp(value, min_value, max_value):
     return max(min_value, min(value, max_value))
 
-def get_zenith(location = astral.LocationInfo()) -> float:
+def get_zenith(location = DEFAULT_LOCATION) -> float:
     return astral.sun.zenith(location.observer)
 
 
 def lerp_color_temp(waypoint: WayPointType, waypoints_dict: Mapping[WayPointType, int]) -> int:
     """Linearly interpolates the colourtemp for a given input based on a dictionary of waypoints.
+    Prefer `utils.curves.compile_waypoints()` when using the same waypoints repeatedly.
 
     Args:
         waypoint: The input
@@ -65,41 +72,16 @@ def lerp_color_temp(waypoint: WayPointType, waypoints_dict: Mapping[WayPointType
     Returns:
         int: The desired colourtemp for the input
     """
-    waypoints = sorted(waypoints_dict.items(), key=lambda item: item[0])
-
-    if waypoint <= waypoints[0][0]:
-        return waypoints[0][1]
-    if waypoint >= waypoints[-1][0]:
-        return waypoints[-1][1]
-
-    for i in range(len(waypoints) - 1):
-        waypoint_1, colortemp_1 = waypoints[i]
-        waypoint_2, colortemp_2 = waypoints[i + 1]
-
-        if waypoint_1 <= waypoint <= waypoint_2:
-            factor = (waypoint - waypoint_1) / (waypoint_2 - waypoint_1)
-            return round(colortemp_1 + factor * (colortemp_2 - colortemp_1))
-    
-    raise RuntimeError("couldn't get colourtemp. There might be something wrong with the waypoints dict")
+    return WaypointCurve(waypoints_dict)(waypoint)
 
 
 def colourtemp_from_zenith() -> int:
-    zen = get_zenith()
-    waypoints = gbl.ZENITH_WAYPOINTS
-    return lerp_color_temp(zen, waypoints)
-
+    now = astral.now(DEFAULT_LOCATION.tzinfo)
+    return daily_schedule(now).colourtemp_at(now)
 
-def _time_to_seconds(t: time) -> int:
-    """Converts a datetime.time object into total seconds since midnight."""
-    return t.hour * 3600 + t.minute * 60 + t.second
 
 def colourtemp_from_time() -> int:
-    time_now = datetime.now().time()
-    seconds_now = _time_to_seconds(time_now)
-
-    waypoints = gbl.TIME_WAYPOINTS.items()
-    seconds_waypoints = { _time_to_seconds(t): temp for t, temp in waypoints }
-    return lerp_color_temp(seconds_now, seconds_waypoints)
+    return time_curve()(time_to_seconds(datetime.now().time()))
 
 
 # def get_colourtemp_for_time(location = astral.LocationInfo(), date=None) -> int:
@@ -118,11 +100,10 @@ def colourtemp_from_time() -> int:
 #         return gbl.SUNSET_COLOURTEMP
 
 class Sun:
-    def __init__(self, location = astral.LocationInfo(), date=None):
+    def __init__(self, location = DEFAULT_LOCATION, date=None):
         self.location = location
-        if date is None:
-            self.date = astral.today(location.tzinfo)
-        self.sun = astral.sun.sun(location.observer, date, tzinfo=location.tzinfo)
+        self.date = astral.today(location.tzinfo) if date is None else date
+        self.sun = sun_events(self.date, location)
 
     def __getattribute__(self, name: str):
         if name in {"dawn", "sunrise", "noon", "sunset", "dusk"}:
@@ -0,0 +1,100 @@
+from array import array
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+import astral
+import astral.sun
+
+from utils.curves import WaypointCurve, zenith_curve
+
+__all__ = ["DEFAULT_LOCATION", "ZenithSchedule", "daily_schedule", "sun_events"]
+
+DEFAULT_LOCATION = astral.LocationInfo()
+MINUTES_PER_DAY = 24 * 60
+
+
+class ZenithSchedule:
+    """Solar zenith and the resulting colourtemp, precomputed for every minute of one day.
+
+    Times are wall-clock times at the schedule's location,
+    so looking up "temperature at time T" is an index into a compact array.
+    """
+
+    def __init__(self, day: date, location: astral.LocationInfo = DEFAULT_LOCATION):
+        self.date = day
+        self.location = location
+        self.curve: WaypointCurve[float] = zenith_curve()
+
+        midnight = datetime.combine(day, time(), tzinfo=location.tzinfo)
+        # one extra sample for the following midnight, so the last minute can be interpolated
+        self.zeniths = array("f", (
+            astral.sun.zenith(location.observer, midnight + timedelta(minutes=minute))
+            for minute in range(MINUTES_PER_DAY + 1)
+        ))
+        self.colourtemps = array("H", self.curve.many(self.zeniths))
+
+    def _local_time(self, dt: datetime) -> time:
+        """Naive datetimes are assumed to already be in the location's timezone"""
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(self.location.tzinfo)
+        return dt.time()
+
+    def is_valid_for(self, dt: datetime, location: astral.LocationInfo) -> bool:
+        """Whether this schedule can answer for `dt` at `location`"""
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(location.tzinfo)
+        return dt.date() == self.date and location == self.location and zenith_curve() is self.curve
+
+    def zenith_at(self, dt: datetime) -> float:
+        t = self._local_time(dt)
+        return self.zeniths[t.hour * 60 + t.minute]
+
+    def colourtemp_at(self, dt: datetime) -> int:
+        """The colourtemp at `dt`, interpolated between the surrounding minutes"""
+        t = self._local_time(dt)
+        minute = t.hour * 60 + t.minute
+        colourtemp_1, colourtemp_2 = self.colourtemps[minute], self.colourtemps[minute + 1]
+        return round(colourtemp_1 + (colourtemp_2 - colourtemp_1) * t.second / 60)
+
+    def next_change(self, dt: datetime, tolerance: float) -> datetime | None:
+        """The first minute after `dt` where the colourtemp has moved at least `tolerance` Kelvin
+        away from the colourtemp at `dt`, or None if that doesn't happen before the end of the day."""
+        current = self.colourtemp_at(dt)
+        t = self._local_time(dt)
+        midnight = datetime.combine(self.date, time(), tzinfo=self.location.tzinfo)
+        for minute in range(t.hour * 60 + t.minute + 1, MINUTES_PER_DAY + 1):
+            if abs(self.colourtemps[minute] - current) >= tolerance:
+                return midnight + timedelta(minutes=minute)
+        return None
+
+    def __repr__(self) -> str:
+        return f"ZenithSchedule({self.date}, {self.location.name})"
+
+
+_schedule: ZenithSchedule | None = None
+
+
+def daily_schedule(now: datetime | None = None, location: astral.LocationInfo = DEFAULT_LOCATION) -> ZenithSchedule:
+    """The schedule for the day containing `now` (defaults to the current time at `location`).
+
+    Only one schedule is kept, and it's replaced when the day rolls over at midnight,
+    the location changes or `gbl.ZENITH_WAYPOINTS` changes.
+    """
+    global _schedule
+    if now is None:
+        now = astral.now(location.tzinfo)
+    if _schedule is None or not _schedule.is_valid_for(now, location):
+        day = now.astimezone(location.tzinfo).date() if now.tzinfo is not None else now.date()
+        _schedule = ZenithSchedule(day, location)
+    return _schedule
+
+
+@lru_cache(maxsize=8)
+def _sun_events(latitude: float, longitude: float, timezone: str, day: date) -> dict[str, datetime]:
+    location = astral.LocationInfo(timezone=timezone, latitude=latitude, longitude=longitude)
+    return astral.sun.sun(location.observer, day, tzinfo=location.tzinfo)
+
+
+def sun_events(day: date, location: astral.LocationInfo = DEFAULT_LOCATION) -> dict[str, datetime]:
+    """Dawn, sunrise, noon, sunset and dusk for `day`, computed once per day and location"""
+    return _sun_events(location.latitude, location.longitude, location.timezone, day)
@@ -0,0 +1,102 @@
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from extra_types import Info
+from utils.files import atomic_write_text
+from utils.get_logger import get_logger
+
+__all__ = ["Capabilities", "CapabilityCache", "capability_cache", "normalise_mac"]
+
+logger = get_logger(__name__)
+
+# runtime data, kept next to objects.yaml rather than in the package
+CAPABILITIES_FILE = Path(__file__).parents[1] / "WLED_capabilities.json"
+
+
+def normalise_mac(mac: str) -> str:
+    return mac.lower().replace(":", "")
+
+
+@dataclass
+class Capabilities:
+    """What a strip's firmware supports, which only changes when the firmware does"""
+    mac: str
+    vid: int
+    ver: str
+    effects: list[str]
+    palettes: list[str]
+    info: dict
+    effect_index: dict[str, int] = field(init=False, repr=False)
+    palette_index: dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.mac = normalise_mac(self.mac)
+        # names are looked up on every command, so index them rather than searching the lists.
+        # WLED lists some names more than once, in which case the first one wins, like list.index
+        self.effect_index = {name: i for i, name in reversed(list(enumerate(self.effects)))}
+        self.palette_index = {name: i for i, name in reversed(list(enumerate(self.palettes)))}
+
+    @classmethod
+    def from_info(cls, info: Info, effects: list[str], palettes: list[str]) -> "Capabilities":
+        return cls(
+            mac=info["mac"],
+            vid=info["vid"],
+            ver=info["ver"],
+            effects=effects,
+            palettes=palettes,
+            info=dict(info),
+        )
+
+    def matches(self, info: Info) -> bool:
+        """Whether these capabilities are still valid for a strip reporting `info`"""
+        return (
+            normalise_mac(info.get("mac", "")) == self.mac
+            and info.get("vid") == self.vid
+            and info.get("ver") == self.ver
+        )
+
+    def to_json(self) -> dict:
+        data = asdict(self)
+        del data["effect_index"], data["palette_index"]
+        return data
+
+
+class CapabilityCache:
+    """Capabilities of every strip seen so far, kept on disk and keyed by MAC address.
+
+    The file is read once, the first time it's needed, and rewritten whenever an entry changes.
+    """
+
+    def __init__(self, file: Path = CAPABILITIES_FILE):
+        self.file = file
+        self._entries: dict[str, Capabilities] | None = None
+
+    def _load(self) -> dict[str, Capabilities]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.file) as f:
+                    raw = json.load(f)
+                for mac, entry in raw.items():
+                    self._entries[mac] = Capabilities(**entry)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning("ignoring unreadable capability cache %s: %s", self.file.name, e)
+        return self._entries
+
+    def get(self, mac: str) -> Capabilities | None:
+        return self._load().get(normalise_mac(mac))
+
+    def put(self, capabilities: Capabilities):
+        entries = self._load()
+        entries[capabilities.mac] = capabilities
+        text = json.dumps({mac: entry.to_json() for mac, entry in entries.items()}, indent=2)
+        try:
+            atomic_write_text(self.file, text)
+        except OSError as e:
+            logger.warning("couldn't save capability cache %s: %s", self.file.name, e)
+
+
+capability_cache = CapabilityCache()
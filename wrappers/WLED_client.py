@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any
+
+import aiohttp
+
+import global_vars as gbl
+from utils.get_logger import get_logger
+from wrappers.base import FailedConnectionError
+
+logger = get_logger(__name__)
+
+
+class WLEDClient:
+    """asyncio client for one strip's JSON API.
+
+    The HTTP session, and so the TCP connection to the strip, is kept open between requests.
+    The strips only handle a few sockets at once, so requests to one strip go over a single
+    connection, one after another and in the order they were made.
+    Requests to different strips each have their own client and run concurrently.
+
+    A session belongs to the event loop that created it. Once the client is pinned to a loop
+    (the app's main loop), requests from other loops, such as requests handled on their own
+    threads, are passed over to it, so they all share the one session.
+    """
+
+    def __init__(self, url: str, timeout: float = gbl.WLED_TIMEOUT):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pinned: asyncio.AbstractEventLoop | None = None
+
+    def pin(self, loop: asyncio.AbstractEventLoop):
+        """Make every request from `loop`, whichever loop it's asked for from"""
+        self._pinned = loop
+
+    def _discard_session(self):
+        """Close the session on the loop it belongs to, which may be another thread's"""
+        session, loop = self._session, self._loop
+        self._session = None
+        self._loop = None
+        # a loop that has stopped can't run the close, so its session is dropped with it
+        if session is not None and not session.closed and loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        # a session can only be used from the loop that created it
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._discard_session()
+            connector = aiohttp.TCPConnector(limit_per_host=1)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"},
+            )
+            self._loop = loop
+        return self._session
+
+    async def request(self, method: str, endpoint: str = "", json_data: Any = None) -> dict:
+        if method.lower() not in {"get", "post"}:
+            raise ValueError(f"Unsupported HTTP method '{method}'")
+        home = self._pinned
+        if home is not None and home.is_running() and home is not asyncio.get_running_loop():
+            future = asyncio.run_coroutine_threadsafe(self._request(method, endpoint, json_data), home)
+            return await asyncio.wrap_future(future)
+        return await self._request(method, endpoint, json_data)
+
+    async def _request(self, method: str, endpoint: str, json_data: Any) -> dict:
+        url = self.url + endpoint.lstrip("/")
+        try:
+            async with self._get_session().request(method, url, json=json_data) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except aiohttp.ClientResponseError as e:
+            raise FailedConnectionError(f"{url} returned {e.status} {e.message}") from e
+        except (aiohttp.ClientError, TimeoutError) as e:
+            raise FailedConnectionError(f"couldn't reach {url}: {e!r}") from e
+
+    async def get(self, endpoint: str = "") -> dict:
+        return await self.request("get", endpoint)
+
+    async def post(self, endpoint: str = "", json_data: Any = None) -> dict:
+        return await self.request("post", endpoint, json_data)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._discard_session()
@@ -0,0 +1,169 @@
+import asyncio
+from collections.abc import Callable
+from typing import Self
+
+import global_vars as gbl
+from extra_types import RGBtype
+from utils.get_logger import get_logger
+from wrappers.WLED_wrapper import WLED
+
+__all__ = ["FrameRenderer", "WLEDRealtime"]
+
+logger = get_logger(__name__)
+
+REALTIME_PORT = 21324
+DRGB = 2
+DNRGB = 4
+DRGB_MAX_LEDS = 490
+DNRGB_MAX_LEDS = 489
+DEFAULT_FPS = 42
+
+# called once per frame with the pixel buffer (3 bytes per LED) and the frame number
+FrameRenderer = Callable[[memoryview, int], None]
+
+
+class WLEDRealtime:
+    """Streams per-LED frames to a strip over WLED's realtime UDP protocols.
+
+    Strips with up to 490 LEDs get one DRGB packet per frame; longer strips are split into
+    DNRGB packets, each carrying its start index. The packets are allocated once, and
+    `pixels` is a view of a single buffer that's copied into them, so sending a frame
+    allocates nothing.
+
+    The strip returns to normal operation `timeout` seconds after the last frame,
+    or straight away when the stream is stopped, after which JSON control works as usual.
+
+    ```
+    async with WLEDRealtime(wled) as stream:
+        await stream.run(lambda pixels, frame: ..., duration=10)
+    ```
+    """
+
+    def __init__(
+        self,
+        wled: WLED,
+        led_count: int | None = None,
+        fps: int | None = None,
+        timeout: int = gbl.WLED_REALTIME_TIMEOUT,
+        port: int = REALTIME_PORT,
+    ):
+        self.wled = wled
+        self.led_count = led_count
+        self.fps = fps
+        self.timeout = timeout
+        self.port = port
+        self._transport: asyncio.DatagramTransport | None = None
+        self._packets: list[tuple[bytearray, int, int]] = [] # (packet, first LED, end LED)
+        self._buffer = bytearray()
+        self.pixels = memoryview(self._buffer)
+        self._running = False
+
+    def _allocate(self, led_count: int):
+        self._buffer = bytearray(3 * led_count)
+        self.pixels = memoryview(self._buffer)
+        self._packets = []
+        wait = min(self.timeout, 255) # 255 would mean "never time out"
+        if led_count <= DRGB_MAX_LEDS:
+            packet = bytearray(2 + 3 * led_count)
+            packet[0:2] = bytes((DRGB, wait))
+            self._packets.append((packet, 0, led_count))
+            return
+        for start in range(0, led_count, DNRGB_MAX_LEDS):
+            end = min(start + DNRGB_MAX_LEDS, led_count)
+            packet = bytearray(4 + 3 * (end - start))
+            packet[0:4] = bytes((DNRGB, wait, start >> 8, start & 0xFF))
+            self._packets.append((packet, start, end))
+
+    @property
+    def is_streaming(self) -> bool:
+        return self._transport is not None
+
+    async def start(self):
+        """Open the UDP socket, reading the LED count and fps from the strip if they weren't given"""
+        if self.led_count is None:
+            info = await self.wled.get_info()
+            self.led_count = info["leds"]["count"]
+        if self.fps is None:
+            config = await self.wled.get_config()
+            self.fps = config.get("hw", {}).get("led", {}).get("fps") or DEFAULT_FPS
+        assert self.led_count is not None
+        self._allocate(self.led_count)
+
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(self.wled.host, self.port)
+        )
+        self._transport = transport
+        self.wled.invalidate_commanded()
+        logger.debug("streaming %d LEDs to %s at %d fps", self.led_count, self.wled.host, self.fps)
+
+    def fill(self, rgb: RGBtype):
+        if not self._buffer:
+            return
+        pixels = self.pixels
+        pixels[0], pixels[1], pixels[2] = rgb
+        filled, total = 3, len(pixels)
+        while filled < total: # double the filled part each time
+            size = min(filled, total - filled)
+            pixels[filled: filled + size] = pixels[:size]
+            filled += size
+
+    def set_pixel(self, index: int, rgb: RGBtype):
+        self.pixels[3 * index], self.pixels[3 * index + 1], self.pixels[3 * index + 2] = rgb
+
+    def send(self):
+        """Send the current contents of `pixels`"""
+        if self._transport is None:
+            raise RuntimeError("stream hasn't been started")
+        pixels = self.pixels
+        for packet, start, end in self._packets:
+            header = len(packet) - 3 * (end - start)
+            packet[header:] = pixels[3 * start: 3 * end]
+            self._transport.sendto(packet)
+
+    async def run(self, render: FrameRenderer, duration: float | None = None):
+        """Render and send frames at `fps` until `duration` seconds have passed or `stop` is called.
+
+        Each frame is scheduled from the start time rather than the previous frame, so timing
+        doesn't drift; if rendering falls more than a frame behind, the missed frames are dropped.
+        """
+        if self._transport is None:
+            await self.start()
+        assert self.fps is not None
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.fps
+        start = next_frame = loop.time()
+        end = None if duration is None else start + duration
+        frame = 0
+        self._running = True
+        try:
+            while self._running and (end is None or next_frame < end):
+                render(self.pixels, frame)
+                self.send()
+                frame += 1
+                next_frame += interval
+                now = loop.time()
+                if now - next_frame > interval:
+                    next_frame = now
+                await asyncio.sleep(max(next_frame - now, 0))
+        finally:
+            self._running = False
+
+    async def stop(self):
+        """Stop streaming and hand the strip back to JSON control"""
+        self._running = False
+        if self._transport is None:
+            return
+        self._transport.close()
+        self._transport = None
+        try:
+            await self.wled.set_state(live=False)
+        except Exception as e: # noqa: BLE001
+            logger.warning("couldn't end realtime mode, the strip will time out after %ds: %s", self.timeout, e)
+
+    async def __aenter__(self) -> Self:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
@@ -1,17 +1,124 @@
 import asyncio
+import math
+import time
 from typing import Optional
 
 import requests
 
-from extra_types import ColourType, RGBtype, RGBWtype, WLEDResponse
+import global_vars as gbl
+from extra_types import ColourType, Info, RGBtype, RGBWtype, State, WLEDResponse
+from utils.device_registry import get_registry
 from utils.get_logger import get_logger
 from utils.misc import clamp, mutable_globals
-from wrappers.base import WrapperBase
+from wrappers.base import (
+    CommandedState,
+    FailedConnectionError,
+    ObservedState,
+    WrapperBase,
+)
+from wrappers.WLED_capabilities import Capabilities, capability_cache, normalise_mac
+from wrappers.WLED_client import WLEDClient
 
 TOGGLE = "t"
 
+
+class WLEDStateBuilder:
+    """Collects changes to a strip's state, so they can be sent as a single request.
+
+    ```
+    await wled.compose().on().brightness(50).colour((255, 0, 0)).effect("Solid").commit()
+    ```
+    """
+
+    def __init__(self, wled: "WLED"):
+        self.wled = wled
+        self._state: dict = {}
+        self._segment: dict = {}
+        self._effect: int | str | None = None
+        self._palette: int | str | None = None
+
+    def on(self, value: bool | str = True) -> "WLEDStateBuilder":
+        self._state["on"] = value
+        return self
+
+    def off(self) -> "WLEDStateBuilder":
+        return self.on(False)
+
+    def toggle(self) -> "WLEDStateBuilder":
+        return self.on(TOGGLE)
+
+    def brightness(self, value: int) -> "WLEDStateBuilder":
+        self._state["bri"] = self.wled.clamp_brightness(value)
+        return self
+
+    def colour(self, colours: RGBtype | list[RGBtype]) -> "WLEDStateBuilder":
+        self._segment["col"] = self.wled._colour_list(colours)
+        return self
+
+    def effect(self, effect: int | str) -> "WLEDStateBuilder":
+        """An effect index, or the name of one in the strip's effects list"""
+        self._effect = effect
+        return self
+
+    def palette(self, palette: int | str) -> "WLEDStateBuilder":
+        """A palette index, or the name of one in the strip's palettes list"""
+        self._palette = palette
+        return self
+
+    def transition(self, seconds: float) -> "WLEDStateBuilder":
+        """How long the strip should take to fade to the new state. Only applies to this change"""
+        self._state["tt"] = clamp(round(seconds * 10), 0, 65535) # in units of 100ms, up to the most WLED accepts
+        return self
+
+    @property
+    def needs_capabilities(self) -> bool:
+        """Whether the strip's capabilities are needed to resolve an effect or palette name"""
+        return isinstance(self._effect, str) or isinstance(self._palette, str)
+
+    @staticmethod
+    def _resolve(value: int | str, index: dict[str, int] | None, kind: str) -> int:
+        if not isinstance(value, str):
+            return value
+        if index is None:
+            raise ValueError(f"the strip's capabilities are needed to look up a {kind} by name")
+        try:
+            return index[value]
+        except KeyError:
+            raise ValueError(f"{kind.capitalize()} '{value}' not found") from None
+
+    def to_json(self, capabilities: Capabilities | None = None) -> dict:
+        """The merged state document. `capabilities` is required if an effect or palette was given by name"""
+        state = dict(self._state)
+        segment = dict(self._segment)
+        if self._effect is not None:
+            index = capabilities.effect_index if capabilities else None
+            segment["fx"] = self._resolve(self._effect, index, "effect")
+        if self._palette is not None:
+            index = capabilities.palette_index if capabilities else None
+            segment["pal"] = self._resolve(self._palette, index, "palette")
+        if segment:
+            state["seg"] = [segment]
+        return state
+
+    async def commit(self) -> dict:
+        """Send every change in one request"""
+        capabilities = await self.wled.get_capabilities() if self.needs_capabilities else None
+        return await self.wled.set_state(**self.to_json(capabilities))
+
+    def commit_sync(self) -> dict:
+        capabilities = self.wled.capabilities if self.needs_capabilities else None
+        return self.wled._set(**self.to_json(capabilities))
+
+    def __bool__(self) -> bool:
+        return bool(self._state or self._segment or self._effect is not None or self._palette is not None)
+
+    def __repr__(self) -> str:
+        return f"WLEDStateBuilder({self._state}, seg={self._segment}, fx={self._effect!r}, pal={self._palette!r})"
+
 class WLED(WrapperBase):
     STRIP_NAME = "fairy_lights"
+    DEFAULT_NAME = STRIP_NAME
+    NATIVE_FADE = True
     logger = get_logger(__name__)
 
     @property
@@ -19,34 +126,196 @@ class WLED(WrapperBase):
         return "WLED"
 
     def __init__(self, ip:Optional[str]=None, **kwargs):
-        if not mutable_globals.use_wled:
-            return
         if ip is None:
-            self.url = self.from_yaml(self.STRIP_NAME).url
-        else:
-            self.url = f"http://{ip.rstrip('/')}/json/"
+            device = get_registry()[self.STRIP_NAME]
+            ip = device.ip
+            kwargs.setdefault("mac", device.mac)
+        self.url = f"http://{ip.rstrip('/')}/json/"
+        self.host = ip.rstrip('/').split(":")[0]
+        self.expected_mac: str | None = kwargs.get("mac")
 
+        self.client = WLEDClient(self.url)
+        # only used by the synchronous properties and setters below
         self._session = requests.Session()
         self._session.headers.update({'Content-Type': 'application/json'})
 
-        info = self.info
-        self._effects = info["effects"]
+        # from the on-disk cache if this strip has been seen before, otherwise fetched when first needed.
+        # Either way, nothing is requested here
+        self._capabilities = capability_cache.get(self.expected_mac) if self.expected_mac else None
+        self._revalidation: asyncio.Task | None = None
+        self._revalidate_delay = gbl.WLED_REVALIDATE_BASE_DELAY
+        self._revalidate_after = -math.inf # time.monotonic() before which the capabilities aren't checked again
+        self._mac_checked = False
 
+        # the strip's last known state, updated by every state change we send
+        self.state_ttl = gbl.WLED_STATE_TTL
+        self._state: State | None = None
+        self._state_time = -math.inf
+
+    def _check_mac(self, info: Info):
+        if self.expected_mac is None or self._mac_checked:
+            return
+        self._mac_checked = True
         try:
-            if "mac" in kwargs:
-                expected_mac = kwargs["mac"]
-                assert isinstance(expected_mac, str), "MAC address must be a string"
-                expected_mac = expected_mac.lower().replace(":", "")
-                actual_mac = info["info"]["mac"].lower().replace(":", "")
-                if expected_mac != actual_mac:
-                    self.logger.warning("MAC address mismatch: expected %s but got %s", expected_mac, actual_mac)
+            assert isinstance(self.expected_mac, str), "MAC address must be a string"
+            expected_mac = normalise_mac(self.expected_mac)
+            actual_mac = normalise_mac(info["mac"])
+            if expected_mac != actual_mac:
+                self.logger.warning("MAC address mismatch: expected %s but got %s", expected_mac, actual_mac)
         except KeyError as e:
             self.logger.error("Couldn't verify MAC address; '%s' field missing in WLED response", e)
 
+    @property
+    def capabilities(self) -> Capabilities:
+        if self._capabilities is None:
+            self._fetch_info()
+        assert self._capabilities is not None
+        return self._capabilities
+
+    @property
+    def effects(self) -> list[str]:
+        return self.capabilities.effects
+
+    def _store_capabilities(self, capabilities: Capabilities):
+        self._capabilities = capabilities
+        capability_cache.put(capabilities)
+
+    def _check_firmware(self, info: Info):
+        """If the strip reports different firmware from the cached capabilities' (e.g. it's been updated),
+        have them checked the next time they're used rather than at the next periodic check"""
+        if self._capabilities is not None and not self._capabilities.matches(info):
+            self._revalidate_after = -math.inf
+
+    @property
+    def _state_endpoint(self) -> str:
+        """Where to send state requests. Until the strip's MAC has been checked, they go to "si",
+        which replies with the strip's info as well as its state"""
+        return "state" if self.expected_mac is None or self._mac_checked else "si"
+
+    def _store_state(self, response: dict) -> dict:
+        """Cache the state the strip sent back, or forget the cached state if it didn't send one.
+        Returns the state, without the info block if the reply had one"""
+        if "info" in response:
+            self._check_mac(response["info"])
+            self._check_firmware(response["info"])
+        response = response.get("state", response)
+        if "on" in response and "seg" in response:
+            self._state = response # type: ignore[assignment]
+            self._state_time = time.monotonic()
+        else:
+            self.invalidate()
+        return response
+
+    def invalidate(self):
+        """Forget the cached state, so the next read fetches it from the strip"""
+        self._state = None
+
+    @property
+    def _state_is_fresh(self) -> bool:
+        return self._state is not None and time.monotonic() - self._state_time < self.state_ttl
+
+    def observed_state(self) -> ObservedState | None:
+        if self._state is None:
+            return None
+        return ObservedState(bool(self._state.get("on")), self._state.get("bri"), self._state_time)
+
+    def pin(self, loop: asyncio.AbstractEventLoop) -> None:
+        super().pin(loop)
+        # reads too, so they share the commands' connection rather than opening one per request
+        self.client.pin(loop)
+
+    async def close(self):
+        if self._revalidation is not None:
+            self._revalidation.cancel()
+        await self.client.close()
+        self._session.close()
+
+    # asynchronous API, used by the async methods so a slow strip doesn't block the event loop
+
+    async def get_info(self) -> Info:
+        info: Info = await self.client.get("info") # type: ignore[assignment]
+        self._check_mac(info)
+        self._check_firmware(info)
+        return info
+
+    async def get_config(self) -> dict:
+        return await self.client.get("cfg")
+
+    async def get_capabilities(self) -> Capabilities:
+        """The strip's effects, palettes and info. When they come from the cache,
+        they're checked against the strip in the background the first time they're used,
+        then every WLED_REVALIDATE_INTERVAL, or sooner if the strip reports different firmware.
+        A check that fails is retried with a growing delay"""
+        if self._capabilities is None:
+            return await self.revalidate()
+        if self._revalidation is None and time.monotonic() >= self._revalidate_after:
+            self._revalidation = asyncio.create_task(self._revalidate_in_background())
+        return self._capabilities
+
+    async def revalidate(self) -> Capabilities:
+        """Fetch the effects and palettes again if the strip's firmware has changed since they were cached"""
+        info = await self.get_info()
+        if self._capabilities is not None and self._capabilities.matches(info):
+            return self._capabilities
+        self.logger.info("fetching capabilities for WLED %s (version %s)", self.host, info.get("ver"))
+        effects, palettes = await asyncio.gather(self.client.get("eff"), self.client.get("pal"))
+        self._store_capabilities(Capabilities.from_info(info, effects, palettes)) # type: ignore[arg-type]
+        assert self._capabilities is not None
+        return self._capabilities
+
+    async def _revalidate_in_background(self):
+        try:
+            await self.revalidate()
+        except Exception as e: # noqa: BLE001
+            self.logger.warning(
+                "couldn't revalidate WLED capabilities, will retry in %.0fs: %s", self._revalidate_delay, e
+            )
+            self._revalidate_after = time.monotonic() + self._revalidate_delay
+            self._revalidate_delay = min(self._revalidate_delay * 2, gbl.WLED_REVALIDATE_MAX_DELAY)
+        else:
+            self._revalidate_after = time.monotonic() + gbl.WLED_REVALIDATE_INTERVAL
+            self._revalidate_delay = gbl.WLED_REVALIDATE_BASE_DELAY
+        finally:
+            self._revalidation = None
+
+    async def get_effects(self) -> list[str]:
+        return (await self.get_capabilities()).effects
+
+    async def get_state(self) -> State:
+        """The strip's state, from the cache if it's younger than `state_ttl` seconds"""
+        if self._state_is_fresh:
+            assert self._state is not None
+            return self._state
+        return await self.refresh()
+
+    async def refresh(self) -> State:
+        """Fetch the strip's state, bypassing the cache"""
+        return self._store_state(await self.client.get(self._state_endpoint)) # type: ignore[return-value]
+
+    def compose(self) -> WLEDStateBuilder:
+        """Start building a change to the strip's state, to be sent with `commit()`"""
+        return WLEDStateBuilder(self)
+
+    async def set_state(self, **kwargs) -> dict:
+        self.invalidate_commanded() # turn_on remembers its own command once this returns
+        # "v" makes the strip reply with its new state, which keeps the cache current for free
+        return self._store_state(await self.client.post(self._state_endpoint, json_data={**kwargs, "v": True}))
+
+    async def set_segment(self, **kwargs) -> dict:
+        return await self.set_state(seg=[kwargs])
+
+    async def set_colour(self, colours: RGBtype | list[RGBtype]):
+        await self.set_segment(col=self._colour_list(colours))
+
+    async def set_brightness(self, value: int):
+        await self.set_state(bri=self.clamp_brightness(value))
+
+    # synchronous compatibility layer, for scripts and the REPL
 
     def _request(self, method:str, endpoint="", **kwargs) -> dict:
         if method.lower() not in {"get", "post"}:
             raise ValueError(f"Unsupported HTTP method '{method}'")
+        kwargs.setdefault("timeout", gbl.WLED_TIMEOUT)
         result = self._session.request(method, self.url + endpoint.lstrip('/'), **kwargs)
         result.raise_for_status()
         return result.json()
@@ -57,8 +326,15 @@ class WLED(WrapperBase):
     def _post(self, endpoint="", json_data=None) -> dict:
         return self._request("post", endpoint, json=json_data)
     
-    def _set(self, **kwargs):
-        self._post("", json_data=kwargs)
+    def _set(self, **kwargs) -> dict:
+        self.invalidate_commanded()
+        return self._store_state(self._post("state", json_data={**kwargs, "v": True}))
+
+    def _get_state(self) -> State:
+        if not self._state_is_fresh:
+            self._store_state(self._get("state"))
+        assert self._state is not None
+        return self._state
 
     @property
     def config(self) -> dict:
@@ -66,62 +342,114 @@ class WLED(WrapperBase):
 
     @property
     def info(self) -> WLEDResponse:
-        return self._get() # type: ignore[return-value]
+        """Everything the strip reports, including the effects and palettes lists"""
+        return self._fetch_info()
+
+    def _fetch_info(self) -> WLEDResponse:
+        """Fetch everything the strip reports, caching its capabilities and state on the way"""
+        info: WLEDResponse = self._get() # type: ignore[assignment]
+        self._check_mac(info["info"])
+        if self._capabilities is None or not self._capabilities.matches(info["info"]):
+            self._store_capabilities(Capabilities.from_info(info["info"], info["effects"], info["palettes"]))
+        self._store_state(info["state"]) # type: ignore[arg-type]
+        return info
 
     @property
     async def is_on(self) -> bool:
-        state = self.info.get("state", {})
+        state = await self.get_state()
         return state.get("on", False)
     
+    @property
+    def enabled(self) -> bool:
+        return mutable_globals.use_wled
+
     async def _turn_on(self, brightness: Optional[int], rgb: ColourType):
         if not mutable_globals.use_wled:
             self.logger.debug("not turning on WLED due to global setting")
             return
         
+        state = self.compose().on()
         if rgb is not None:
             if len(rgb) > 3:
                 rgb = rgb[:3] # ignore white channels
-            self.colour = [rgb]
+            state.colour([rgb])
         if brightness is not None:
-            self.brightness = brightness
-        self._set(on=True)
+            state.brightness(brightness)
+        await state.commit()
     
+    async def fade(
+        self,
+        brightness: int | None = None,
+        colortemp: int | None = None,
+        duration: float = 0.0,
+        start: tuple[int, int] | None = None,
+        ) -> bool:
+        """Fades using the strip's own transitions, so it takes one request to set `start`,
+        if it's given, and one for the fade. Returns once the strip has started fading"""
+        if not mutable_globals.use_wled:
+            self.logger.debug("not fading WLED due to global setting")
+            return False
+        self._desire(CommandedState(brightness, None, colortemp, time.monotonic()))
+        if not self.breaker.allow():
+            self.logger.debug("%s isn't responding, not sending fade", self.OBJECT_TYPE)
+            return False
+        try:
+            if start is not None:
+                await self._levels(*start).transition(0).commit()
+            await self._levels(brightness, colortemp).transition(duration).commit()
+        except asyncio.CancelledError:
+            self._failed()
+            raise
+        except Exception as e: # noqa: BLE001
+            self.logger.error("couldn't fade %s: %s", self.OBJECT_TYPE, e)
+            self._failed()
+            return False
+        self._succeeded()
+        self.last_accessed = time.time()
+        return True
+
+    def _levels(self, brightness: int | None, colortemp: int | None) -> WLEDStateBuilder:
+        state = self.compose().on()
+        if brightness is not None:
+            state.brightness(brightness)
+        if colortemp is not None:
+            state.colour([self.temp_to_rgb(colortemp)[:3]]) # type: ignore[list-item]
+        return state
+
     async def _turn_off(self):
         if not mutable_globals.use_wled:
             self.logger.debug("not turning off WLED due to global setting")
             return
         
-        self._set(on=False)
+        await self.set_state(on=False)
         
     async def toggle(self): 
         if not mutable_globals.use_wled:
             self.logger.debug("not toggling WLED due to global setting")
             return
 
-        self._set(on=TOGGLE)
+        await self.set_state(on=TOGGLE)
 
     def _set_seg(self, **kwargs):
         self._set(seg= [kwargs])
 
     def _get_seg(self):
-        return self.info["state"]["seg"][0]
+        return self._get_state()["seg"][0]
     
     def set_effect(self, effect: int | str):
-        if isinstance(effect, str):
-            try:
-                effect_index = self._effects.index(effect)
-            except ValueError:
-                self.logger.error("Effect '%s' not found", effect)
-                return
-        else:
-            effect_index = effect
-        self._set_seg(fx=effect_index)
+        try:
+            self.compose().effect(effect).commit_sync()
+        except ValueError as e:
+            self.logger.error("%s", e)
 
-    
     def set_solid(self, colour: RGBtype | None = None):
-        self.set_effect("Solid")
+        state = self.compose().effect("Solid")
         if colour is not None:
-            self.colour = [colour]
+            state.colour([colour])
+        try:
+            state.commit_sync()
+        except ValueError as e:
+            self.logger.error("%s", e)
 
     @property
     def colour(self) -> list[RGBtype | RGBWtype]:
@@ -130,16 +458,20 @@ class WLED(WrapperBase):
     
     @colour.setter
     def colour(self, colours: RGBtype | list[RGBtype]):
+        self._set_seg(col=self._colour_list(colours))
+
+    @staticmethod
+    def _colour_list(colours: RGBtype | list[RGBtype]) -> list:
         if all(isinstance(c, int) for c in colours):
-            self._set_seg(col=[colours])
-        elif all(isinstance(c, list) for c in colours):
-            self._set_seg(col=colours)
+            return [colours]
+        elif all(isinstance(c, (list, tuple)) for c in colours):
+            return list(colours)
         else:
             raise ValueError("Colours must be a list of integers or a list of list of integers")
         
     @property
     def brightness(self) -> int:
-        return self.info["state"]["bri"]
+        return self._get_state()["bri"]
     
     @brightness.setter
     def brightness(self, value: int):
@@ -153,9 +485,9 @@ class WLED(WrapperBase):
     @property
     async def is_connected(self) -> bool:
         try:
-            self.info
+            await self.refresh()
             return True
-        except requests.exceptions.ConnectionError:
+        except FailedConnectionError:
             return False
 
 
@@ -0,0 +1,245 @@
+import asyncio
+import contextlib
+import threading
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+import global_vars as gbl
+from utils.get_logger import get_logger
+
+if TYPE_CHECKING:
+    from wrappers.base import WrapperBase
+
+__all__ = ["DeviceActor"]
+
+logger = get_logger(__name__)
+
+TURN_ON = "turn_on"
+TURN_OFF = "turn_off"
+CALL = "call"
+
+
+def _merge(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    """`turn_on` arguments with the same effect as `old` followed by `new`"""
+    merged = dict(old)
+    if new.get("rgb") is not None or new.get("colortemp") is not None:
+        merged.pop("rgb", None)
+        merged.pop("colortemp", None)
+    merged.update(new)
+    return merged
+
+
+@dataclass
+class _Command:
+    kind: str
+    kwargs: dict[str, Any] = field(default_factory=dict)
+    call: Callable[[], Awaitable[Any]] | None = None
+    futures: list[asyncio.Future] = field(default_factory=list)
+
+    def absorb(self, newer: "_Command") -> bool:
+        """Fold `newer` into this command if it supersedes it, so only the end result is sent"""
+        if self.kind == CALL or newer.kind == CALL:
+            return False
+        if newer.kind == TURN_OFF or self.kind == TURN_OFF:
+            self.kind, self.kwargs = newer.kind, newer.kwargs
+        else:
+            self.kwargs = _merge(self.kwargs, newer.kwargs)
+        self.futures.extend(newer.futures)
+        return True
+
+    def settle(self, result: Any = None, error: BaseException | None = None):
+        """Tell everyone waiting on the command how it went"""
+        for future in self.futures:
+            if future.done(): # the caller gave up waiting
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+
+    async def execute(self, device: "WrapperBase") -> Any:
+        if self.kind == TURN_ON:
+            return await device.turn_on(**self.kwargs)
+        if self.kind == TURN_OFF:
+            return await device.turn_off()
+        assert self.call is not None
+        return await self.call()
+
+
+class DeviceActor:
+    """Sends one device's commands one at a time, in the order they were asked for.
+
+    Commands wait in a mailbox of up to `maxsize` entries; callers wait for space when it's
+    full. A `turn_on` or `turn_off` that arrives while the previous one is still waiting
+    replaces it, so after a burst of changes only the latest state is sent, and everyone
+    who asked is told once that's done. Each call can be awaited until the command has been
+    sent, or given `wait=False` to return as soon as it's in the mailbox.
+
+    The actor runs on the loop it's pinned to with `pin`, normally the app's main loop, and
+    commands from other loops (e.g. requests handled on their own threads) are passed over
+    to it. An actor that isn't pinned lives on the event loop that first uses it. Commands
+    run by the actor mustn't go through the actor themselves, or they'd wait on themselves.
+
+    ```
+    await bulb.actor.turn_on(brightness=50)
+    await bulb.actor.turn_on(colortemp=2700, wait=False)
+    ```
+    """
+
+    def __init__(self, device: "WrapperBase", maxsize: int = gbl.ACTOR_MAILBOX_SIZE):
+        if maxsize < 1:
+            raise ValueError("the mailbox must hold at least one command")
+        self.device = device
+        self.maxsize = maxsize
+        self.sent = 0 # commands sent to the device
+        self.coalesced = 0 # commands folded into a later one instead of being sent
+        self._lock = threading.Lock()
+        self._pinned: asyncio.AbstractEventLoop | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._mailbox: deque[_Command] = deque()
+        self._changed: asyncio.Condition | None = None
+
+    def __len__(self) -> int:
+        """Commands waiting to be sent"""
+        return len(self._mailbox)
+
+    def pin(self, loop: asyncio.AbstractEventLoop):
+        """Run on `loop` from now on, whichever loop the commands come from"""
+        with self._lock:
+            self._pinned = loop
+
+    def _home(self) -> asyncio.AbstractEventLoop:
+        """The loop the actor runs on: the one it's pinned to, or else the current loop if
+        it isn't running anywhere"""
+        with self._lock:
+            pinned = self._pinned
+            if pinned is not None and not pinned.is_closed():
+                if self._loop is not pinned:
+                    self._move_to(pinned) # started by the first command that reaches it
+                return pinned
+            loop = self._loop
+            stopped = self._task is None or self._task.done()
+            if stopped or loop is None or loop.is_closed() or not loop.is_running():
+                loop = asyncio.get_running_loop()
+                self._move_to(loop)
+                self._task = loop.create_task(self._run())
+            return loop
+
+    def _move_to(self, loop: asyncio.AbstractEventLoop):
+        old_task = self._task
+        if old_task is not None and not old_task.done() and not old_task.get_loop().is_closed():
+            old_task.get_loop().call_soon_threadsafe(old_task.cancel)
+        self._loop = loop
+        # whatever was waiting on the old loop went with it
+        self._mailbox = deque()
+        self._changed = asyncio.Condition()
+        self._task = None
+
+    async def _enqueue(self, command: _Command) -> asyncio.Future:
+        assert self._changed is not None
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        command.futures.append(future)
+        async with self._changed:
+            while True:
+                if self._mailbox and self._mailbox[-1].absorb(command):
+                    self.coalesced += 1
+                    break
+                if len(self._mailbox) < self.maxsize:
+                    self._mailbox.append(command)
+                    self._changed.notify_all()
+                    break
+                await self._changed.wait()
+        return future
+
+    async def _enqueue_and_wait(self, command: _Command) -> Any:
+        return await (await self._enqueue(command))
+
+    async def _submit(self, command: _Command, wait: bool) -> Any:
+        home = self._home()
+        if home is asyncio.get_running_loop():
+            future = await self._enqueue(command)
+            if wait:
+                return await future
+            future.add_done_callback(self._log_failure)
+            return None
+
+        enqueue = self._enqueue_and_wait(command) if wait else self._enqueue(command)
+        result = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(enqueue, home))
+        if wait:
+            return result
+        home.call_soon_threadsafe(result.add_done_callback, self._log_failure)
+        return None
+
+    def _log_failure(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("command to %s failed: %s", self.device.OBJECT_TYPE, future.exception())
+
+    async def _run(self):
+        assert self._changed is not None
+        while True:
+            async with self._changed:
+                while not self._mailbox:
+                    await self._changed.wait()
+                command = self._mailbox.popleft()
+                self._changed.notify_all()
+            try:
+                result = await command.execute(self.device)
+            except asyncio.CancelledError:
+                command.cancel()
+                raise
+            except Exception as e: # noqa: BLE001
+                command.settle(error=e)
+            else:
+                command.settle(result)
+            self.sent += 1
+
+    async def turn_on(
+        self,
+        brightness: int | None = None,
+        rgb: Any = None,
+        colortemp: int | None = None,
+        force: bool = False,
+        wait: bool = True,
+        ) -> None:
+        kwargs = {"brightness": brightness, "rgb": rgb, "colortemp": colortemp}
+        # only what was asked for, so a later command can fill in the rest
+        kwargs = {key: value for key, value in kwargs.items() if value is not None}
+        if force:
+            kwargs["force"] = True
+        await self._submit(_Command(TURN_ON, kwargs), wait)
+
+    async def turn_off(self, wait: bool = True) -> None:
+        await self._submit(_Command(TURN_OFF), wait)
+
+    async def run(self, call: Callable[[], Awaitable[Any]], wait: bool = True) -> Any:
+        """Run `call` in turn with the device's other commands. It's never coalesced"""
+        return await self._submit(_Command(CALL, call=call), wait)
+
+    def _cancel_pending(self):
+        for command in self._mailbox:
+            command.cancel()
+        self._mailbox.clear()
+
+    async def close(self):
+        """Stop the actor, cancelling anything still waiting to be sent"""
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return
+        loop = task.get_loop()
+        if loop is not asyncio.get_running_loop():
+            loop.call_soon_threadsafe(self._cancel_pending)
+            loop.call_soon_threadsafe(task.cancel)
+            return
+        self._cancel_pending()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
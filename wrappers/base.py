@@ -1,13 +1,17 @@
+import asyncio
 import time
 from abc import ABCMeta, abstractmethod
 from pathlib import Path
-from typing import Optional
-
-import yaml
+from typing import NamedTuple, Optional
 
+import global_vars as gbl
 from extra_types import ColourType, RGBtype, RGBWWtype
 from utils.conversions import temp_to_rgb
+from utils.device_registry import OBJECTS_FILE, get_registry
 from utils.get_logger import get_logger
+from wrappers.actor import DeviceActor
+from wrappers.breaker import CircuitBreaker
+from wrappers.transition import ObservedState, Transition
 
 
 class FailedConnectionError(Exception):
@@ -31,8 +35,27 @@ def ignore_failed_connection(func):
 
 
 
+class CommandedState(NamedTuple):
+    """What a device was last told to do by `turn_on`, with None for anything left as it was"""
+    brightness: int | None
+    rgb: ColourType
+    colortemp: int | None
+    time: float # time.monotonic() when it was sent
+
+
 class WrapperBase(metaclass=ABCMeta):
     logger = get_logger(__name__)
+    healthy = True # False once a command has failed, so the pool knows to replace the instance
+    DEFAULT_NAME: str | None = None # the device in objects.yaml used when no address is given
+    FADE_INTERVAL = gbl.TRANSITION_INTERVAL # seconds between frames when a fade has to be sent from here
+    NATIVE_FADE = False # whether the device can do a whole fade from one command
+    commands_skipped = 0 # turn_on calls that weren't sent because the device was already in that state
+    _commanded: CommandedState | None = None
+    # what the device should be showing, kept while it's unreachable so it can be put back
+    _desired: CommandedState | None = None
+    _desired_on: bool | None = None
+    _breaker: CircuitBreaker | None = None
+    _actor: DeviceActor | None = None
     
     @property
     @abstractmethod
@@ -45,43 +68,202 @@ class WrapperBase(metaclass=ABCMeta):
         pass
 
     @classmethod
-    def from_yaml(cls, name: str, yaml_file:str|Path = Path(__file__).parents[1] / "objects.yaml"):
-        with open(yaml_file) as f:
-            bulbs = yaml.safe_load(f)
-            bulb_info:dict = bulbs[name]
-            return cls(
-                ip=bulb_info["ip"],
-                port=bulb_info.get("port", 38899),
-                mac=bulb_info["mac"],
-            )
+    def from_yaml(cls, name: str, yaml_file:str | Path | None = None):
+        device = get_registry(yaml_file or OBJECTS_FILE)[name]
+        return cls(
+            ip=device.ip,
+            port=device.port,
+            mac=device.mac,
+        )
 
     @ignore_failed_connection
     async def turn_on(
         self,
         brightness: Optional[int] = None,
         rgb: ColourType = None,
-        colortemp: Optional[int] = None
+        colortemp: Optional[int] = None,
+        force: bool = False,
         ) -> None:
-        if colortemp is not None:
-            if rgb is not None:
-                raise ValueError("cannot provide both rgb and colortemp")
-            rgb=self.temp_to_rgb(colortemp)        
+        """Turn the device on, changing whichever of brightness and colour are given.
+        Skipped if it would make no visible difference to the last command, unless `force` is set"""
+        if colortemp is not None and rgb is not None:
+            raise ValueError("cannot provide both rgb and colortemp")
+        command = CommandedState(brightness, tuple(rgb) if rgb is not None else None, colortemp, time.monotonic()) # type: ignore[arg-type]
+        if not force and self._is_redundant(command):
+            self.commands_skipped += 1
+            self.logger.debug(
+                "%s is already at %s, skipping turn_on (%d skipped so far)",
+                self.OBJECT_TYPE, self._commanded, self.commands_skipped
+            )
+            return
+        self._desire(command)
+        if not self.breaker.allow():
+            self.logger.debug("%s isn't responding, not sending turn_on", self.OBJECT_TYPE)
+            return
+        if self.breaker.probing and self._desired is not None:
+            # the first command through after an outage puts back everything asked for while it was down
+            command = self._desired._replace(time=command.time)
+        rgb = command.rgb if command.colortemp is None else self.temp_to_rgb(command.colortemp)
         try:
-            await self._turn_on(brightness, rgb)
+            await self._turn_on(command.brightness, rgb)
+        except asyncio.CancelledError:
+            self._failed()
+            raise
         except Exception as e: # noqa: BLE001
             self.logger.error("couldn't turn on %s: %s", self.OBJECT_TYPE, e)
+            self._failed()
+        else:
+            self._succeeded()
+            if self.enabled:
+                self._remember(command)
         self.last_accessed = time.time()
 
+    def pin(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Talk to the device from `loop`, the app's main loop, whichever loop a call comes from"""
+        self.actor.pin(loop)
+
+    @property
+    def actor(self) -> DeviceActor:
+        """Sends the device's commands one at a time, coalescing any that pile up.
+        Use this rather than calling `turn_on` and `turn_off` directly wherever commands can overlap"""
+        if self._actor is None:
+            self._actor = DeviceActor(self)
+        return self._actor
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        if self._breaker is None:
+            self._breaker = CircuitBreaker(self.OBJECT_TYPE)
+        return self._breaker
+
+    def _succeeded(self) -> None:
+        self.healthy = True
+        self.breaker.record_success()
+
+    def _failed(self) -> None:
+        self.healthy = False
+        self.invalidate_commanded()
+        self.breaker.record_failure()
+
+    def _desire(self, command: CommandedState) -> None:
+        self._desired = self._merged(self._desired if self._desired_on else None, command)
+        self._desired_on = True
+
+    async def probe(self) -> bool:
+        """Check on a device that stopped responding, if a check is due, and put it back
+        to the state it was last asked for if it's come back. Returns whether it's responding"""
+        if not self.breaker.is_open:
+            return True
+        if not self.breaker.allow():
+            return False
+        try:
+            reachable = await self.is_connected
+        except asyncio.CancelledError:
+            self.breaker.record_failure()
+            raise
+        except Exception: # noqa: BLE001
+            reachable = False
+        if not reachable:
+            self.breaker.record_failure()
+            return False
+        self._succeeded()
+        await self._reapply()
+        return True
+
+    async def _reapply(self) -> None:
+        if self._desired_on is False:
+            await self.actor.turn_off()
+        elif self._desired_on and self._desired is not None:
+            desired = self._desired
+            await self.actor.turn_on(brightness=desired.brightness, rgb=desired.rgb, colortemp=desired.colortemp)
+
+    def inherit(self, old: "WrapperBase") -> None:
+        """Carry over what `old`, an instance for the same device, knew about its connection
+        and what it should be showing, so a replacement doesn't start from scratch"""
+        self._breaker = old._breaker
+        self._desired = old._desired
+        self._desired_on = old._desired_on
+        self.commands_skipped = old.commands_skipped
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the device is switched on in the settings, so commands actually reach it"""
+        return True
+
+    def invalidate_commanded(self) -> None:
+        """Forget what the device was last told to do, so the next `turn_on` is sent whatever it is.
+        Anything that changes the device other than `turn_on` should call this"""
+        self._commanded = None
+
+    def _remember(self, command: CommandedState) -> None:
+        self._commanded = self._merged(self._commanded, command)
+
+    @staticmethod
+    def _merged(last: CommandedState | None, command: CommandedState) -> CommandedState:
+        """`command`, with anything it leaves as it was filled in from `last`"""
+        if last is not None:
+            if command.brightness is None:
+                command = command._replace(brightness=last.brightness)
+            if command.rgb is None and command.colortemp is None:
+                command = command._replace(rgb=last.rgb, colortemp=last.colortemp)
+        return command
+
+    def _changed_externally(self, last: CommandedState) -> bool:
+        observed = self.observed_state()
+        if observed is None or observed.time <= last.time:
+            return False
+        if not observed.on:
+            return True
+        return (
+            observed.brightness is not None and last.brightness is not None
+            and abs(observed.brightness - last.brightness) > gbl.COMMAND_BRIGHTNESS_TOLERANCE
+        )
+
+    def _is_redundant(self, command: CommandedState) -> bool:
+        """Whether `command` wouldn't visibly change anything since the last one sent"""
+        last = self._commanded
+        if last is None:
+            return False
+        if command.brightness is None and command.rgb is None and command.colortemp is None:
+            # it's only being made sure it's on, which it may not be if it was turned off unnoticed
+            return False
+        if command.time - last.time > gbl.COMMAND_CACHE_MAX_AGE:
+            return False
+        if self._changed_externally(last):
+            self.logger.debug("%s was changed by something else, forgetting its last command", self.OBJECT_TYPE)
+            self.invalidate_commanded()
+            return False
+        if command.brightness is not None and (
+            last.brightness is None or abs(command.brightness - last.brightness) > gbl.COMMAND_BRIGHTNESS_TOLERANCE
+        ):
+            return False
+        if command.colortemp is not None and (
+            last.colortemp is None or abs(command.colortemp - last.colortemp) > gbl.COMMAND_COLOURTEMP_TOLERANCE
+        ):
+            return False
+        return command.rgb is None or command.rgb == last.rgb
+
     @abstractmethod
     async def _turn_on(self, brightness: Optional[int], rgb: ColourType) -> None:
         pass
 
     async def turn_off(self) -> None:
+        self.invalidate_commanded()
+        self._desired_on = False
+        if not self.breaker.allow():
+            self.logger.debug("%s isn't responding, not sending turn_off", self.OBJECT_TYPE)
+            return
         try:
             await self._turn_off()
-            self.last_accessed = time.time()
+        except asyncio.CancelledError:
+            self._failed()
+            raise
         except Exception as e: # noqa: BLE001
             self.logger.error("couldn't turn off %s: %s", self.OBJECT_TYPE, e)
+            self._failed()
+        else:
+            self._succeeded()
+            self.last_accessed = time.time()
 
     @abstractmethod
     async def _turn_off(self) -> None:
@@ -91,6 +273,44 @@ class WrapperBase(metaclass=ABCMeta):
     async def toggle(self) -> None:
         pass
 
+    async def fade(
+        self,
+        brightness: int | None = None,
+        colortemp: int | None = None,
+        duration: float = 0.0,
+        start: tuple[int, int] | None = None,
+        ) -> bool:
+        """Fade to `brightness` and `colortemp` over `duration` seconds, leaving out either to keep it as it is.
+
+        The fade starts from `start`, a (brightness, colortemp) pair, or from the device's current levels.
+        Devices that can fade by themselves override this to send a single command; for the rest
+        the frames are sent from here by a `Transition`. Returns whether the fade ran to the end,
+        or for a device fading by itself, whether it accepted the fade.
+        """
+        if start is None:
+            start = await self.current_levels()
+        if start is None or duration <= 0:
+            # nothing to fade from, so go straight to the end
+            await self.actor.turn_on(brightness=brightness, colortemp=colortemp)
+            return self.healthy
+        end = (
+            start[0] if brightness is None else brightness,
+            start[1] if colortemp is None else colortemp,
+        )
+        result = await Transition(self, start, end, duration, interval=self.FADE_INTERVAL).run()
+        return result.completed
+
+    async def current_levels(self) -> tuple[int, int] | None:
+        """The device's (brightness, colortemp) if it's on and they're known, for fades to start from"""
+        return None
+
+    def observed_state(self) -> ObservedState | None:
+        """The state the device last reported, without making a request, or None if it isn't known"""
+        return None
+
+    async def close(self) -> None:
+        """Release any connections held by the device"""
+
     @property
     @abstractmethod
     async def is_on(self) -> bool:
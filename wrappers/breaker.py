@@ -0,0 +1,92 @@
+import time
+from collections.abc import Callable
+
+import global_vars as gbl
+from utils.get_logger import get_logger
+
+__all__ = ["CircuitBreaker"]
+
+logger = get_logger(__name__)
+
+
+class CircuitBreaker:
+    """Stops commands being sent to a device that isn't responding, so they fail straight away
+    instead of each waiting out a timeout.
+
+    After `threshold` failures in a row the breaker opens, and commands are refused. Once
+    `base_delay` seconds have passed, one command (or `WrapperBase.probe`) is let through to
+    see whether the device is back. If it fails, the wait doubles, up to `max_delay`;
+    if it succeeds, the breaker closes and the recovery callbacks are called.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        threshold: int = gbl.BREAKER_FAILURE_THRESHOLD,
+        base_delay: float = gbl.BREAKER_BASE_DELAY,
+        max_delay: float = gbl.BREAKER_MAX_DELAY,
+    ):
+        self.name = name
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self.delay = base_delay
+        self.next_probe = 0.0 # time.monotonic() after which a probe is let through
+        self.opened_at: float | None = None
+        self.probing = False
+        self._listeners: list[Callable[[], object]] = []
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.threshold
+
+    def allow(self) -> bool:
+        """Whether a command should be sent. While the breaker is open, this lets through one
+        probe each time one is due, which must be followed by `record_success` or `record_failure`"""
+        if not self.is_open:
+            return True
+        if self.probing or time.monotonic() < self.next_probe:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self) -> bool:
+        """Close the breaker. Returns whether it was open, i.e. the device has just come back"""
+        recovered = self.is_open
+        if recovered:
+            down_for = time.monotonic() - (self.opened_at or 0.0)
+            logger.info("%s is responding again, after %.0fs", self.name, down_for)
+        self.failures = 0
+        self.delay = self.base_delay
+        self.opened_at = None
+        self.probing = False
+        if recovered:
+            for callback in self._listeners:
+                try:
+                    callback()
+                except Exception as e: # noqa: BLE001
+                    logger.error("error in recovery callback for %s: %s", self.name, e)
+        return recovered
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        if self.probing:
+            self.delay = min(self.delay * 2, self.max_delay)
+            self.probing = False
+        self.failures += 1
+        if not self.is_open:
+            return
+        if self.opened_at is None:
+            self.opened_at = now
+            logger.warning("%s isn't responding, failing its commands fast until it's back", self.name)
+        self.next_probe = now + self.delay
+        logger.debug("next check on %s in %.0fs", self.name, self.delay)
+
+    def on_recover(self, callback: Callable[[], object]) -> None:
+        """Call `callback` whenever the device comes back after the breaker opened"""
+        self._listeners.append(callback)
+
+    def __repr__(self) -> str:
+        state = "open" if self.is_open else "closed"
+        return f"CircuitBreaker({self.name!r}, {state}, failures={self.failures})"
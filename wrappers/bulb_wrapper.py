@@ -1,9 +1,8 @@
-import asyncio
-import operator
+import math
 import sys
 import time
 from pathlib import Path
-from typing import Iterator, Optional
+from typing import Optional
 
 from pywizlight import (  # type: ignore[import-untyped]
     PilotBuilder,
@@ -15,25 +14,26 @@ from pywizlight.exceptions import (
     WizLightConnectionError,  # type: ignore[import-untyped]
 )
 
+import global_vars as gbl
 from utils.conversions import temp_to_rgbww
 from utils.get_logger import get_logger
 from utils.misc import clamp, mutable_globals
 
 sys.path.append(str(Path(__file__).parent))
 from extra_types import ColourType, RGBtype, RGBWWtype, SceneType
-from wrappers.base import WrapperBase
+from wrappers.base import ObservedState, WrapperBase
+from wrappers.transition import Transition, get_fractional_range  # noqa: F401
 
 del wizlight.__del__
 
 
-SCALING_FACTOR = 1_000_000
-
-
 class Bulb(WrapperBase):
     MIN_COLORTEMP = 2200
     MAX_COLORTEMP = 6500
     TIME_STEP = 0.25 # seconds per linear interpolation step
+    FADE_INTERVAL = gbl.BULB_FADE_INTERVAL
     BULB_NAME = "bedroom_light"
+    DEFAULT_NAME = BULB_NAME
 
     @property
     def OBJECT_TYPE(self):
@@ -57,6 +57,13 @@ class Bulb(WrapperBase):
 
         self.last_accessed = time.time()
 
+        # kept up to date by the bulb's push updates, once they've been started
+        self.state_max_age = gbl.BULB_STATE_MAX_AGE
+        self._state: PilotParser | None = None
+        self._state_time = -math.inf
+        self._push_attempted = False
+        self.push_running = False
+
     async def _turn_off(self):
         if not mutable_globals.use_bulb:
             self.logger.debug("not turning off bulb due to global setting")
@@ -64,12 +71,16 @@ class Bulb(WrapperBase):
 
         await self.light.turn_off()
 
+    @property
+    def enabled(self) -> bool:
+        return mutable_globals.use_bulb
+
     async def _turn_on(self, brightness: Optional[int] = None, rgb: ColourType = None):
         if not mutable_globals.use_bulb:
             self.logger.debug("not turning on bulb due to global setting")
             return
         if brightness is not None:
-            brightness = self.clamp_brightness(brightness)
+            brightness = self._to_wiz_brightness(self.clamp_brightness(brightness))
         
         if rgb is None:
             builder = PilotBuilder(brightness=brightness)
@@ -95,9 +106,10 @@ class Bulb(WrapperBase):
             self.logger.debug("not turning on bulb due to global setting")
             return
 
+        self.invalidate_commanded()
         scene_id = scenes.get_id_from_scene_name(scene)
         if brightness is not None:
-            brightness = self.clamp_brightness(brightness)
+            brightness = self._to_wiz_brightness(self.clamp_brightness(brightness))
         if speed is not None:
             speed = self.clamp_speed(speed)
         await self.light.turn_on(PilotBuilder(scene=scene_id, brightness=brightness, speed=speed))
@@ -114,33 +126,91 @@ class Bulb(WrapperBase):
         """
         start_brightness = self.clamp_brightness(start_brightness)
         end_brightness = self.clamp_brightness(end_brightness)
-        steps = round(duration / self.TIME_STEP)
-        brightness_iter = get_fractional_range(start_brightness, end_brightness, steps)
-        temp_iter = get_fractional_range(start_temp, end_temp, steps)
-        # assert operator.length_hint(brightness_iter) == operator.length_hint(temp_iter)
-
-        for brightness, temp in zip(brightness_iter, temp_iter):
-            state = await self.updateState()
-            if state is None or self.last_state is None:
-                self.logger.error("couldn't get state during lerp, setting to final values")
-                await self.turn_on(brightness=end_brightness, colortemp=end_temp)
-                return
-            
-            same_brightness = brightness == state.get_brightness() and state.get_brightness() is not None
-            same_rgb = state.get_rgb() == self.last_state.get_rgb() and state.get_rgb() is not None
-            same_temp = state.get_colortemp() == self.last_state.get_colortemp() and state.get_colortemp() is not None
-
-            if not (state.get_state() and same_brightness and (same_rgb or same_temp)):
-                self.logger.info("lerp interrupted due to external change")
-                return
-
-            await self.turn_on(brightness=brightness, colortemp=temp)
-            self.last_state = await self.updateState()
-
-            await asyncio.sleep(self.TIME_STEP)
+        transition = Transition(
+            self, (start_brightness, start_temp), (end_brightness, end_temp), duration, interval=self.TIME_STEP
+        )
+        return await transition.run()
+
+    async def fade(
+        self,
+        brightness: int | None = None,
+        colortemp: int | None = None,
+        duration: float = 0.0,
+        start: tuple[int, int] | None = None,
+        ) -> bool:
+        """`WrapperBase.fade`, with the brightnesses clamped to what the bulb can show like `lerp`,
+        so the levels it reports back stay within the fade's range"""
+        if brightness is not None:
+            brightness = self.clamp_brightness(brightness)
+        if start is not None:
+            start = (self.clamp_brightness(start[0]), start[1])
+        return await super().fade(brightness, colortemp, duration, start)
+
+    async def close(self):
+        self.push_running = False
+        # otherwise the bulb's pushes still reach this instance after it's been replaced
+        push_cancel = getattr(self.light, "push_cancel", None)
+        if push_cancel is not None:
+            push_cancel()
+            self.light.push_cancel = None
+        await self.light.async_close()
+
+    def _on_push(self, states: list[PilotParser | None]):
+        if states and states[0] is not None:
+            self._state = states[0]
+            self._state_time = time.monotonic()
+
+    async def start_push(self) -> bool:
+        """Ask the bulb to send its state whenever it changes, rather than polling it"""
+        self._push_attempted = True
+        if self.light.mac is None:
+            return False
+        try:
+            self.push_running = await self.light.start_push(self._on_push)
+        except OSError as e:
+            self.logger.warning("couldn't start push updates, falling back to polling: %s", e)
+            self.push_running = False
+        return self.push_running
+
+    async def current_levels(self) -> tuple[int, int] | None:
+        state = await self.updateState()
+        if state is None or not state.get_state():
+            return None
+        brightness, colortemp = self._from_wiz_brightness(state.get_brightness()), state.get_colortemp()
+        if brightness is None or colortemp is None:
+            # e.g. showing a colour or a scene, which a colourtemp fade can't start from
+            return None
+        return brightness, colortemp
+
+    def observed_state(self) -> ObservedState | None:
+        if self._state is None:
+            return None
+        brightness = self._from_wiz_brightness(self._state.get_brightness())
+        return ObservedState(bool(self._state.get_state()), brightness, self._state_time)
+
+    @property
+    def _state_is_fresh(self) -> bool:
+        return (
+            self.push_running
+            and self._state is not None
+            and time.monotonic() - self._state_time < self.state_max_age
+        )
 
     async def updateState(self) -> Optional[PilotParser]:
-        return await self.light.updateState()
+        """The bulb's state, from its push updates if they're arriving,
+        otherwise polled from the bulb. Pushes that stop for `state_max_age` seconds
+        also fall back to polling."""
+        if not self._push_attempted:
+            await self.start_push()
+        if self._state_is_fresh:
+            return self._state
+        states = await self.light.updateState()
+        # pywizlight returns a list with a state for each head, and these bulbs only have one
+        state = (states[0] if states else None) if isinstance(states, list) else states
+        if state is not None:
+            self._state = state
+            self._state_time = time.monotonic()
+        return state
     
     async def get_info(self):
         return await self.updateState()
@@ -155,7 +225,7 @@ class Bulb(WrapperBase):
 
     @property
     async def is_on(self) -> bool:
-        state = await self.light.updateState()
+        state = await self.updateState()
         if state is None:
             self.logger.error("couldn't get state in is_on")
             return False
@@ -175,6 +245,17 @@ class Bulb(WrapperBase):
         """Clamp brightness value between 10 and 100."""
         return clamp(value, 10, 100)
 
+    # this class works in percent, like the bulbs themselves, but pywizlight's
+    # PilotBuilder and PilotParser take and give brightness out of 255
+
+    @staticmethod
+    def _to_wiz_brightness(percent: int) -> int:
+        return round(percent * 255 / 100)
+
+    @staticmethod
+    def _from_wiz_brightness(value: int | None) -> int | None:
+        return None if value is None else round(value * 100 / 255)
+
     def clamp_speed(self, value: int) -> int:
         """Clamp speed value between 10 and 200."""
         return clamp(value, 10, 200)
@@ -195,19 +276,3 @@ class Bulb(WrapperBase):
                 "You might get some weird results", temp
             )
         return temp_to_rgbww(temp)
-  
-
-def get_fractional_range(start: int, stop: int, length: int) -> Iterator[int]:
-    # multiply then divide by SCALING_FACTOR to avoid issues with `step` rounding to zero.
-    # it is possible to calculate the ideal SCALING_FACTOR,
-    # but is simpler to just use an arbitrarily large constant
-    start = start * SCALING_FACTOR
-    stop = stop * SCALING_FACTOR
-    span = abs(stop - start)
-    step = round(span / length)
-    assert step > 0
-    iterator = range(start, stop + step, step)
-    assert operator.length_hint(iterator) == length + 1
-    ret = (round(x / SCALING_FACTOR) for x in iterator)
-    # setattr(ret, "__length_hint__", length + 1)
-    return ret
@@ -0,0 +1,137 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import global_vars as gbl
+from extra_types import ColourType, DeviceInfo
+from utils.device_registry import ALL_DEVICES, get_registry
+from utils.get_logger import get_logger
+from utils.misc import mutable_globals
+from wrappers.base import WrapperBase
+from wrappers.bulb_wrapper import Bulb
+from wrappers.pool import pool
+from wrappers.transition import fade_together
+from wrappers.WLED_wrapper import WLED
+
+logger = get_logger(__name__)
+
+# objects.yaml `class` -> wrapper
+DEVICE_CLASSES: dict[str, type[WrapperBase]] = {
+    "wizlight": Bulb,
+    "WLED": WLED,
+}
+
+
+class UnknownGroupError(ValueError):
+    """Raised for a group name that isn't a room or group in `objects.yaml`"""
+    def __init__(self, name: str):
+        super().__init__(f"unknown group '{name}'")
+
+
+class DeviceGroup(WrapperBase):
+    """Sends each command to every device in a room or group from `objects.yaml` at once.
+
+    Every device gets `timeout` seconds to respond, so a slow or unreachable device
+    doesn't hold up the rest, and a command takes about as long as the slowest device that answers.
+    """
+
+    OBJECT_TYPE = "group" # type: ignore[assignment]
+
+    def __init__(self, name: str = ALL_DEVICES, timeout: float = gbl.DEVICE_TIMEOUT):
+        if name not in get_registry().group_names:
+            raise UnknownGroupError(name)
+        self.name = name
+        self.timeout = timeout
+
+    @staticmethod
+    def _enabled(device: DeviceInfo) -> bool:
+        if device.device_class == "WLED":
+            return mutable_globals.use_wled
+        return mutable_globals.use_bulb
+
+    @property
+    def members(self) -> dict[str, WrapperBase]:
+        """Wrappers for the group's enabled devices, by name"""
+        members = {}
+        for device in get_registry().group(self.name):
+            cls = DEVICE_CLASSES.get(device.device_class or "")
+            if cls is None:
+                logger.warning("don't know how to control %s (class %s)", device.name, device.device_class)
+                continue
+            if self._enabled(device):
+                members[device.name] = pool.get(cls, device.name)
+        return members
+
+    async def _on_each(self, command: Callable[[WrapperBase], Awaitable[Any]]) -> dict[str, Any]:
+        """Run `command` on every member concurrently, returning the results of those that
+        finished in time. Failures are logged rather than raised."""
+        members = self.members
+
+        async def run(name: str, device: WrapperBase):
+            try:
+                return await asyncio.wait_for(command(device), self.timeout)
+            except TimeoutError:
+                logger.warning("%s didn't respond within %.1fs", name, self.timeout)
+                device.healthy = False
+                raise
+
+        results = await asyncio.gather(*(run(name, device) for name, device in members.items()), return_exceptions=True)
+        succeeded = {}
+        for name, result in zip(members, results, strict=True):
+            if isinstance(result, BaseException):
+                if not isinstance(result, TimeoutError):
+                    logger.error("command to %s in %s failed: %s", name, self.name, result)
+            else:
+                succeeded[name] = result
+        return succeeded
+
+    async def turn_on(
+        self,
+        brightness: int | None = None,
+        rgb: ColourType = None,
+        colortemp: int | None = None,
+        force: bool = False,
+        ) -> None:
+        # passed on as-is, so each device converts the colortemp in its own way
+        # and can skip it if it's already close enough
+        if colortemp is not None and rgb is not None:
+            raise ValueError("cannot provide both rgb and colortemp")
+        await self._on_each(
+            lambda device: device.actor.turn_on(brightness=brightness, rgb=rgb, colortemp=colortemp, force=force)
+        )
+
+    async def _turn_on(self, brightness: int | None, rgb: ColourType) -> None:
+        await self.turn_on(brightness=brightness, rgb=rgb)
+
+    async def fade(
+        self,
+        brightness: int | None = None,
+        colortemp: int | None = None,
+        duration: float = 0.0,
+        start: tuple[int, int] | None = None,
+        ) -> bool:
+        """Fade every device in step with the others. Returns whether every device finished its fade"""
+        results = await fade_together(self.members.values(), brightness, colortemp, duration, start, self.timeout)
+        return all(results.values())
+
+    async def _turn_off(self) -> None:
+        await self._on_each(lambda device: device.actor.turn_off())
+
+    async def toggle(self) -> None:
+        await self._on_each(lambda device: device.actor.run(device.toggle))
+
+    @property
+    async def is_on(self) -> bool:
+        """Whether every device that answered is on"""
+        results = await self._on_each(lambda device: device.is_on)
+        return bool(results) and all(results.values())
+
+    @property
+    async def is_connected(self) -> bool:
+        """Whether every device is connected"""
+        members = self.members
+        results = await self._on_each(lambda device: device.is_connected)
+        return len(results) == len(members) and all(results.values())
+
+    def __repr__(self) -> str:
+        return f"DeviceGroup({self.name!r})"
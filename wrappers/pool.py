@@ -0,0 +1,116 @@
+import asyncio
+import concurrent.futures
+import threading
+from collections.abc import Coroutine, Iterator
+from typing import Any, TypeVar
+
+from utils.get_logger import get_logger
+from wrappers.base import WrapperBase
+
+WrapperType = TypeVar("WrapperType", bound=WrapperBase)
+
+logger = get_logger(__name__)
+
+
+class DevicePool:
+    """Long-lived wrapper instances, shared by the routines, endpoints and scheduler.
+
+    Each device is built once, so its `requests.Session` or wizlight connection is reused
+    between calls. If a command to a device fails, the instance is closed and replaced
+    the next time it's asked for, so a device that drops off the network and comes back
+    gets a fresh connection. The replacement keeps the old instance's circuit breaker.
+
+    Once `pin` has been given the app's main loop, every device is talked to from there, so
+    requests handled on their own threads all queue up on the same loop and connections.
+
+    ```
+    bulb = pool.get(Bulb)
+    lamp = pool.get(Bulb, "tallha_lamp")
+    ```
+    """
+
+    def __init__(self):
+        self._devices: dict[tuple[type[WrapperBase], str | None], WrapperBase] = {}
+        self._closing: set[asyncio.Task] = set()
+        # requests on their own threads can ask for the same device at once
+        self._lock = threading.Lock()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def pin(self, loop: asyncio.AbstractEventLoop):
+        """Talk to every device, now and later, from `loop`"""
+        self.loop = loop
+        for device in self._devices.values():
+            device.pin(loop)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+        """Run `coro` in the background on the pinned loop, or the current one if there
+        isn't one, so it carries on after the request that started it has returned.
+        Cancelling the returned future cancels it"""
+        loop = self.loop if self.loop is not None and not self.loop.is_closed() else asyncio.get_running_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("background task failed: %s", future.exception())
+
+    def get(self, cls: type[WrapperType], name: str | None = None) -> WrapperType:
+        """The shared instance of `cls` for the device called `name` in `objects.yaml`,
+        or the class's default device if `name` isn't given"""
+        key = (cls, name or cls.DEFAULT_NAME)
+        with self._lock:
+            device = self._devices.get(key)
+            old = None
+            if device is not None and not device.healthy:
+                logger.info("replacing %s after a failed command", device.OBJECT_TYPE)
+                self._close_later(device)
+                old, device = device, None
+            if device is None:
+                device = cls() if name is None else cls.from_yaml(name)
+                if old is not None:
+                    device.inherit(old)
+                if self.loop is not None:
+                    device.pin(self.loop)
+                self._devices[key] = device
+        return device # type: ignore[return-value]
+
+    def discard(self, cls: type[WrapperBase], name: str | None = None):
+        """Drop the instance, so the next `get` builds a new one"""
+        with self._lock:
+            device = self._devices.pop((cls, name or cls.DEFAULT_NAME), None)
+        if device is not None:
+            self._close_later(device)
+
+    def _close_later(self, device: WrapperBase):
+        try:
+            task = asyncio.get_running_loop().create_task(self._close(device))
+        except RuntimeError: # no event loop; the connection is dropped when the instance is collected
+            return
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(device: WrapperBase):
+        try:
+            await device.actor.close()
+            await device.close()
+        except Exception as e: # noqa: BLE001
+            logger.warning("error closing %s: %s", device.OBJECT_TYPE, e)
+
+    async def close(self):
+        """Close every instance. Called on shutdown"""
+        with self._lock:
+            devices = list(self._devices.values())
+            self._devices.clear()
+        await asyncio.gather(*(self._close(device) for device in devices), *self._closing)
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __iter__(self) -> Iterator[WrapperBase]:
+        return iter(list(self._devices.values()))
+
+
+pool = DevicePool()
@@ -0,0 +1,398 @@
+import asyncio
+import math
+import time
+from array import array
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, NamedTuple
+
+import global_vars as gbl
+from utils.get_logger import get_logger
+from utils.misc import clamp
+
+if TYPE_CHECKING:
+    from wrappers.base import WrapperBase
+
+__all__ = ["ObservedState", "Transition", "TransitionClock", "TransitionResult", "fade_together", "get_fractional_range"]
+
+logger = get_logger(__name__)
+
+UINT16_MAX = 0xFFFF
+LATENCY_SMOOTHING = 0.3 # weight of each new measurement of how long a device takes to apply a frame
+
+
+class ObservedState(NamedTuple):
+    """A device's last known state, as reported by the device rather than as commanded"""
+    on: bool
+    brightness: int | None
+    time: float # time.monotonic() when it was observed
+
+
+@dataclass
+class TransitionResult:
+    completed: bool
+    frames_sent: int = 0
+    frames_dropped: int = 0
+    max_lateness: float = 0.0 # seconds
+
+    def __bool__(self) -> bool:
+        return self.completed
+
+
+def get_fractional_range(start: int, stop: int, length: int) -> Iterator[int]:
+    """`length + 1` evenly spaced integers from `start` to `stop`, inclusive.
+    Works for descending and equal endpoints; a length of 0 gives just `stop`"""
+    if length < 0:
+        raise ValueError(f"length must not be negative, got {length}")
+    if length == 0:
+        return iter((stop,))
+    span = stop - start
+    return (start + round(span * i / length) for i in range(length + 1))
+
+
+def _smoothed(latency: float | None, taken: float) -> float:
+    return taken if latency is None else latency + LATENCY_SMOOTHING * (taken - latency)
+
+
+def _whole_levels(levels: tuple[float, float]) -> tuple[int, int]:
+    """(brightness, colourtemp) rounded and clamped to what a transition's "H" arrays can hold,
+    so e.g. a float colourtemp from a JSON request can be faded to"""
+    brightness, colourtemp = (clamp(round(value), 0, UINT16_MAX) for value in levels)
+    return brightness, colourtemp
+
+
+def _interrupted(
+    device: "WrapperBase", since: float, lowest: int | None, highest: int | None, tolerance: int
+    ) -> bool:
+    """Whether `device` has reported, since `since`, being turned off or a brightness
+    outside of `lowest` to `highest`, the range a transition has set"""
+    observed = device.observed_state()
+    if observed is None or observed.time <= since:
+        return False
+    if not observed.on:
+        logger.info("transition on %s interrupted: turned off", device.OBJECT_TYPE)
+        return True
+    if (
+        observed.brightness is not None and lowest is not None and highest is not None
+        and not lowest - tolerance <= observed.brightness <= highest + tolerance
+    ):
+        logger.info("transition on %s interrupted: brightness changed to %d", device.OBJECT_TYPE, observed.brightness)
+        return True
+    return False
+
+
+class Transition:
+    """Fades a device's brightness and colourtemp over `duration` seconds.
+
+    The frames are worked out up front, and each is meant to be showing at a fixed time after
+    the start, so slow responses from the device don't stretch the transition. Each frame is
+    sent early by however long the device has been taking to apply one, and if the device
+    falls more than a frame behind, the frames it missed are dropped rather than sent late.
+    Frames that wouldn't change anything are never sent.
+
+    The transition stops early if the device reports being turned off, or a brightness
+    outside what the transition has set, which means something else has taken over the light.
+    Only states the device already knows about are checked, so this makes no extra requests.
+
+    ```
+    await Transition(bulb, (10, 2000), (100, 4500), duration=300).run()
+    ```
+    """
+
+    def __init__(
+        self,
+        device: "WrapperBase",
+        start: tuple[int, int],
+        end: tuple[int, int],
+        duration: float,
+        interval: float = gbl.TRANSITION_INTERVAL,
+        tolerance: int = gbl.TRANSITION_BRIGHTNESS_TOLERANCE,
+    ):
+        """`start` and `end` are (brightness, colourtemp) pairs"""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.device = device
+        self.start = _whole_levels(start)
+        self.end = _whole_levels(end)
+        self.duration = max(duration, 0.0)
+        self.interval = interval
+        self.tolerance = tolerance
+        self.offsets, self.brightnesses, self.colourtemps = self._schedule()
+
+    def _schedule(self) -> tuple[array, array, array]:
+        steps = round(self.duration / self.interval)
+        brightnesses = get_fractional_range(self.start[0], self.end[0], steps)
+        colourtemps = get_fractional_range(self.start[1], self.end[1], steps)
+        offsets, frame_brightnesses, frame_colourtemps = array("d"), array("H"), array("H")
+        previous = None
+        for i, frame in enumerate(zip(brightnesses, colourtemps, strict=True)):
+            if frame == previous:
+                continue
+            offsets.append(self.duration * i / steps if steps else 0.0)
+            frame_brightnesses.append(frame[0])
+            frame_colourtemps.append(frame[1])
+            previous = frame
+        return offsets, frame_brightnesses, frame_colourtemps
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    async def run(self) -> TransitionResult:
+        loop = asyncio.get_running_loop()
+        result = TransitionResult(completed=False)
+        start = loop.time()
+        first_sent = None
+        latency: float | None = None
+        lowest = highest = self.brightnesses[0]
+        i = 0
+        while i < len(self):
+            now = loop.time()
+            lead = latency or 0.0
+            # skip to the latest frame that'll be due by the time the device has applied it
+            while i + 1 < len(self) and start + self.offsets[i + 1] <= now + lead:
+                i += 1
+                result.frames_dropped += 1
+            deadline = start + self.offsets[i]
+            if deadline - lead > now:
+                await asyncio.sleep(deadline - lead - now)
+
+            if first_sent is not None and _interrupted(self.device, first_sent, lowest, highest, self.tolerance):
+                return result
+
+            brightness = self.brightnesses[i]
+            lowest, highest = min(lowest, brightness), max(highest, brightness)
+            sent = loop.time()
+            # the last frame is always sent, so the fade can't stop within the tolerance of its end
+            last_frame = i == len(self) - 1
+            await self.device.actor.turn_on(brightness=brightness, colortemp=self.colourtemps[i], force=last_frame)
+            finished = loop.time()
+            latency = _smoothed(latency, finished - sent)
+            result.max_lateness = max(result.max_lateness, finished - deadline)
+            if first_sent is None:
+                first_sent = time.monotonic()
+            result.frames_sent += 1
+            i += 1
+
+        result.completed = True
+        if result.frames_dropped:
+            logger.debug(
+                "transition on %s dropped %d of %d frames",
+                self.device.OBJECT_TYPE, result.frames_dropped, len(self)
+            )
+        return result
+
+
+Levels = tuple[int | None, int | None] # (brightness, colourtemp), None to leave as it is
+
+
+@dataclass
+class _Participant:
+    device: "WrapperBase"
+    start: tuple[int, int] | None
+    end: Levels
+    result: TransitionResult = field(default_factory=lambda: TransitionResult(completed=False))
+    done: bool = False
+    latency: float | None = None # smoothed seconds for the device to apply a frame
+    last: Levels | None = None
+    first_sent: float | None = None
+    lowest: int | None = None
+    highest: int | None = None
+
+    def levels(self, progress: float) -> Levels:
+        if self.start is None:
+            return self.end
+        return tuple( # type: ignore[return-value]
+            start if end is None else start + round((end - start) * progress)
+            for start, end in zip(self.start, self.end, strict=True)
+        )
+
+
+class TransitionClock:
+    """Fades several devices on one timeline, so they stay in step with each other.
+
+    Every frame is worked out for all the devices at once and sent to them concurrently.
+    Each device's latency is measured as it goes, and the time between frames is stretched
+    to fit the slowest device, so nothing queues up behind it; if the clock still falls
+    behind, the frames it missed are dropped for everyone. Devices that can fade by
+    themselves are sent their whole fade with the first frame instead.
+
+    A device that's interrupted (see `Transition`) or doesn't respond within `timeout`
+    leaves the clock, and the rest carry on.
+    """
+
+    LATENCY_HEADROOM = 1.25 # frames are spaced this much further apart than the slowest device takes
+
+    def __init__(
+        self,
+        duration: float,
+        interval: float = gbl.TRANSITION_INTERVAL,
+        max_interval: float = gbl.TRANSITION_MAX_INTERVAL,
+        timeout: float = gbl.DEVICE_TIMEOUT,
+        tolerance: int = gbl.TRANSITION_BRIGHTNESS_TOLERANCE,
+    ):
+        if interval <= 0 or max_interval < interval:
+            raise ValueError("interval must be positive and no more than max_interval")
+        self.duration = max(duration, 0.0)
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.interval = interval
+        self.timeout = timeout
+        self.tolerance = tolerance
+        self._participants: list[_Participant] = []
+
+    def add(self, device: "WrapperBase", start: tuple[int, int] | None, end: Levels) -> TransitionResult:
+        """Fade `device` from `start` to `end`, both (brightness, colortemp). Without a `start`,
+        the device goes straight to `end` on the first frame. Returns the device's result,
+        which is filled in by `run()`"""
+        participant = _Participant(device, start, end)
+        self._participants.append(participant)
+        return participant.result
+
+    def latency(self, device: "WrapperBase") -> float | None:
+        """The smoothed time `device` has been taking to apply a frame"""
+        for participant in self._participants:
+            if participant.device is device:
+                return participant.latency
+        raise KeyError(device)
+
+    async def _send_native(self, participant: _Participant, deadline: float):
+        loop = asyncio.get_running_loop()
+        brightness, colortemp = participant.end
+        participant.done = True
+        try:
+            device = participant.device
+            accepted = await asyncio.wait_for(
+                device.actor.run(lambda: device.fade(brightness, colortemp, self.duration, participant.start)),
+                self.timeout,
+            )
+        except TimeoutError:
+            logger.warning("%s didn't start its fade within %.1fs", participant.device.OBJECT_TYPE, self.timeout)
+            participant.device.healthy = False
+            return
+        participant.result.max_lateness = loop.time() - deadline
+        participant.result.frames_sent = 1
+        participant.result.completed = accepted
+
+    async def _send(self, participant: _Participant, progress: float, deadline: float):
+        loop = asyncio.get_running_loop()
+        device = participant.device
+        if participant.first_sent is not None and _interrupted(
+            device, participant.first_sent, participant.lowest, participant.highest, self.tolerance
+        ):
+            participant.done = True
+            return
+        levels = participant.levels(progress)
+        if levels == participant.last:
+            return
+
+        sent = loop.time()
+        try:
+            await asyncio.wait_for(
+                device.actor.turn_on(brightness=levels[0], colortemp=levels[1], force=progress >= 1.0), self.timeout
+            )
+        except TimeoutError:
+            logger.warning("%s didn't respond within %.1fs, leaving the transition", device.OBJECT_TYPE, self.timeout)
+            device.healthy = False
+            participant.done = True
+            return
+        finished = loop.time()
+
+        participant.latency = _smoothed(participant.latency, finished - sent)
+        result = participant.result
+        result.max_lateness = max(result.max_lateness, finished - deadline)
+        result.frames_sent += 1
+        if participant.first_sent is None:
+            participant.first_sent = time.monotonic()
+        if levels[0] is not None:
+            participant.lowest = min(participant.lowest if participant.lowest is not None else levels[0], levels[0])
+            participant.highest = max(participant.highest if participant.highest is not None else levels[0], levels[0])
+        participant.last = levels
+        if participant.start is None:
+            # it's gone straight to the end, so there's nothing left to send
+            participant.result.completed = participant.done = True
+
+    def _adapt(self, active: list[_Participant]):
+        latencies = [p.latency for p in active if p.latency is not None]
+        slowest = max(latencies, default=0.0)
+        self.interval = clamp(slowest * self.LATENCY_HEADROOM, self.min_interval, self.max_interval)
+
+    def _drop_missed(self, deadline: float, now: float) -> float:
+        """Move `deadline` past any frames that are already overdue, counting them as dropped"""
+        if deadline >= now:
+            return deadline
+        missed = math.ceil((now - deadline) / self.interval)
+        for participant in self._participants:
+            if not participant.done:
+                participant.result.frames_dropped += missed
+        return deadline + missed * self.interval
+
+    def _log_results(self):
+        for participant in self._participants:
+            result = participant.result
+            if result.frames_dropped or result.max_lateness > self.interval:
+                logger.debug(
+                    "transition on %s: %d frames sent, %d dropped, up to %.3fs late",
+                    participant.device.OBJECT_TYPE, result.frames_sent, result.frames_dropped, result.max_lateness,
+                )
+
+    async def run(self) -> dict["WrapperBase", TransitionResult]:
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        finish = begin + self.duration
+        deadline = begin
+        first = True
+        while active := [p for p in self._participants if not p.done]:
+            progress = (deadline - begin) / self.duration if self.duration else 1.0
+            await asyncio.gather(*(
+                self._send_native(p, deadline) if first and p.device.NATIVE_FADE else self._send(p, progress, deadline)
+                for p in active
+            ))
+            first = False
+            if deadline >= finish:
+                for participant in self._participants:
+                    if not participant.done:
+                        participant.result.completed = participant.done = True
+                break
+
+            self._adapt([p for p in active if not p.done])
+            now = loop.time()
+            deadline = min(self._drop_missed(deadline + self.interval, now), finish)
+            if deadline > now:
+                await asyncio.sleep(deadline - now)
+
+        self._log_results()
+        return {p.device: p.result for p in self._participants}
+
+
+async def _current_levels(device: "WrapperBase", timeout: float) -> tuple[int, int] | None:
+    try:
+        return await asyncio.wait_for(device.current_levels(), timeout)
+    except Exception as e: # noqa: BLE001
+        logger.warning("couldn't get the levels of %s to fade from: %s", device.OBJECT_TYPE, e)
+        return None
+
+
+async def fade_together(
+    devices: Iterable["WrapperBase"],
+    brightness: int | None = None,
+    colortemp: int | None = None,
+    duration: float = 0.0,
+    start: tuple[int, int] | None = None,
+    timeout: float = gbl.DEVICE_TIMEOUT,
+) -> dict["WrapperBase", bool]:
+    """`WrapperBase.fade` for several devices at once, kept in step by a `TransitionClock`.
+    Returns whether each device's fade ran to the end"""
+    devices = list(devices)
+    starts: list[tuple[int, int] | None] = [start] * len(devices)
+    if start is None:
+        # devices that fade by themselves don't need to know where they're starting from
+        needed = [i for i, device in enumerate(devices) if not device.NATIVE_FADE]
+        levels = await asyncio.gather(*(_current_levels(devices[i], timeout) for i in needed))
+        for i, device_start in zip(needed, levels, strict=True):
+            starts[i] = device_start
+
+    clock = TransitionClock(duration, timeout=timeout)
+    for device, device_start in zip(devices, starts, strict=True):
+        clock.add(device, device_start, (brightness, colortemp))
+    results = await clock.run()
+    return {device: result.completed for device, result in results.items()}